@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Stage-level benchmarks of the S. suis pipeline on synthetic assemblies.
+
+    python benchmarks/run_benchmarks.py --out benchmarks/results/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/baseline.json
+
+Times staging, the assembly DB build, stage 1, stage 2 and the end-to-end
+`process_one` for each sample (plus the BLAST-free k-mer screen and anchor
+resolver), records peak RSS of this process and of its children (BLAST), and
+writes a JSON result. With `--baseline` the run is
+compared against an earlier result, and the exit status is 1 when a step's
+median time grows by more than `--tolerance`.
+"""
+
+import json
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import click
+
+# Run from a checkout without `pip install -e .`: put the repository root on the path.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from swineotype.anchors import anchor_resolver_call
+from swineotype.blast import make_db_if_needed
+from swineotype.config import load_config
+from swineotype.fasta import FastaIndex
+from swineotype.kmer import candidate_alleles
+from swineotype.main import process_one
+from swineotype.stages import plan_stage2, stage1_score, stage2_resolver_call
+from swineotype.utils import stage_assembly
+
+from synthetic import make_collection
+
+STEPS = ["staging", "kmer_screen", "anchor_stage2", "db_build", "stage1", "stage2", "process_one"]
+BLAST_STEPS = {"db_build", "stage1", "stage2", "process_one"}
+SEROTYPES = ["2", "1", "14", "7", "9", "1/2"]
+
+
+def timed(timings: dict, step: str, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    timings.setdefault(step, []).append(time.perf_counter() - t0)
+    return result
+
+
+def peak_rss_kb() -> dict:
+    return {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def bench_sample(asm: dict, work: Path, threads: int, base_config: dict, steps: set, timings: dict) -> dict:
+    """Runs the selected steps on one synthetic assembly, each on a cold scratch directory."""
+    config = dict(base_config, tmp_dir=work / "scratch", keep_debug=0, result_cache=0, clean_temp=0)
+    config["tmp_dir"].mkdir(parents=True)
+    run_dir = work / "run"; run_dir.mkdir()
+    staged, _ = timed(timings, "staging", stage_assembly, asm["path"], config["tmp_dir"])
+    if "kmer_screen" in steps:
+        timed(timings, "kmer_screen", candidate_alleles, staged, config["wzxwzy_fasta"], config)
+    truth_pair = ("1_vs_14" if asm["serotype"] in config["pair_1_14"] else
+                  "2_vs_1_2" if asm["serotype"] in config["pair_2_1_2"] else None)
+    if "anchor_stage2" in steps and truth_pair:
+        with FastaIndex(staged) as reader:
+            timed(timings, "anchor_stage2", anchor_resolver_call, reader, config["resolver_refs_fasta"], config, truth_pair)
+    if "db_build" in steps:
+        timed(timings, "db_build", make_db_if_needed, staged, config["tmp_dir"])
+    if "stage1" in steps or "stage2" in steps:
+        s1 = timed(timings, "stage1", stage1_score, staged, config["wzxwzy_fasta"], threads, run_dir, config)
+        pair, must_stage2 = plan_stage2(s1, config)
+        if "stage2" in steps and pair:
+            timed(timings, "stage2", stage2_resolver_call, staged, config["resolver_refs_fasta"], threads, run_dir,
+                  config, pair)
+    if "process_one" not in steps:
+        return {}
+    cold = dict(config, tmp_dir=work / "scratch_e2e"); cold["tmp_dir"].mkdir()
+    return timed(timings, "process_one", process_one, asm["path"], work / "out", threads, cold)
+
+
+def summarize(timings: dict) -> dict:
+    return {step: {"n": len(ts), "median_s": statistics.median(ts), "mean_s": statistics.fmean(ts),
+                   "min_s": min(ts), "max_s": max(ts), "total_s": sum(ts)}
+            for step, ts in timings.items() if ts}
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Prints current vs baseline medians; returns the steps that regressed."""
+    regressions = []
+    click.echo(f"{'step':<14}{'baseline_s':>12}{'current_s':>12}{'ratio':>8}")
+    for step in STEPS:
+        cur, base = result["steps"].get(step), baseline.get("steps", {}).get(step)
+        if not cur or not base: continue
+        ratio = cur["median_s"] / base["median_s"] if base["median_s"] else float("inf")
+        flag = " REGRESSION" if ratio > 1 + tolerance else ""
+        if flag: regressions.append(step)
+        click.echo(f"{step:<14}{base['median_s']:>12.4f}{cur['median_s']:>12.4f}{ratio:>8.2f}{flag}")
+    for kind in ("self", "children"):
+        base_kb = baseline.get("peak_rss_kb", {}).get(kind)
+        if base_kb:
+            click.echo(f"peak RSS {kind}: {base_kb} kB -> {result['peak_rss_kb'][kind]} kB")
+    return regressions
+
+
+@click.command()
+@click.option("--samples", default=6, show_default=True, help="Synthetic assemblies per repeat.")
+@click.option("--genome-size", default=2_000_000, show_default=True)
+@click.option("--contigs", default=80, show_default=True, help="Contigs per assembly (fragmentation).")
+@click.option("--mutation-rate", default=0.01, show_default=True, help="Substitution rate of embedded alleles.")
+@click.option("--repeats", default=1, show_default=True)
+@click.option("--threads", default=1, show_default=True)
+@click.option("--seed", default=1, show_default=True)
+@click.option("--steps", default=",".join(STEPS), show_default=True, help="Comma-separated subset of steps.")
+@click.option("--config", "config_file", default=None, help="swineotype config YAML to benchmark with.")
+@click.option("--out", "out_path", default="benchmarks/results/latest.json", show_default=True)
+@click.option("--baseline", default=None, help="Earlier result JSON to compare against.")
+@click.option("--tolerance", default=0.25, show_default=True, help="Allowed slowdown of a step's median time.")
+def main(samples, genome_size, contigs, mutation_rate, repeats, threads, seed, steps, config_file, out_path,
+         baseline, tolerance):
+    config = load_config(config_file)
+    steps = {s.strip() for s in steps.split(",") if s.strip()}
+    unknown = steps - set(STEPS)
+    if unknown:
+        raise click.BadParameter(f"unknown steps: {', '.join(sorted(unknown))}", param_hint="--steps")
+    skipped = []
+    if not (shutil.which("blastn") and shutil.which("makeblastdb")):
+        skipped = sorted(steps & BLAST_STEPS); steps -= BLAST_STEPS
+        click.echo(f"[WARN] blastn/makeblastdb not found; skipping: {', '.join(skipped)}")
+
+    timings, typed, correct = {}, 0, 0
+    with tempfile.TemporaryDirectory(prefix="swineotype-bench-") as tmp:
+        tmp = Path(tmp)
+        serotypes = [SEROTYPES[i % len(SEROTYPES)] for i in range(samples)]
+        assemblies = make_collection(tmp / "assemblies", serotypes, config["wzxwzy_fasta"],
+                                     config["resolver_refs_fasta"], seed=seed, genome_size=genome_size,
+                                     n_contigs=contigs, mutation_rate=mutation_rate)
+        for r in range(repeats):
+            for i, asm in enumerate(assemblies):
+                row = bench_sample(asm, tmp / f"work_{r}_{i}", threads, config, steps, timings)
+                if row:
+                    typed += 1; correct += row.get("final_serotype") == asm["serotype"]
+
+    result = {
+        "meta": {"date": datetime.now(timezone.utc).isoformat(timespec="seconds"), "git": git_revision(),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "params": {"samples": samples, "genome_size": genome_size, "contigs": contigs,
+                            "mutation_rate": mutation_rate, "repeats": repeats, "threads": threads, "seed": seed,
+                            "search_mode": config.get("search_mode"), "config": config_file}},
+        "steps": summarize(timings),
+        "peak_rss_kb": peak_rss_kb(),
+        "calls": {"typed": typed, "correct": correct},
+        "skipped": skipped,
+    }
+    out_path = Path(out_path); out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(result, indent=2) + "\n")
+    click.echo(f"[INFO] Wrote {out_path}")
+    for step, s in result["steps"].items():
+        click.echo(f"{step:<14} median {s['median_s']:.4f}s  total {s['total_s']:.2f}s  (n={s['n']})")
+    if typed:
+        click.echo(f"calls correct: {correct}/{typed}")
+
+    if baseline:
+        regressions = compare(result, json.loads(Path(baseline).read_text()), tolerance)
+        if regressions:
+            click.echo(f"[ERROR] Slower than baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Synthetic S. suis-like assemblies for benchmarking.
+
+Each assembly is random sequence with the whitelist alleles of one serotype
+(and, for the 1/14 and 2/(1/2) pairs, the matching resolver gene with the
+diagnostic base set) embedded on a random strand at a given mutation rate.
+The genome is then cut into contigs at random points outside the embedded genes.
+"""
+
+import gzip
+import random
+from pathlib import Path
+
+from swineotype.fasta import read_fasta
+from swineotype.stages import parse_resolver_meta, parse_whitelist_headers
+
+_COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def mutate(seq: str, rate: float, rng: random.Random) -> str:
+    return "".join(rng.choice("ACGT".replace(b, "")) if b in "ACGT" and rng.random() < rate else b for b in seq)
+
+
+def random_dna(n: int, rng: random.Random) -> str:
+    return "".join(rng.choices("ACGT", k=n))
+
+
+def genes_for(serotype: str, whitelist_fa, resolver_fa, rng: random.Random) -> list[tuple[str, str]]:
+    """(label, sequence) of the genes that make an assembly type as `serotype`."""
+    allele_to_type, _ = parse_whitelist_headers(whitelist_fa)
+    whitelist = read_fasta(whitelist_fa)
+    genes = [(a, whitelist[a]) for a, st in allele_to_type.items() if st == serotype and a in whitelist]
+    for ref_id, seq in read_fasta(resolver_fa).items():
+        meta = parse_resolver_meta(ref_id)
+        if not meta.pos or meta.pos > len(seq): continue
+        if serotype == meta.G_serotype:
+            base = "G"
+        elif serotype == meta.CT_serotype:
+            base = rng.choice("CT")
+        else:
+            continue
+        genes.append((ref_id, seq[:meta.pos - 1] + base + seq[meta.pos:]))
+        break
+    return genes
+
+
+def contig_breaks(length: int, protected: list[tuple[int, int]], n: int, rng: random.Random) -> list[int]:
+    """
+    Up to `n` distinct, sorted break points in [500, length - 500), each more
+    than 100 bp from every protected interval. Drawn directly from the allowed
+    positions, so a small genome just gets fewer contigs.
+    """
+    segments, lo = [], 500
+    for s, e in sorted(protected):
+        segments.append((lo, min(s - 100, length - 500)))
+        lo = max(lo, e + 101)
+    segments.append((lo, length - 500))
+    segments = [(a, b) for a, b in segments if b > a]
+    allowed = sum(b - a for a, b in segments)
+    breaks = []
+    for i in sorted(rng.sample(range(allowed), max(0, min(n, allowed)))):
+        for a, b in segments:
+            if i < b - a:
+                breaks.append(a + i); break
+            i -= b - a
+    return breaks
+
+
+def make_assembly(path, serotype: str, whitelist_fa, resolver_fa, genome_size: int = 2_000_000, n_contigs: int = 50,
+                  mutation_rate: float = 0.01, seed: int = 0, line_width: int = 80, gz: bool = False) -> dict:
+    """Writes a synthetic assembly to `path` and returns what was embedded in it."""
+    rng = random.Random(seed)
+    genes = genes_for(serotype, whitelist_fa, resolver_fa, rng)
+    genome, protected, embedded = [], [], []
+    background = max(genome_size - sum(len(s) for _, s in genes), 1000)
+    cuts = sorted(rng.sample(range(1, background), len(genes))) if genes else []
+    pos, prev = 0, 0
+    for (label, seq), cut in zip(genes, cuts):
+        genome.append(random_dna(cut - prev, rng)); pos += cut - prev; prev = cut
+        seq = mutate(seq, mutation_rate, rng)
+        strand = rng.choice("+-")
+        genome.append(seq if strand == "+" else seq.translate(_COMPLEMENT)[::-1])
+        protected.append((pos, pos + len(seq))); embedded.append({"gene": label, "strand": strand})
+        pos += len(seq)
+    genome.append(random_dna(background - prev, rng))
+    genome = "".join(genome)
+
+    breaks = contig_breaks(len(genome), protected, min(n_contigs - 1, len(genome) // 1000), rng)
+    bounds = [0, *breaks, len(genome)]
+
+    opener = gzip.open if gz else open
+    with opener(path, "wt") as out:
+        for i, (s, e) in enumerate(zip(bounds, bounds[1:]), 1):
+            out.write(f">contig{i}\n")
+            for j in range(s, e, line_width):
+                out.write(genome[j:min(j + line_width, e)] + "\n")
+    return {"path": str(path), "serotype": serotype, "genome_size": len(genome), "n_contigs": len(bounds) - 1,
+            "genes": embedded}
+
+
+def make_collection(out_dir, serotypes: list[str], whitelist_fa, resolver_fa, seed: int = 0, **kwargs) -> list[dict]:
+    """One synthetic assembly per entry of `serotypes`, named `synthetic_<i>.fasta`."""
+    out_dir = Path(out_dir); out_dir.mkdir(parents=True, exist_ok=True)
+    return [make_assembly(out_dir / f"synthetic_{i:04d}.fasta", st, whitelist_fa, resolver_fa, seed=seed + i, **kwargs)
+            for i, st in enumerate(serotypes)]
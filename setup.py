@@ -12,6 +12,8 @@ setup(
     entry_points={
         'console_scripts': [
             'swineotype = swineotype.main:main',
+            'swineotype-serve = swineotype.server:main',
+            'swineotype-merge = swineotype.shards:merge',
         ],
     },
     data_files=[('share/swineotype/data', data_files)]
@@ -6,8 +6,6 @@ from pathlib import Path
 from glob import glob
 from typing import Optional, List
 
-import pandas as pd
-import yaml
 import click
 
 def log(msg: str):
@@ -17,9 +15,13 @@ def err(msg: str):
     click.echo(f"[ERROR] {msg}", file=sys.stderr)
 
 
-def run_app_analysis(assembly: List[str], out_dir: str, threads: int, swineotype_summary: Optional[str]):
+def run_app_analysis(assembly: List[str], out_dir: str, threads: int, swineotype_summary: Optional[str],
+                     engine: str = "snakemake"):
 
-    """Adapter for APP serovar detection + merge with swineotype"""
+    """
+    Adapter for APP serovar detection + merge with swineotype.
+    engine="kma" runs KMA directly (see app_kma); "snakemake" runs the serovar_detector workflow.
+    """
     outdir = Path(out_dir).resolve()
     app_dir = outdir / "app_detector"
     results_dir = app_dir / "results"
@@ -42,14 +44,6 @@ def run_app_analysis(assembly: List[str], out_dir: str, threads: int, swineotype
         sys.exit(1)
     log(f"Found {len(assemblies)} assemblies")
 
-    # Write sample_sheet.csv for Snakemake/peppy
-    sample_sheet_csv = schemas_dir / "sample_sheet.csv"
-    with open(sample_sheet_csv, "w") as fh:
-        fh.write("sample_name,type\n")
-        for fa in assemblies:
-            fh.write(f"{fa.stem},Assembly\n")
-    log(f"Wrote samples table with {len(assemblies)} assemblies → {sample_sheet_csv}")
-
 
     # KMA DB prefix (must exist): .../third_party/serovar_detector/db/Actinobacillus_pleuropneumoniae.*
     third_party = Path(__file__).parent.parent.parent / "third_party" / "serovar_detector"
@@ -70,6 +64,48 @@ def run_app_analysis(assembly: List[str], out_dir: str, threads: int, swineotype
         err(f"Missing serovar profiles YAML: {serovar_profiles}")
         sys.exit(1)
 
+    if engine == "kma":
+        from shutil import which
+        from swineotype.adapters.app_kma import run_kma_engine
+        if which("kma") is None:
+            err("Required tool not found in PATH: kma")
+            sys.exit(1)
+        log(f"Running KMA on {len(assemblies)} assemblies with {threads} workers")
+        try:
+            run_kma_engine(assemblies, results_dir, tmp_dir, db_prefix, serovar_profiles, int(threads), threshold=98.0)
+        except subprocess.CalledProcessError as exc:
+            err(f"KMA failed on {exc.cmd[2]}: {(exc.stderr or '').strip()}")
+            sys.exit(1)
+        except ValueError as exc:  # unreadable serovar profiles
+            err(str(exc))
+            sys.exit(1)
+    else:
+        run_snakemake_workflow(assemblies, third_party, app_dir, results_dir, tmp_dir, config_dir, logs_dir,
+                               schemas_dir, db_prefix, serovar_profiles, threads)
+
+    # APP results
+    app_results = results_dir / "serovar.tsv"
+    if not app_results.exists():
+        err(f"APP serovar results not found: {app_results}")
+        sys.exit(1)
+
+    # Optional merge with swineotype summary
+    # Optional merge with swineotype summary or just output to CSV
+    if swineotype_summary:
+        merge_app_results(app_results, swineotype_summary)
+
+
+def run_snakemake_workflow(assemblies, third_party, app_dir, results_dir, tmp_dir, config_dir, logs_dir, schemas_dir,
+                           db_prefix, serovar_profiles, threads):
+    import yaml
+    # Write sample_sheet.csv for Snakemake/peppy
+    sample_sheet_csv = schemas_dir / "sample_sheet.csv"
+    with open(sample_sheet_csv, "w") as fh:
+        fh.write("sample_name,type\n")
+        for fa in assemblies:
+            fh.write(f"{fa.stem},Assembly\n")
+    log(f"Wrote samples table with {len(assemblies)} assemblies → {sample_sheet_csv}")
+
     # Copy serovar_profiles to config_dir for the R script
     import shutil
     shutil.copy(serovar_profiles, config_dir / "serovar_profiles.yaml")
@@ -137,50 +173,46 @@ def run_app_analysis(assembly: List[str], out_dir: str, threads: int, swineotype
         err("SerovarDetector failed.")
         sys.exit(ret.returncode)
 
-    # APP results
-    app_results = results_dir / "serovar.tsv"
-    if not app_results.exists():
-        err(f"APP serovar results not found: {app_results}")
-        sys.exit(1)
 
-    # Optional merge with swineotype summary
-    # Optional merge with swineotype summary or just output to CSV
-    if swineotype_summary:
-        swineo = Path(swineotype_summary).resolve()
-        
-        app_df = pd.read_csv(app_results, sep="\t")
-        app_clean = app_df.rename(
-            columns={"Sample": "sample", "Suggested_serovar": "app_serovar"}
-        )[["sample", "app_serovar"]]
-
-        if swineo.exists():
-            log(f"Merging APP results with existing summary → {swineo}")
-            # Try TSV then CSV automatically
-            try:
-                suis_df = pd.read_csv(swineo, sep="\t")
-            except Exception:
-                suis_df = pd.read_csv(swineo)
-
-            merged = suis_df.merge(app_clean, on="sample", how="outer")
-            merged.to_csv(swineo, index=False)
-            log(f"[SUCCESS] Updated summary written → {swineo}")
-        else:
-            log(f"Writing APP results to new summary → {swineo}")
-            app_clean.to_csv(swineo, index=False)
-            log(f"[SUCCESS] Summary written → {swineo}")
+def merge_app_results(app_results: Path, swineotype_summary: str):
+    import pandas as pd  # imported here so the S. suis path and --help do not pay for pandas
+    swineo = Path(swineotype_summary).resolve()
+    
+    app_df = pd.read_csv(app_results, sep="\t")
+    app_clean = app_df.rename(
+        columns={"Sample": "sample", "Suggested_serovar": "app_serovar"}
+    )[["sample", "app_serovar"]]
+
+    if swineo.exists():
+        log(f"Merging APP results with existing summary → {swineo}")
+        # Try TSV then CSV automatically
+        try:
+            suis_df = pd.read_csv(swineo, sep="\t")
+        except Exception:
+            suis_df = pd.read_csv(swineo)
+
+        merged = suis_df.merge(app_clean, on="sample", how="outer")
+        merged.to_csv(swineo, index=False)
+        log(f"[SUCCESS] Updated summary written → {swineo}")
+    else:
+        log(f"Writing APP results to new summary → {swineo}")
+        app_clean.to_csv(swineo, index=False)
+        log(f"[SUCCESS] Summary written → {swineo}")
 
 @click.command()
 @click.option("--assembly", multiple=True, required=True, help="Path to one or more assembly files or glob patterns.")
 @click.option("--out_dir", required=True, help="Output directory base")
 @click.option("--threads", type=int, default=4, help="Threads for Snakemake/KMA")
 @click.option("--swineotype_summary", help="Path to swineotype summary TSV/CSV to merge with APP results")
-def main(assembly, out_dir, threads, swineotype_summary):
+@click.option("--engine", default="snakemake", type=click.Choice(["kma", "snakemake"]), help="Run KMA directly, or the serovar_detector Snakemake workflow")
+def main(assembly, out_dir, threads, swineotype_summary, engine):
     """Adapter for APP serovar detection + merge with swineotype"""
     run_app_analysis(
         assembly=list(assembly),
         out_dir=out_dir,
         threads=threads,
-        swineotype_summary=swineotype_summary
+        swineotype_summary=swineotype_summary,
+        engine=engine,
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+"""
+Native APP serovar engine: runs KMA directly and applies the serovar profiles in Python.
+
+This replaces the Snakemake/conda round-trip of the serovar_detector workflow
+for the common case. Each assembly is mapped against the serovar_detector KMA
+DB by a worker pool. A capsule gene counts as present when its template
+reaches `threshold` % identity and coverage. A serovar matches when all of its
+profile's genes are present and none of its excluded genes are. When several
+match, a profile whose genes are all part of another match is dropped (e.g. a
+profile [a] when [a, b] also matches); the remaining serovars are reported
+joined with "/", since the panel cannot tell them apart. Samples matching no
+profile get "NT". The Snakemake workflow stays the default `app_engine`.
+"""
+
+import csv
+import hashlib
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from swineotype.utils import temp_path
+
+SEROVAR_COLUMNS = ["Sample", "Suggested_serovar", "Genes"]
+NON_TYPEABLE = "NT"
+_PROFILE_KEYS = {"genes", "absent"}
+
+
+def kma_cmd(assembly, out_prefix, db_prefix, threads: int = 1) -> list[str]:
+    # -nf/-na/-nc: only the .res summary is used, so skip the fragment, alignment and consensus files
+    return ["kma", "-i", str(assembly), "-o", str(out_prefix), "-t_db", str(db_prefix), "-t", str(threads),
+            "-nf", "-na", "-nc"]
+
+
+def parse_kma_res(path) -> list[dict]:
+    """Rows of a KMA .res file with the template name and its identity and coverage as floats."""
+    hits = []
+    with open(path, "r") as fh:
+        for row in csv.DictReader(fh, delimiter="\t"):
+            template = (row.get("#Template") or row.get("Template") or "").strip()
+            if not template: continue
+            hits.append({"template": template, "identity": float(row.get("Template_Identity") or 0),
+                         "coverage": float(row.get("Template_Coverage") or 0)})
+    return hits
+
+
+def _as_genes(value) -> set[str]:
+    if value is None: return set()
+    if isinstance(value, str): return {g.strip() for g in value.replace(";", ",").split(",") if g.strip()}
+    if not isinstance(value, list) or not all(isinstance(g, (str, int)) for g in value):
+        raise ValueError(f"expected a list of gene names, got {value!r}")
+    return {str(g) for g in value}
+
+
+def load_profiles(path) -> dict[str, dict]:
+    """
+    {serovar: {"genes": set, "absent": set}} from serovar_profiles.yaml, whose
+    entries are `serovar: [genes]` or `serovar: {genes: [...], absent: [...]}`.
+    Raises ValueError for any other layout, or if no profile has genes.
+    """
+    import yaml
+    with open(path, "r") as fh:
+        data = yaml.safe_load(fh) or {}
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a mapping of serovar to genes, got {type(data).__name__}")
+    profiles = {}
+    for serovar, spec in data.items():
+        try:
+            if isinstance(spec, dict):
+                if set(spec) - _PROFILE_KEYS:
+                    raise ValueError(f"unknown keys {', '.join(map(str, set(spec) - _PROFILE_KEYS))}")
+                genes, absent = _as_genes(spec.get("genes")), _as_genes(spec.get("absent"))
+            else:
+                genes, absent = _as_genes(spec), set()
+        except ValueError as exc:
+            raise ValueError(f"{path}: serovar {serovar!r}: {exc}") from None
+        if genes: profiles[str(serovar)] = {"genes": genes, "absent": absent}
+    if not profiles:
+        raise ValueError(f"{path}: no serovar profiles with genes")
+    return profiles
+
+
+def gene_of(template: str, genes: set[str]) -> str|None:
+    """The profile gene a KMA template stands for: an exact name, or a name followed by `_`, `|`, `-` or a space."""
+    if template in genes: return template
+    for sep in ("_", "|", "-", " "):
+        head = template.split(sep, 1)[0]
+        if head in genes: return head
+    return None
+
+
+def call_serovar(present: set[str], profiles: dict[str, dict]) -> str:
+    matches = [s for s, p in profiles.items() if p["genes"] <= present and not (p["absent"] & present)]
+    if not matches: return NON_TYPEABLE
+    kept = [s for s in matches if not any(profiles[s]["genes"] < profiles[o]["genes"] for o in matches)]
+    return "/".join(sorted(kept))
+
+
+def type_assembly(assembly: Path, work_dir: Path, db_prefix, profiles: dict, threshold: float) -> dict:
+    # Same-named assemblies from different folders must not share KMA output.
+    tag = hashlib.sha1(str(assembly.resolve()).encode()).hexdigest()[:12]
+    out_prefix = work_dir / f"{tag}-{assembly.stem}"
+    subprocess.run(kma_cmd(assembly, out_prefix, db_prefix), check=True, capture_output=True, text=True)
+    all_genes = set().union(*(p["genes"] | p["absent"] for p in profiles.values()))
+    present = set()
+    for hit in parse_kma_res(f"{out_prefix}.res"):
+        gene = gene_of(hit["template"], all_genes)
+        if gene and hit["identity"] >= threshold and hit["coverage"] >= threshold:
+            present.add(gene)
+    return {"Sample": assembly.stem, "Suggested_serovar": call_serovar(present, profiles),
+            "Genes": ";".join(sorted(present))}
+
+
+def run_kma_engine(assemblies: list[Path], results_dir: Path, tmp_dir: Path, db_prefix, profiles_path,
+                   threads: int, threshold: float = 98.0) -> Path:
+    """Types every assembly with KMA, `threads` at a time, and writes `results_dir/serovar.tsv` in input order."""
+    profiles = load_profiles(profiles_path)
+    work_dir = Path(tmp_dir) / "kma"; work_dir.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        rows = list(pool.map(lambda a: type_assembly(Path(a), work_dir, db_prefix, profiles, threshold), assemblies))
+    out = Path(results_dir) / "serovar.tsv"
+    tmp = temp_path(out)
+    try:
+        with open(tmp, "w", newline="") as fh:
+            writer = csv.DictWriter(fh, fieldnames=SEROVAR_COLUMNS, delimiter="\t")
+            writer.writeheader(); writer.writerows(rows)
+        os.replace(tmp, out)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return out
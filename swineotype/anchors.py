@@ -0,0 +1,124 @@
+"""
+Alignment-free stage-2 resolver.
+
+For each resolver reference, the bases either side of the diagnostic site
+(`pos=` in its header) are used as anchors. They are searched for on both
+strands of the assembly. The base between the anchors is read when exactly one
+site in the assembly matches: one flank must match exactly and the other with
+at most `anchor_max_mismatches` substitutions. The whole reference, laid over
+the contig at that site without gaps, must also pass the `min_res_pid` and
+`min_res_alen` filters that BLAST hits get. Otherwise the caller falls back to
+the BLAST resolver.
+"""
+
+from typing import NamedTuple
+
+from swineotype.fasta import FastaIndex, read_fasta
+from swineotype.stages import parse_resolver_meta, reverse_complement
+from swineotype.utils import file_digest
+
+_COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+# {(resolver FASTA digest, flank): [Anchor, ...]}
+_ANCHORS = {}
+
+
+class Anchor(NamedTuple):
+    """The flanks of a resolver reference's diagnostic site, and the reference itself."""
+    ref_id: str
+    pair: str
+    left: str
+    right: str
+    ref: str
+    pos: int
+
+
+def revcomp(seq: str) -> str:
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+def resolver_anchors(resolver_refs_fa, flank: int) -> list[Anchor]:
+    """The anchors of each resolver reference, in file order."""
+    key = (file_digest(resolver_refs_fa), flank)
+    if key not in _ANCHORS:
+        anchors = []
+        for ref_id, seq in read_fasta(resolver_refs_fa).items():
+            meta = parse_resolver_meta(ref_id)
+            pos, seq = meta.pos, seq.upper()
+            if not pos or pos > len(seq): continue
+            anchors.append(Anchor(ref_id, meta.pair, seq[max(0, pos - 1 - flank):pos - 1], seq[pos:pos + flank], seq, pos))
+        _ANCHORS[key] = anchors
+    return _ANCHORS[key]
+
+
+def _mismatches(a: str, b: str, limit: int) -> int|None:
+    if len(a) != len(b): return None
+    mm = sum(x != y for x, y in zip(a, b))
+    return mm if mm <= limit else None
+
+
+def find_sites(seq: str, left: str, right: str, max_mm: int) -> dict[int, int]:
+    """{0-based offset of the base between `left` and `right`: mismatches} for every anchored site in `seq`."""
+    sites = {}
+    i = seq.find(left) if left else -1
+    while i != -1:
+        site = i + len(left)
+        mm = _mismatches(seq[site + 1:site + 1 + len(right)], right, max_mm)
+        if mm is not None and site < len(seq): sites[site] = min(mm, sites.get(site, mm))
+        i = seq.find(left, i + 1)
+    i = seq.find(right) if right else -1
+    while i != -1:
+        site = i - 1
+        if site - len(left) >= 0:
+            mm = _mismatches(seq[site - len(left):site], left, max_mm)
+            if mm is not None: sites[site] = min(mm, sites.get(site, mm))
+        i = seq.find(right, i + 1)
+    return sites
+
+
+def region_identity(seq: str, site: int, strand: str, ref: str, pos: int) -> tuple[float, int]:
+    """
+    Ungapped identity (%) and length of `ref` laid over `seq` so that its
+    1-based position `pos` falls on the 0-based offset `site` (reverse
+    complemented for the "-" strand), clipped to the ends of `seq`.
+    """
+    if strand == "-":
+        ref, pos = revcomp(ref), len(ref) - pos + 1
+    start = site - (pos - 1)
+    lo, hi = max(0, start), min(len(seq), start + len(ref))
+    if hi <= lo: return 0.0, 0
+    matches = sum(a == b for a, b in zip(seq[lo:hi], ref[lo - start:hi - start]))
+    return 100.0 * matches / (hi - lo), hi - lo
+
+
+def anchor_resolver_call(reader: FastaIndex, resolver_refs_fa, config: dict, allowed_pair: str|None=None) -> dict|None:
+    """
+    Stage-2 evidence read at the anchored diagnostic site, in the same form as
+    `stages.stage2_resolver_call`, or None when the anchors are missing, hit
+    more than one site, or the reference around the site fails `min_res_pid`
+    or `min_res_alen`.
+    """
+    flank, max_mm = config.get("anchor_flank", 31), config.get("anchor_max_mismatches", 2)
+    anchors = [a for a in resolver_anchors(resolver_refs_fa, flank) if not allowed_pair or a.pair == allowed_pair]
+    if not anchors: return None
+    hits = []
+    for contig in reader.names():
+        seq = reader.sequence(contig).upper()
+        for order, a in enumerate(anchors):
+            for site, mm in find_sites(seq, a.left, a.right, max_mm).items():
+                hits.append((mm, order, contig, site + 1, "+"))
+            for site, mm in find_sites(seq, revcomp(a.right), revcomp(a.left), max_mm).items():
+                hits.append((mm, order, contig, site + 1, "-"))
+    if len({(h[2], h[3]) for h in hits}) != 1:
+        return None
+    _, order, contig, pos, strand = min(hits)
+    a = anchors[order]
+    pident, length = region_identity(reader.sequence(contig).upper(), pos - 1, strand, a.ref, a.pos)
+    if pident < config["min_res_pid"] or length < config["min_res_alen"]:
+        return None  # a diverged locus BLAST would reject; let the BLAST route decide
+    base = reader.base(contig, pos)
+    if strand == "-":
+        base = reverse_complement(base)
+    return {"ref_id":a.ref_id,"contig":contig,"contig_pos":pos,"strand":strand,
+            "pident":round(pident, 2),"length":length,"bitscore":"",
+            "pair":a.pair,"base":base,"method":"anchor"}
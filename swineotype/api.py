@@ -0,0 +1,73 @@
+"""
+Library interface for embedding swineotype in Python pipelines.
+
+    from swineotype.api import SerotypeRunner
+    from swineotype.config import load_config
+
+    runner = SerotypeRunner(load_config(), out_dir="results/")
+    row = runner.type_one("sample1.fasta")
+    for row in runner.type_many(paths, jobs=4):
+        ...
+
+Rows are the records `process_one` returns (the summary CSV columns).
+Errors are raised, never turned into process exits: a missing BLAST tool is
+a `ToolNotFoundError`, and a failing sample raises its exception.
+"""
+
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from swineotype.config import load_config
+from swineotype.main import process_one
+from swineotype.references import load_references
+from swineotype.stages import prepare_reference_dbs
+from swineotype.utils import ToolNotFoundError, ensure_tool
+
+__all__ = ["SerotypeRunner", "ToolNotFoundError"]
+
+
+class SerotypeRunner:
+    """
+    Types S. suis assemblies with one config. The tool check, reference DBs and
+    compiled references are set up once, on construction.
+    """
+
+    def __init__(self, config: dict|None = None, out_dir="swineotype_out", threads: int = 1):
+        self.config = load_config() if config is None else config
+        self.out_dir, self.threads = Path(out_dir).resolve(), threads
+        for tool in ("blastn", "makeblastdb"): ensure_tool(tool)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        prepare_reference_dbs(self.config)
+        self.references = load_references(self.config)
+
+    def type_one(self, assembly) -> dict:
+        return process_one(str(assembly), self.out_dir, self.threads, self.config)
+
+    def type_many(self, assemblies: Iterable, jobs: int = 1) -> Iterator[dict]:
+        """
+        Yields a row per assembly as soon as it is typed, so with jobs > 1 the
+        order is completion order; use the `sample` field to match rows to
+        inputs. `assemblies` is consumed lazily, with at most 2 * jobs samples
+        in flight. Jobs run in threads, since the work is done by BLAST
+        subprocesses; inputs with the same sample name are typed one at a
+        time, as they share scratch files and a run dir. The first failing sample's exception is raised, and
+        samples not yet started are dropped.
+        """
+        if jobs <= 1:
+            for asm in assemblies:
+                yield self.type_one(asm)
+            return
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        todo, running = iter(assemblies), set()
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            try:
+                while True:
+                    for asm in todo:
+                        running.add(pool.submit(self.type_one, asm))
+                        if len(running) >= 2 * jobs: break
+                    if not running: return
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        yield fut.result()
+            finally:
+                for fut in running: fut.cancel()
@@ -0,0 +1,130 @@
+"""
+Assemblies inside tar and zip archives.
+
+`--assembly` accepts archives (.tar, .tar.gz/.tgz, .tar.bz2, .tar.xz, .zip) and
+`-` for a tar stream on stdin. FASTA members are extracted one at a time, only
+when the run asks for its next assembly, into `<tmp_dir>/archive`; `release`
+removes a member once its sample is typed, so scratch holds no more members
+than there are samples in flight. Tar archives are read as a stream and never
+seeked, so compressed bundles and pipes work alike. The sample name is the
+member's path inside the archive with "/" replaced by "__" and without its
+extension (`S1/contigs.fasta` is sample `S1__contigs`), so same-named files
+in different folders stay apart.
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Iterator
+
+from swineotype.utils import sample_name, temp_path
+
+STDIN = "-"
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip")
+FASTA_SUFFIXES = (".fa", ".fasta", ".fna", ".fas", ".fsa", ".ffn")
+
+# Members extracted by this process and not yet released.
+_EXTRACTED = set()
+
+
+def is_archive(path: str) -> bool:
+    return path == STDIN or str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def is_fasta_member(name: str) -> bool:
+    base = os.path.basename(name).lower()
+    if base.startswith("."): return False  # hidden files and macOS "._" resource forks
+    if base.endswith(".gz"): base = base[:-3]
+    return base.endswith(FASTA_SUFFIXES)
+
+
+def member_file_name(member: str) -> str:
+    """The member's path flattened into one file name, e.g. `S1__contigs.fasta` for `S1/contigs.fasta`."""
+    return "__".join(p for p in member.replace("\\", "/").split("/") if p not in ("", ".", ".."))
+
+
+def member_sample_name(member: str) -> str:
+    """Sample name of an archive member (see the module docstring)."""
+    return sample_name(member_file_name(member))
+
+
+def _extract(fh, archive: str, member: str, root: Path) -> str:
+    """Copies one member to `root/<tag>/<flattened path>`; the tag keeps members of different archives apart."""
+    source = f"stdin-{os.getpid()}" if archive == STDIN else os.path.abspath(archive)
+    tag = hashlib.sha1(f"{source}\0{member}".encode()).hexdigest()[:12]
+    dest = root / tag / member_file_name(member)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = temp_path(dest)
+    try:
+        with open(tmp, "wb") as out:
+            shutil.copyfileobj(fh, out, 1 << 20)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    _EXTRACTED.add(str(dest))
+    return str(dest)
+
+
+def iter_members(archive: str, tmp_dir, keep=None) -> Iterator[str]:
+    """
+    Extracts the FASTA members of an archive lazily, yielding the path of each
+    as it is written. Members whose name fails `keep` are skipped unread.
+    """
+    root = Path(tmp_dir) / "archive"
+    if str(archive).lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not is_fasta_member(info.filename): continue
+                if keep and not keep(info.filename): continue
+                with zf.open(info) as fh:
+                    path = _extract(fh, archive, info.filename, root)
+                yield path
+        return
+    fileobj = sys.stdin.buffer if archive == STDIN else None
+    with tarfile.open(None if fileobj else archive, mode="r|*", fileobj=fileobj) as tf:
+        for member in tf:
+            if not member.isfile() or not is_fasta_member(member.name): continue
+            if keep and not keep(member.name): continue
+            path = _extract(tf.extractfile(member), archive, member.name, root)
+            yield path
+
+
+def list_members(archive: str) -> list[str]:
+    """Names of the FASTA members of an archive file, without extracting them."""
+    if str(archive).lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            return [i.filename for i in zf.infolist() if not i.is_dir() and is_fasta_member(i.filename)]
+    with tarfile.open(archive, mode="r|*") as tf:
+        return [m.name for m in tf if m.isfile() and is_fasta_member(m.name)]
+
+
+def expand_archives(paths: list[str], tmp_dir, keep=None) -> Iterator[str]:
+    """`paths` with every archive replaced by its extracted FASTA members (those passing `keep`), produced on demand."""
+    for path in paths:
+        if is_archive(path): yield from iter_members(path, tmp_dir, keep)
+        else: yield path
+
+
+def is_extracted(path: str) -> bool:
+    """True for a member this process extracted and has not yet released."""
+    return str(path) in _EXTRACTED
+
+
+def release(path: str):
+    """Removes an extracted member and its .fai once its sample is done; other paths are left alone."""
+    if path not in _EXTRACTED: return
+    _EXTRACTED.discard(path)
+    Path(path).unlink(missing_ok=True)
+    Path(f"{path}.fai").unlink(missing_ok=True)
+    try:
+        Path(path).parent.rmdir()
+    except OSError:
+        pass
+
+
+def release_all():
+    for path in list(_EXTRACTED): release(path)
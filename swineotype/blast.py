@@ -1,30 +1,278 @@
+import gzip
+import os
 import shlex
+import shutil
 import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import NamedTuple
+
+from swineotype.profiling import step
+from swineotype.utils import file_digest
 
 def run(cmd, check=True, capture=True, cwd=None, text=True):
     if isinstance(cmd, str):
         cmd = shlex.split(cmd)
-    res = subprocess.run(cmd, check=check, capture_output=capture, cwd=cwd, text=text)
+    with step(Path(cmd[0]).name):
+        res = subprocess.run(cmd, check=check, capture_output=capture, cwd=cwd, text=text)
     return res.stdout
 
-def make_db_if_needed(asm_fa: str, tmpdir: Path) -> str:
-    prefix = tmpdir / ("asmdb_" + Path(asm_fa).stem)
-    nin = prefix.with_suffix(".nin")
-    ndb = prefix.with_suffix(".ndb")
-    if not (nin.exists() or ndb.exists()):
-        run(["makeblastdb", "-in", asm_fa, "-dbtype", "nucl", "-out", str(prefix)])
+def _build_db_atomically(fasta: str, entry: Path, name: str) -> str:
+    """
+    Builds `<entry>/<name>` with makeblastdb unless it already exists.
+
+    The DB is written to a private directory next to `entry` and renamed into
+    place, so concurrent workers never see (or clobber) a half-built DB; if
+    another worker wins the race its copy is used and ours is discarded.
+    """
+    prefix = entry / name
+    if entry.is_dir():
+        os.utime(entry)  # mark as recently used for LRU eviction
+        return str(prefix)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    build = Path(tempfile.mkdtemp(prefix=f".build-{entry.name}-", dir=entry.parent))
+    try:
+        run(["makeblastdb", "-in", str(fasta), "-dbtype", "nucl", "-out", str(build / name)])
+        try:
+            os.rename(build, entry)
+        except OSError:
+            if not entry.is_dir(): raise
+    finally:
+        shutil.rmtree(build, ignore_errors=True)
     return str(prefix)
 
-def run_blast(query_fa: str, db_prefix: str, threads: int, outfmt_cols: str, max_target_seqs=50) -> str:
-    cmd = [
+def db_cache_entry(asm_fa: str, tmpdir: Path) -> Path:
+    """Cache directory holding the BLAST DB of an assembly, keyed by content hash."""
+    return Path(tmpdir) / "db_cache" / file_digest(asm_fa)
+
+def make_db_if_needed(asm_fa: str, tmpdir: Path, max_bytes: int = 0, pinned=()) -> str:
+    """
+    Returns the prefix of a BLAST DB over `asm_fa`, building it if needed.
+
+    DBs are cached under `<tmpdir>/db_cache/<sha256 of the assembly>`, so files
+    with the same name but different content never share a DB. When
+    `max_bytes` is set, least recently used DBs are evicted to keep the cache
+    within that budget, except those in `pinned` (see `evict_lru`).
+    """
+    entry = db_cache_entry(asm_fa, tmpdir)
+    prefix = _build_db_atomically(asm_fa, entry, "asmdb")
+    if max_bytes:
+        evict_lru(entry.parent, max_bytes, keep=entry, pinned=pinned)
+    return prefix
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+def evict_lru(cache_dir: Path, max_bytes: int, keep: Path|None = None, grace: float = 60.0, pinned=()):
+    """
+    Removes least recently used cache entries until the cache fits in `max_bytes`.
+
+    Entries used within the last `grace` seconds, entries a worker holds (see
+    `hold_db`) and entries in `pinned` (a container, e.g. the DBs built ahead
+    for samples still queued) are never evicted. Leftover build directories of crashed
+    workers and lock files of entries that were never built are removed once
+    they are an hour old.
+    """
+    now = time.time()
+    entries = []
+    for entry in Path(cache_dir).iterdir():
+        mtime = entry.stat().st_mtime
+        if not entry.is_dir():
+            if entry.suffix == ".lock" and now - mtime > 3600 and not entry.with_suffix("").exists():
+                _remove_unused(entry.with_suffix(""))
+            continue
+        if entry.name.startswith("."):
+            if now - mtime > 3600: shutil.rmtree(entry, ignore_errors=True)
+            continue
+        entries.append((mtime, entry, _dir_size(entry)))
+    total = sum(size for _, _, size in entries)
+    for mtime, entry, size in sorted(entries, key=lambda e: e[0]):
+        if total <= max_bytes: break
+        if entry == keep or entry in pinned or now - mtime < grace: continue
+        if _remove_unused(entry): total -= size
+
+def _lock_path(entry: Path) -> Path:
+    return entry.with_name(f"{entry.name}.lock")
+
+@contextmanager
+def hold_db(entry: Path):
+    """
+    Holds a shared lock on a DB cache entry (which need not exist yet) while
+    its DB is built and searched, so `drop_db` and `evict_lru` in this or any
+    other process leave it alone.
+    """
+    import fcntl
+    lock = _lock_path(Path(entry))
+    lock.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        fh = open(lock, "a")
+        fcntl.flock(fh, fcntl.LOCK_SH)
+        try:
+            if os.fstat(fh.fileno()).st_ino == os.stat(lock).st_ino: break
+        except FileNotFoundError:
+            pass
+        fh.close()  # the lock file was removed with its entry while we waited; lock the new one
+    try:
+        yield
+    finally:
+        fh.close()
+
+def _remove_unused(entry: Path) -> bool:
+    """Removes a DB cache entry and its lock file unless it is held; returns whether it was removed."""
+    import fcntl
+    lock = _lock_path(entry)
+    with open(lock, "a") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        shutil.rmtree(entry, ignore_errors=True)
+        lock.unlink(missing_ok=True)
+    return True
+
+def drop_db(asm_fa: str, tmpdir: Path):
+    """
+    Removes the cached DB of an assembly (used when `clean_temp` is set),
+    unless another worker typing the same content still holds it.
+    """
+    _remove_unused(db_cache_entry(asm_fa, tmpdir))
+
+def make_ref_db(ref_fa, tmpdir: Path) -> str:
+    """
+    BLAST DB over a reference FASTA (whitelist or resolver refs), used when the
+    assembly is the query. Built once per reference content and never evicted.
+    """
+    entry = Path(tmpdir) / "ref_db" / f"{Path(ref_fa).stem}-{file_digest(ref_fa)[:16]}"
+    return _build_db_atomically(str(ref_fa), entry, "refdb")
+
+BATCH_TAG_SEP = "__"
+
+def write_batch_fasta(fastas: list[str], dest: Path):
+    """
+    Concatenates several assemblies into one FASTA for a multi-sample BLAST DB.
+    Contig IDs are prefixed with `s<index>__` so hits can be demultiplexed.
+    """
+    with open(dest, "wb") as out:
+        for i, fa in enumerate(fastas):
+            tag = f"s{i}{BATCH_TAG_SEP}".encode()
+            line = b"\n"
+            with open(fa, "rb") as fh:
+                for line in fh:
+                    out.write(b">" + tag + line[1:] if line.startswith(b">") else line)
+            if not line.endswith(b"\n"):
+                out.write(b"\n")
+
+def demux_batch_tsv(lines, n_samples: int, ref_as_db: bool) -> list[list[str]]:
+    """Splits tabular BLAST lines over a batch FASTA into per-sample lines with the original contig IDs."""
+    per_sample = [[] for _ in range(n_samples)]
+    col = 0 if ref_as_db else 1
+    for line in lines:
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) < 11: continue
+        tag, sep, contig = parts[col].partition(BATCH_TAG_SEP)
+        if not sep or not tag[1:].isdigit(): continue
+        parts[col] = contig
+        per_sample[int(tag[1:])].append("\t".join(parts))
+    return per_sample
+
+class Hsp(NamedTuple):
+    """
+    One BLAST HSP in allele-centric form: allele coordinates ascending, and
+    `cstart` the contig position aligned to `astart` (see `parse_hsp_line`).
+    """
+    allele: str
+    contig: str
+    pident: float
+    length: int
+    alen: int
+    bitscore: float
+    astart: int
+    aend: int
+    cstart: int
+    cend: int
+
+def parse_hsp_line(line: str, ref_as_db: bool = False) -> Hsp|None:
+    """
+    Parses one tabular BLAST line (11 columns, see `stages.OUTFMT_*`) into an Hsp.
+
+    Whatever the search orientation, the HSP is reported with allele
+    coordinates ascending (astart <= aend) and the contig coordinates paired
+    with them (cstart aligns to astart), i.e. exactly what the default
+    orientation (alleles as query, assembly as DB) produces. Downstream
+    scoring and SNP mapping therefore do not depend on the orientation.
+    Returns None for blank or truncated lines.
+    """
+    parts = line.rstrip("\n").split("\t")
+    if len(parts) < 11: return None
+    qseqid, sseqid, pident, length, xlen, evalue, bitscore, qstart, qend, sstart, send = parts[:11]
+    if ref_as_db:
+        allele, contig = sseqid, qseqid
+        astart, aend, cstart, cend = int(sstart), int(send), int(qstart), int(qend)
+        if astart > aend:
+            astart, aend, cstart, cend = aend, astart, cend, cstart
+    else:
+        allele, contig = qseqid, sseqid
+        astart, aend, cstart, cend = int(qstart), int(qend), int(sstart), int(send)
+    return Hsp(allele, contig, float(pident), int(length), int(xlen), float(bitscore), astart, aend, cstart, cend)
+
+def iter_hsps(lines, ref_as_db: bool = False):
+    for line in lines:
+        hsp = parse_hsp_line(line, ref_as_db)
+        if hsp is not None:
+            yield hsp
+
+def stream_lines(cmd: list[str], tee=None, gzip_tee: bool = False):
+    """
+    Runs `cmd` and yields its stdout lines as they are produced.
+
+    If `tee` is given, every line is also written to that file on the fly
+    (gzip-compressed if `gzip_tee`), so no second in-memory copy of the output
+    is needed. Raises CalledProcessError if the command fails; the process is
+    killed if the consumer stops iterating early.
+    """
+    with step(Path(cmd[0]).name), tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err, text=True)
+        out = (gzip.open(tee, "wt") if gzip_tee else open(tee, "w")) if tee else None
+        try:
+            for line in proc.stdout:
+                if out: out.write(line)
+                yield line
+            proc.stdout.close()
+            if proc.wait() != 0:
+                err.seek(0)
+                raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=err.read().decode(errors="replace"))
+        finally:
+            if out: out.close()
+            if proc.poll() is None:
+                proc.kill(); proc.wait()
+
+BLAST_TASKS = ("megablast", "dc-megablast", "blastn", "blastn-short")
+
+def parse_blast_tasks(value) -> list[str]:
+    """A `blast_tasks` cascade given as a comma-separated string or a list (e.g. from YAML)."""
+    parts = value.split(",") if isinstance(value, str) else list(value or [])
+    return [str(t).strip() for t in parts if str(t).strip()]
+
+def blast_cmd(query_fa: str, db_prefix: str, threads: int, outfmt_cols: str, max_target_seqs=50,
+              task: str = "blastn") -> list[str]:
+    return [
         "blastn",
         "-query", query_fa,
         "-db", db_prefix,
-        "-task", "blastn",
+        "-task", task,
         "-outfmt", outfmt_cols,
         "-max_target_seqs", str(max_target_seqs),
         "-num_threads", str(threads),
         "-dust", "no",
     ]
-    return run(cmd)
+
+def run_blast(query_fa: str, db_prefix: str, threads: int, outfmt_cols: str, max_target_seqs=50,
+              task: str = "blastn") -> str:
+    return run(blast_cmd(query_fa, db_prefix, threads, outfmt_cols, max_target_seqs, task))
+
+def stream_blast(query_fa: str, db_prefix: str, threads: int, outfmt_cols: str, max_target_seqs=50,
+                 tee=None, gzip_tee: bool = False, task: str = "blastn"):
+    """Like `run_blast`, but yields the tabular lines while BLAST runs (see `stream_lines`)."""
+    return stream_lines(blast_cmd(query_fa, db_prefix, threads, outfmt_cols, max_target_seqs, task), tee, gzip_tee)
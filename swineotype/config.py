@@ -1,6 +1,5 @@
 import os
 from pathlib import Path
-import yaml
 import site
 
 # --- Default Configuration ---
@@ -10,6 +9,24 @@ DEFAULT_CONFIG = {
     "wzxwzy_fasta": "suis_wzxwzy_whitelist.fasta",
     "resolver_refs_fasta": "suis_resolver_refs.fasta",
     "tmp_dir": "results/db_cache",
+    "combined_search": 0,  # search whitelist and resolver refs in one BLAST run per assembly
+    "batch_size": 0,  # > 1: type this many assemblies per shared BLAST DB and search
+    "scratch_dir": "",  # staging area and BLAST DB cache; empty = <data_dir>/tmp
+    "db_cache_max_bytes": 1 << 30,  # LRU budget for cached assembly DBs; 0 = unbounded
+    "search_mode": "asm_db",  # "asm_db": DB per assembly; "ref_db": DB per reference panel, assembly as query
+    "scoring_engine": "auto",  # stage-1 scoring: "numpy", "python", or "auto" (numpy for several samples at once, when installed)
+    "kmer_prefilter": 0,  # asm_db mode: only BLAST whitelist alleles of serotypes the k-mer screen finds
+    "kmer_size": 15,
+    "kmer_stride": 4,  # sample every n-th k-mer of the assembly
+    "kmer_min_hits": 3,  # shared k-mers for an allele to count as hit
+    "kmer_validate": 0,  # also run the full search, report disagreements and keep the full result
+    "blast_tasks": "blastn",  # cascade, fastest first: "megablast,blastn" or a YAML list
+    "app_engine": "snakemake",  # APP typing: "snakemake" runs the serovar_detector workflow, "kma" runs KMA directly
+    "tiered_stage1": 0,  # search the stage1_tier1 alleles first; the rest only when that call is not decisive
+    "stage1_tier1": "wzy",  # gene class of the first tier: "wzy" or "wzx"
+    "resolver_engine": "blast",  # "anchor": read the stage-2 site between flanking anchors, BLAST only as fallback
+    "anchor_flank": 31,
+    "anchor_max_mismatches": 2,  # allowed in one of the two flanks; the other must match exactly
     "plurality": 0.60,
     "delta": 100,
     "require_agreement": 1,
@@ -20,6 +37,8 @@ DEFAULT_CONFIG = {
     "keep_debug": 1,
     "gzip_debug": 0,
     "clean_temp": 0,
+    "result_cache": 0,  # reuse results of samples already typed with the same inputs and settings
+    "result_cache_dir": "",  # empty = <out_dir>/.result_cache
     "ambig_set": {"1", "14", "2", "1/2"},
     "pair_1_14": {"1", "14"},
     "pair_2_1_2": {"2", "1/2"},
@@ -68,6 +87,7 @@ def load_config(config_file: str | None = None) -> dict:
     root_dir = get_root_dir()
 
     if config_file:
+        import yaml
         with open(config_file, "r") as f:
             user_config = yaml.safe_load(f)
             if user_config:
@@ -85,7 +105,28 @@ def load_config(config_file: str | None = None) -> dict:
     config["data_dir"] = root_dir / "data"
     config["wzxwzy_fasta"] = config["data_dir"] / config["wzxwzy_fasta"]
     config["resolver_refs_fasta"] = config["data_dir"] / config["resolver_refs_fasta"]
-    config["tmp_dir"] = config["data_dir"] / "tmp"
+    if config["scratch_dir"]:
+        config["tmp_dir"] = Path(config["scratch_dir"]).expanduser().resolve()
+    else:
+        config["tmp_dir"] = config["data_dir"] / "tmp"
     config["tmp_dir"].mkdir(parents=True, exist_ok=True)
 
+    if config["search_mode"] not in ("asm_db", "ref_db"):
+        raise ValueError(f"Unknown search_mode: {config['search_mode']!r} (expected 'asm_db' or 'ref_db')")
+    from swineotype.blast import BLAST_TASKS, parse_blast_tasks
+    tasks = parse_blast_tasks(config["blast_tasks"])
+    if not tasks or any(t not in BLAST_TASKS for t in tasks):
+        raise ValueError(f"Unknown blast_tasks: {config['blast_tasks']!r} (expected a list of {', '.join(BLAST_TASKS)})")
+    config["blast_tasks"] = ",".join(tasks)
+    if config["app_engine"] not in ("kma", "snakemake"):
+        raise ValueError(f"Unknown app_engine: {config['app_engine']!r} (expected 'kma' or 'snakemake')")
+    if config["kmer_prefilter"] and config["tiered_stage1"]:
+        raise ValueError("kmer_prefilter and tiered_stage1 cannot be combined; turn one of them off")
+    if config["stage1_tier1"] not in ("wzy", "wzx"):
+        raise ValueError(f"Unknown stage1_tier1: {config['stage1_tier1']!r} (expected 'wzy' or 'wzx')")
+    if config["resolver_engine"] not in ("blast", "anchor"):
+        raise ValueError(f"Unknown resolver_engine: {config['resolver_engine']!r} (expected 'blast' or 'anchor')")
+    if config["scoring_engine"] not in ("auto", "numpy", "python"):
+        raise ValueError(f"Unknown scoring_engine: {config['scoring_engine']!r} (expected 'auto', 'numpy' or 'python')")
+
     return config
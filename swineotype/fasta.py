@@ -0,0 +1,128 @@
+import mmap
+import os
+from pathlib import Path
+
+
+def build_fai(fasta_path) -> dict:
+    """
+    Builds a samtools-compatible index of a FASTA file in memory.
+
+    Returns {name: (length, offset, linebases, linewidth)}, the columns of a
+    `.fai` file. As with `samtools faidx`, every sequence line but the last of
+    a record must have the same length.
+    """
+    index = {}
+    name = None
+    length = offset = linebases = linewidth = 0
+    last_short = False
+    pos = 0
+    with open(fasta_path, "rb") as fh:
+        for line in fh:
+            if line.startswith(b">"):
+                if name is not None:
+                    index[name] = (length, offset, linebases, linewidth)
+                name = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ""
+                length = linebases = linewidth = 0
+                offset = pos + len(line)
+                last_short = False
+            elif name is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if bases:
+                    if last_short:
+                        raise ValueError(f"Different line length in sequence '{name}' of {fasta_path}")
+                    if linebases == 0:
+                        linebases, linewidth = bases, len(line)
+                    elif bases != linebases or len(line) != linewidth:
+                        if bases > linebases:
+                            raise ValueError(f"Different line length in sequence '{name}' of {fasta_path}")
+                        last_short = True
+                    length += bases
+            pos += len(line)
+    if name is not None:
+        index[name] = (length, offset, linebases, linewidth)
+    return index
+
+
+def read_fai(fai_path) -> dict:
+    index = {}
+    with open(fai_path, "r") as fh:
+        for line in fh:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 5: continue
+            index[cols[0]] = tuple(int(c) for c in cols[1:5])
+    return index
+
+
+def read_fasta(fasta_path) -> dict:
+    """{id: sequence} of a (small) FASTA file, in file order."""
+    records, name, chunks = {}, None, []
+    with open(fasta_path, "r") as fh:
+        for line in fh:
+            if line.startswith(">"):
+                if name is not None: records[name] = "".join(chunks)
+                name, chunks = line[1:].split()[0], []
+            elif name is not None:
+                chunks.append(line.strip().upper())
+    if name is not None: records[name] = "".join(chunks)
+    return records
+
+
+class FastaIndex:
+    """
+    Random access to the sequences of a FASTA file, without a subprocess.
+
+    Uses an existing `.fai` next to the file when it is newer than the FASTA,
+    otherwise indexes the file in memory (nothing is written to disk). Bases are
+    read from an mmap of the file, so one instance can be shared by all stages
+    that look at the same assembly.
+    """
+
+    def __init__(self, fasta_path):
+        self.path = str(fasta_path)
+        fai = Path(f"{self.path}.fai")
+        if fai.exists() and fai.stat().st_mtime >= os.stat(self.path).st_mtime:
+            self.index = read_fai(fai)
+        else:
+            self.index = build_fai(self.path)
+        self._fh = open(self.path, "rb")
+        size = os.fstat(self._fh.fileno()).st_size
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._fh.close()
+
+    def names(self) -> list[str]:
+        return list(self.index)
+
+    def length(self, name: str) -> int:
+        return self.index[name][0]
+
+    def _byte(self, name: str, i: int) -> int:
+        _, offset, linebases, linewidth = self.index[name]
+        return offset + (i // linebases) * linewidth + i % linebases
+
+    def fetch(self, name: str, start: int, end: int) -> str:
+        """Sequence of `name` from `start` to `end` (1-based, inclusive), like `samtools faidx name:start-end`."""
+        if name not in self.index:
+            return ""
+        length = self.index[name][0]
+        start, end = max(start, 1), min(end, length)
+        if start > end:
+            return ""
+        raw = self._mm[self._byte(name, start - 1):self._byte(name, end - 1) + 1]
+        return raw.replace(b"\n", b"").replace(b"\r", b"").decode()
+
+    def sequence(self, name: str) -> str:
+        return self.fetch(name, 1, self.length(name))
+
+    def base(self, name: str, pos: int) -> str:
+        """Uppercase base at 1-based `pos`, or "N" when the position is not in the assembly."""
+        return self.fetch(name, pos, pos).upper() or "N"
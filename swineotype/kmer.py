@@ -0,0 +1,109 @@
+"""
+Alignment-free screen of an assembly against the wzx/wzy whitelist.
+
+The whitelist's k-mers (both strands) are indexed once per process. An
+assembly is scanned with a stride and each allele counts the k-mers it shares
+with it. Serotypes with enough shared k-mers are candidates, and only their
+alleles are sent to BLAST for stage 1.
+"""
+
+import hashlib
+import os
+from collections import Counter
+from pathlib import Path
+
+from swineotype.fasta import FastaIndex, read_fasta
+from swineotype.stages import parse_whitelist_headers
+from swineotype.utils import file_digest, temp_path
+
+_COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+# {(whitelist digest, k): KmerIndex}
+_INDEXES = {}
+
+
+class KmerIndex:
+    """Map from every k-mer of the whitelist alleles (and its reverse complement) to the alleles containing it."""
+
+    def __init__(self, whitelist_fa, k: int):
+        self.k = k
+        self.allele_to_type, self.allele_to_geneclass = parse_whitelist_headers(whitelist_fa)
+        self.alleles = list(read_fasta(whitelist_fa).items())
+        index = {}
+        for i, (_, seq) in enumerate(self.alleles):
+            for strand in (seq, seq.translate(_COMPLEMENT)[::-1]):
+                for j in range(len(strand) - k + 1):
+                    kmer = strand[j:j + k]
+                    if "N" in kmer: continue
+                    hit = index.get(kmer)
+                    if hit is None: index[kmer] = (i,)
+                    elif hit[-1] != i: index[kmer] = hit + (i,)
+        self.index = index
+
+    def count_hits(self, assembly_fa, stride: int) -> Counter:
+        """Number of sampled assembly k-mers (every `stride`-th position) shared with each allele."""
+        k, lookup, counts = self.k, self.index.get, Counter()
+        with FastaIndex(assembly_fa) as reader:
+            for name in reader.names():
+                seq = reader.sequence(name).upper()
+                for j in range(0, len(seq) - k + 1, stride):
+                    hit = lookup(seq[j:j + k])
+                    if hit: counts.update(hit)
+        return Counter({self.alleles[i][0]: n for i, n in counts.items()})
+
+
+def kmer_index(whitelist_fa, k: int) -> KmerIndex:
+    key = (file_digest(whitelist_fa), k)
+    if key not in _INDEXES:
+        _INDEXES[key] = KmerIndex(whitelist_fa, k)
+    return _INDEXES[key]
+
+
+def candidate_alleles(assembly_fa, whitelist_fa, config: dict) -> list[str]|None:
+    """
+    Whitelist alleles worth aligning against an assembly, in whitelist order.
+
+    An allele is hit when at least `kmer_min_hits` sampled k-mers match it. As
+    a safety margin every allele (wzx and wzy) of a hit serotype is kept, as is
+    the other serotype of an ambiguous pair (`pair_1_14`, `pair_2_1_2`).
+    Returns None when nothing is hit, so the caller searches the full whitelist.
+    """
+    idx = kmer_index(whitelist_fa, config.get("kmer_size", 15))
+    counts = idx.count_hits(assembly_fa, max(1, config.get("kmer_stride", 4)))
+    hit = {a for a, n in counts.items() if n >= config.get("kmer_min_hits", 3)}
+    if not hit:
+        return None
+    types = {idx.allele_to_type.get(a) for a in hit} - {None}
+    for pair in (config.get("pair_1_14", ()), config.get("pair_2_1_2", ())):
+        if types & set(pair): types |= set(pair)
+    return [a for a, _ in idx.alleles if a in hit or idx.allele_to_type.get(a) in types]
+
+
+def subset_fasta(fasta_path, ids: list[str], tmp_dir, subdir: str = "kmer") -> Path:
+    """The records of `fasta_path` whose IDs are in `ids`, written once per distinct subset under `tmp_dir/<subdir>`."""
+    wanted = set(ids)
+    key = hashlib.sha1("\n".join(sorted(wanted)).encode()).hexdigest()[:16]
+    dest = Path(tmp_dir) / subdir / f"{Path(fasta_path).stem}-{file_digest(fasta_path)[:16]}-{key}.fasta"
+    if not dest.exists():
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = temp_path(dest)
+        keep = False
+        try:
+            with open(fasta_path, "r") as src, open(tmp, "w") as out:
+                for line in src:
+                    if line.startswith(">"):
+                        keep = line[1:].split()[0] in wanted if line[1:].strip() else False
+                    if keep:
+                        out.write(line if line.endswith("\n") else line + "\n")
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+    return dest
+
+
+def prefilter_whitelist(assembly_fa, whitelist_fa, config: dict) -> tuple[Path, int]:
+    """Query FASTA for the stage-1 search of an assembly and how many alleles it holds."""
+    ids = candidate_alleles(assembly_fa, whitelist_fa, config)
+    if ids is None:
+        return Path(whitelist_fa), len(kmer_index(whitelist_fa, config.get("kmer_size", 15)).alleles)
+    return subset_fasta(whitelist_fa, ids, config["tmp_dir"]), len(ids)
@@ -8,43 +8,399 @@ from __future__ import annotations
 import os
 import sys
 import glob
+import shutil
+import tempfile
 import click
+from collections import deque
+from concurrent.futures import Future
+from contextlib import nullcontext
 from pathlib import Path
 
-from swineotype.stages import stage1_score, stage2_resolver_call, interpret_resolver
+from swineotype.stages import (stage1_score, stage2_resolver_call, prepare_reference_dbs, search_combined,
+                               plan_stage2, final_call, search_references, parse_hsps, route_hsps, uses_ref_db,
+                               write_debug_tsv, combined_reference_fasta)
+from swineotype.scoring import score_stage1_many
+from swineotype.blast import db_cache_entry, drop_db, hold_db, make_db_if_needed, run, write_batch_fasta, demux_batch_tsv
 from swineotype.config import load_config
-from swineotype.adapters.app import run_app_analysis
-from swineotype.utils import ensure_tool, ensure_unix_line_endings
+from swineotype.fasta import FastaIndex
+from swineotype.anchors import anchor_resolver_call
+from swineotype.archives import is_archive, is_extracted, expand_archives, release, release_all
+from swineotype.references import load_references
+from swineotype.profiling import step, trace_sample, use_trace, write_records, summary_table
+from swineotype.shards import parse_shard, select_shard, member_in_shard
+from swineotype.results import ResultCache, result_cache_key, CsvResultWriter, ParquetResultWriter
+from swineotype.utils import KeyedLocks, ensure_tool, stage_assembly, sample_name
+
+SUMMARY_COLUMNS = ["sample","stage1_top","stage1_second","stage1_fraction","stage1_delta","stage1_tier","stage1_scores","ref_id","contig","contig_pos","strand","base","status","final_serotype",
+                   "stage2_method","blast_task","n_contigs","total_length","n50"]
+
+def run_app_analysis(**kwargs):
+    """APP adapter entry point; imported on use, since it pulls in pandas."""
+    from swineotype.adapters.app import run_app_analysis as run_app
+    return run_app(**kwargs)
 
 # -------- Main orchestration --------
 
+def open_result_cache(out_dir: Path, config: dict) -> ResultCache|None:
+    return ResultCache(config["result_cache_dir"] or out_dir / ".result_cache") if config["result_cache"] else None
+
+def cached_row(cache: ResultCache, key: str) -> dict|None:
+    row = cache.get(key)
+    if row is not None:
+        row["cached"] = True
+    return row
+
+# Threads of one process (the server's workers, `api.type_many`) typing
+# samples of the same name would share the staged copy, run dir and DB.
+_SAMPLE_LOCKS = KeyedLocks()
+
 def process_one(assembly: str, out_dir: Path, threads: int, config: dict):
-    run_dir = out_dir / Path(assembly).stem; run_dir.mkdir(parents=True, exist_ok=True)
-    assembly = ensure_unix_line_endings(assembly, config["tmp_dir"])
-    s1 = stage1_score(assembly, config["wzxwzy_fasta"], threads, run_dir, config)
-    s1_top, s1_second = s1.get("top"), s1.get("second")
-    allowed_pair = None
-    if (s1_top in config["pair_1_14"]) or (s1_second in config["pair_1_14"]): allowed_pair = "1_vs_14"
-    elif (s1_top in config["pair_2_1_2"]) or (s1_second in config["pair_2_1_2"]): allowed_pair = "2_vs_1_2"
-    must_stage2 = (not s1.get("decisive", False)) or s1.get("must_stage2_for_pair", False)
-    s2_ev, s2_status = None, "SKIPPED"
+    name = sample_name(assembly)
+    with _SAMPLE_LOCKS.hold(name), trace_sample(name, config.get("profile")) as trace:
+        with step("total"):
+            row = _process_one(assembly, out_dir, threads, config)
+    return dict(row, trace=trace.records) if trace else row
+
+def _process_one(assembly: str, out_dir: Path, threads: int, config: dict):
+    prep = prepare_sample(assembly, out_dir, config)
+    return prep["row"] if "row" in prep else type_prepared(prep, threads, config)
+
+def prepare_sample(assembly: str, out_dir: Path, config: dict, build_db: bool = False, pinned: set|None = None) -> dict:
+    """
+    The I/O-bound half of `process_one`: result cache lookup and staging, and
+    with `build_db` the assembly's BLAST DB. Returns {"row": ...} for a cached
+    sample, otherwise what `type_prepared` needs to finish it. The DB's cache
+    entry is added to `pinned`, if given, which the caller empties once the
+    sample is typed; `blast.evict_lru` skips pinned entries. `clean` says
+    whether the sample's scratch files go once it is typed: with `clean_temp`,
+    and always for archive members, whose extracted copy is itself scratch.
+    """
+    cache = open_result_cache(out_dir, config)
+    key = result_cache_key(assembly, config) if cache else None
+    row = cached_row(cache, key) if cache else None
+    if row is not None: return {"row": row}
+    name = sample_name(assembly)
+    run_dir = out_dir / name; run_dir.mkdir(parents=True, exist_ok=True)
+    with step("staging"):
+        staged, stats = stage_assembly(assembly, config["tmp_dir"])
+    prep = {"source": assembly, "staged": staged, "stats": stats, "name": name, "run_dir": run_dir,
+            "cache": cache, "key": key, "clean": bool(config["clean_temp"]) or is_extracted(assembly)}
+    if build_db and not uses_ref_db(config):
+        if pinned is not None: pinned.add(db_cache_entry(staged, config["tmp_dir"]))
+        try:
+            with step("db_build"):
+                make_db_if_needed(staged, config["tmp_dir"], config.get("db_cache_max_bytes", 0), pinned=pinned if pinned is not None else ())
+        except Exception:
+            if pinned is not None: pinned.discard(db_cache_entry(staged, config["tmp_dir"]))
+            if prep["clean"]: clean_staged(assembly, staged, config)
+            raise
+    return prep
+
+def type_prepared(prep: dict, threads: int, config: dict) -> dict:
+    """Types a sample staged by `prepare_sample` and stores its row in the result cache."""
+    try:
+        # other workers typing the same content share the DB; the hold keeps their clean_temp from dropping it
+        with nullcontext() if uses_ref_db(config) else hold_db(db_cache_entry(prep["staged"], config["tmp_dir"])):
+            row = type_staged(prep["staged"], prep["run_dir"], threads, config)
+        row.update(prep["stats"], sample=prep["name"])
+        if prep["cache"]: prep["cache"].put(prep["key"], row)
+        return row
+    finally:
+        if prep["clean"]: clean_staged(prep["source"], prep["staged"], config)
+
+def clean_staged(source: str, staged: str, config: dict):
+    """Drops the scratch files of one sample: its cached DB, staged copy and .fai."""
+    drop_db(staged, config["tmp_dir"])
+    if Path(staged).resolve() != Path(source).resolve():
+        Path(staged).unlink(missing_ok=True)
+    Path(f"{staged}.fai").unlink(missing_ok=True)
+
+def type_staged(assembly: str, run_dir: Path, threads: int, config: dict):
+    with FastaIndex(assembly) as reader:
+        return _type_staged(assembly, reader, run_dir, threads, config)
+
+def _type_staged(assembly: str, reader: FastaIndex, run_dir: Path, threads: int, config: dict):
+    routed, refs = {}, load_references(config)
+    if config.get("combined_search"):
+        with step("search_combined"):
+            routed = search_combined(assembly, threads, run_dir, config, refs)
+    with step("stage1"):
+        s1 = stage1_score(assembly, config["wzxwzy_fasta"], threads, run_dir, config, hsps=routed.get("stage1"), refs=refs)
+    allowed_pair, must_stage2 = plan_stage2(s1, config)
+    s2_ev = None
     if must_stage2 and allowed_pair:
-        s2_ev = stage2_resolver_call(assembly, config["resolver_refs_fasta"], threads, run_dir, config, allowed_pair)
-        s2_status = "OK" if s2_ev else "NO_HSP_OR_LOW_QUAL"
-    final_sero, final_status = None, None
-    if s2_ev:
-        final_sero = interpret_resolver(s2_ev, config); final_status = "STAGE2" if final_sero else "NO_CALL_STAGE2"
-    elif s1.get("decisive", False) and not must_stage2:
-        final_sero = s1.get("top"); final_status = "STAGE1"
-    else:
-        final_status = "NO_CALL_STAGE2"
-    return {"sample":assembly,"stage1_top":s1.get("top") or "","ref_id":(s2_ev or {}).get("ref_id",""),
-            "contig":(s2_ev or {}).get("contig",""),"contig_pos":(s2_ev or {}).get("contig_pos",""),
-            "strand":(s2_ev or {}).get("strand",""),"base":(s2_ev or {}).get("base",""),
-            "status":final_status,"final_serotype":final_sero or ""}
+        with step("stage2"):
+            s2_ev = stage2_resolver_call(assembly, config["resolver_refs_fasta"], threads, run_dir, config, allowed_pair,
+                                         hsps=routed.get("stage2"), reader=reader)
+    return dict(final_call(s1, s2_ev, config), sample=assembly)
+
+# -------- Batch mode --------
+
+def process_batch(assemblies: list[str], out_dir: Path, threads: int, config: dict) -> list[dict]:
+    with trace_sample("+".join(sample_name(a) for a in assemblies), config.get("profile")) as trace:
+        with step("total"):
+            rows = _process_batch(assemblies, out_dir, threads, config)
+    if trace:  # one trace per batch, carried by its first row
+        rows[0] = dict(rows[0], trace=trace.records)
+    return rows
+
+def _process_batch(assemblies: list[str], out_dir: Path, threads: int, config: dict) -> list[dict]:
+    """
+    Types several assemblies with one BLAST DB and one search per stage.
+
+    The staged assemblies are concatenated into a single FASTA with
+    sample-prefixed contig IDs; the hits are demultiplexed back to each sample
+    and scored exactly as in `process_one`. Returns one row per assembly, in
+    order; failures are contained per sample where possible.
+    In `asm_db` mode the batch DB is larger than a single assembly's, so
+    e-values (and which weak hits BLAST reports) can differ from per-sample
+    runs; `batch_size` is therefore part of the result cache key.
+    """
+    rows, todo = [None] * len(assemblies), []
+    cache = open_result_cache(out_dir, config)
+    for i, asm in enumerate(assemblies):
+        try:
+            prep = prepare_sample(asm, out_dir, config)
+            if "row" in prep: rows[i] = prep["row"]
+            else: todo.append(dict(prep, index=i))
+        except Exception as exc:
+            rows[i] = failed_row(asm, exc)
+    if not todo:
+        return rows
+    work = Path(tempfile.mkdtemp(prefix=".batch-", dir=config["tmp_dir"]))
+    try:
+        _type_batch(todo, work, threads, config)
+        for t in todo:
+            if "row" not in t: continue
+            rows[t["index"]] = dict(t["row"], **t["stats"], sample=t["name"])
+            if cache: cache.put(t["key"], rows[t["index"]])
+    except Exception as exc:
+        for t in todo:
+            if rows[t["index"]] is None: rows[t["index"]] = failed_row(t["source"], exc)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        for t in todo:
+            if t["clean"]: clean_staged(t["source"], t["staged"], config)
+    for t in todo:
+        if rows[t["index"]] is None: rows[t["index"]] = failed_row(t["source"], t.get("error") or RuntimeError("not typed"))
+    return rows
+
+def _type_batch(todo: list[dict], work: Path, threads: int, config: dict):
+    n = len(todo)
+    batch_fa = work / "batch.fasta"
+    write_batch_fasta([t["staged"] for t in todo], batch_fa)
+    db_prefix = None
+    if not uses_ref_db(config):
+        db_prefix = str(work / "batchdb")
+        run(["makeblastdb", "-in", str(batch_fa), "-dbtype", "nucl", "-out", db_prefix])
+
+    def search(refs_fa, debug_name):
+        lines, ref_as_db = search_references(str(batch_fa), refs_fa, threads, config, db_prefix=db_prefix, n_samples=n)
+        per_sample = demux_batch_tsv(lines, n, ref_as_db)
+        for t, lines in zip(todo, per_sample):
+            write_debug_tsv("\n".join(lines), t["run_dir"] / debug_name, config)
+        return [parse_hsps(lines, ref_as_db) for lines in per_sample]
+
+    refs = load_references(config)
+    with step("stage1"):
+        if config.get("combined_search"):
+            routed = [route_hsps(hsps, config, refs) for hsps in search(combined_reference_fasta(config), "combined_vs_asm.tsv")]
+            s1_hsps, s2_hsps = [r["stage1"] for r in routed], [r["stage2"] for r in routed]
+        else:
+            s1_hsps, s2_hsps = search(config["wzxwzy_fasta"], "wzxwzy_vs_asm.tsv"), None
+        for t, s1 in zip(todo, score_stage1_many(s1_hsps, refs.allele_to_type, config)):
+            t["s1"] = s1
+            t["pair"], t["must_stage2"] = plan_stage2(s1, config)
+    for t in todo:
+        t["run_s2"] = "s1" in t and t["must_stage2"] and bool(t["pair"])
+        if t["run_s2"] and s2_hsps is None and config.get("resolver_engine", "blast") == "anchor":
+            with FastaIndex(t["staged"]) as reader:
+                t["s2_ev"] = anchor_resolver_call(reader, config["resolver_refs_fasta"], config, t["pair"])
+            t["run_s2"] = t["s2_ev"] is None
+    if any(t["run_s2"] for t in todo) and s2_hsps is None:
+        with step("stage2"):
+            s2_hsps = search(config["resolver_refs_fasta"], "resolver_vs_asm.tsv")
+    for i, t in enumerate(todo):
+        if "s1" not in t: continue
+        try:
+            s2_ev = t.get("s2_ev")
+            if t["run_s2"]:
+                with FastaIndex(t["staged"]) as reader:
+                    s2_ev = stage2_resolver_call(t["staged"], config["resolver_refs_fasta"], threads, t["run_dir"], config,
+                                                 t["pair"], hsps=s2_hsps[i], reader=reader)
+            t["row"] = final_call(t["s1"], s2_ev, config)
+        except Exception as exc:
+            t["error"] = exc
+
+def safe_process_batch(assemblies: list[str], out_dir: Path, threads: int, config: dict) -> list[dict]:
+    try:
+        return process_batch(assemblies, out_dir, threads, config)
+    except Exception as exc:
+        return [failed_row(asm, exc) for asm in assemblies]
+
+def failed_row(assembly: str, exc: BaseException) -> dict:
+    """Result row for a sample whose processing raised, so one bad input does not abort the batch."""
+    row = {k: "" for k in SUMMARY_COLUMNS}
+    error = f"{type(exc).__name__}: {exc}"
+    stderr = getattr(exc, "stderr", None)
+    if isinstance(stderr, str) and stderr.strip():
+        error += f" ({stderr.strip().splitlines()[-1]})"
+    row.update({"sample":sample_name(assembly),"status":"ERROR","error":error})
+    return row
+
+def safe_process_one(assembly: str, out_dir: Path, threads: int, config: dict) -> dict:
+    try:
+        return process_one(assembly, out_dir, threads, config)
+    except Exception as exc:
+        return failed_row(assembly, exc)
+
+def iter_results(assemblies: list[str], out_dir: Path, threads: int, config: dict, jobs: int = 1, prefetch: int = 0):
+    """
+    Yields (assembly, row) pairs in input order.
+
+    `assemblies` may be a lazy iterable (e.g. members extracted from an
+    archive); it is consumed only a bounded distance ahead of the results.
+    With jobs > 1 the assemblies are typed concurrently in a process pool, each
+    job running BLAST with `threads` threads; rows are still yielded in the
+    order the assemblies were given so the merged CSV is deterministic.
+    With prefetch > 0 staging and DB builds run ahead of the searches instead
+    (see `_iter_pipelined`).
+    """
+    if config["batch_size"] > 1:
+        yield from _iter_batches(assemblies, out_dir, threads, config, jobs)
+        return
+    if prefetch > 0:
+        yield from _iter_pipelined(assemblies, out_dir, threads, config, jobs, prefetch)
+        return
+    if jobs <= 1:
+        for asm in assemblies:
+            yield asm, safe_process_one(asm, out_dir, threads, config)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        submit = lambda asm: pool.submit(safe_process_one, asm, out_dir, threads, config)
+        for asm, fut in _submit_ahead(submit, assemblies, 2 * jobs):
+            try:
+                row = fut.result()
+            except Exception as exc:  # e.g. a worker killed by the OOM killer
+                row = failed_row(asm, exc)
+            yield asm, row
+
+def _submit_ahead(submit, items, window: int):
+    """
+    Yields (item, future) in input order. Items are taken from the (possibly
+    lazy) iterable and submitted only as earlier ones are collected, so at most
+    `window` are outstanding.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, submit(item)))
+        if len(pending) >= window:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+def _pipeline_prepare(assembly: str, out_dir: Path, config: dict, pinned: set) -> dict:
+    with trace_sample(sample_name(assembly), config.get("profile")) as trace:
+        with step("prepare"):
+            prep = prepare_sample(assembly, out_dir, config, build_db=True, pinned=pinned)
+    return dict(prep, trace=trace)
+
+def _pipeline_type(prep: dict, threads: int, config: dict) -> dict:
+    """Types a prepared sample in a worker process."""
+    with use_trace(prep["trace"]):
+        with step("type"):
+            row = type_prepared(prep, threads, config)
+    return dict(row, trace=prep["trace"].records) if prep["trace"] else row
+
+def _done(value) -> Future:
+    fut = Future(); fut.set_result(value)
+    return fut
+
+def _iter_pipelined(assemblies: list[str], out_dir: Path, threads: int, config: dict, jobs: int, prefetch: int):
+    """
+    Stages assemblies and builds their DBs in `prefetch` threads while a pool
+    of `jobs` processes runs the searches and the CPU-bound scoring on samples
+    already prepared.
+
+    At most `prefetch + jobs` samples are in flight, so no more than that many
+    staged copies and DBs sit in scratch waiting to be searched. Their DBs are
+    pinned against LRU eviction until they have been searched; only the
+    prefetch threads evict. Rows are yielded in input order.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+    pending, todo, pinned = deque(), iter(assemblies), set()
+    type_config = dict(config, db_cache_max_bytes=0)  # workers must not evict DBs pinned here
+
+    def start_typing(item):
+        asm, prepared, _ = item
+        try:
+            prep = prepared.result()
+        except Exception as exc:
+            item[2] = _done(failed_row(asm, exc)); return
+        item[2] = _done(prep["row"]) if "row" in prep else type_pool.submit(_pipeline_type, prep, threads, type_config)
+        item.append(prep)
+
+    with ProcessPoolExecutor(max_workers=jobs) as type_pool:
+        type_pool.submit(int).result()  # fork the workers before any prefetch thread exists
+        with ThreadPoolExecutor(max_workers=prefetch) as prepare_pool:
+            def submit_next():
+                asm = next(todo, None)
+                if asm is None: return
+                pending.append([asm, prepare_pool.submit(_pipeline_prepare, asm, out_dir, config, pinned), None])
+            for _ in range(prefetch + jobs): submit_next()
+            while pending:
+                for item in pending:
+                    if item[2] is None and item[1].done(): start_typing(item)
+                head = pending[0]
+                if head[2] is None or not head[2].done():
+                    wait([f for item in pending for f in [item[2] or item[1]] if not f.done()], return_when=FIRST_COMPLETED)
+                    continue
+                pending.popleft()
+                try:
+                    row = head[2].result()
+                except Exception as exc:  # e.g. a worker killed by the OOM killer
+                    row = failed_row(head[0], exc)
+                if len(head) > 3 and "staged" in head[3]:
+                    pinned.discard(db_cache_entry(head[3]["staged"], config["tmp_dir"]))
+                submit_next()
+                yield head[0], row
+
+def _iter_batches(assemblies: list[str], out_dir: Path, threads: int, config: dict, jobs: int):
+    from itertools import islice
+    todo, size = iter(assemblies), config["batch_size"]
+    batches = iter(lambda: list(islice(todo, size)), [])
+    if jobs <= 1:
+        for batch in batches:
+            yield from zip(batch, safe_process_batch(batch, out_dir, threads, config))
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        submit = lambda batch: pool.submit(safe_process_batch, batch, out_dir, threads, config)
+        for batch, fut in _submit_ahead(submit, batches, 2 * jobs):
+            try:
+                rows = fut.result()
+            except Exception as exc:
+                rows = [failed_row(asm, exc) for asm in batch]
+            yield from zip(batch, rows)
 
 # -------- CLI --------
 
+def unique_samples(assemblies):
+    """
+    Yields the assemblies, skipping repeats of the same file. Two different
+    inputs with the same sample name would share a run directory and a row of
+    the summary, so that raises a ClickException instead.
+    """
+    seen = {}
+    for asm in assemblies:
+        name, source = sample_name(asm), os.path.realpath(asm)
+        if name in seen:
+            if seen[name] == source: continue
+            raise click.ClickException(f"{seen[name]} and {asm} have the same sample name {name!r}; rename one of them")
+        seen[name] = source
+        yield asm
+
 def expand_globs(paths: list[str]) -> list[str]:
     out = []
     for p in paths:
@@ -53,15 +409,24 @@ def expand_globs(paths: list[str]) -> list[str]:
     return out
 
 @click.command()
-@click.option("--assembly", multiple=True, required=True, type=click.Path(), help="Path to one or more assembly files. Globs are supported.")
+@click.option("--assembly", multiple=True, required=True, type=click.Path(), help="Path to one or more assembly files. Globs, tar/zip archives of FASTAs and '-' (a tar stream on stdin) are supported.")
 @click.option("--out_dir", required=True, type=click.Path(), help="Output directory")
 @click.option("--merged_csv", default=None, type=click.Path(), help="Path to merge results into a single CSV file")
 @click.option("--threads", default=lambda: max(1, os.cpu_count() // 2), help="Number of threads to use")
+@click.option("--jobs", default=1, type=click.IntRange(min=1), help="Number of assemblies to type concurrently")
+@click.option("--job_threads", default=None, type=click.IntRange(min=1), help="BLAST threads per job (default: threads // jobs)")
 @click.option("--species", default="suis", type=click.Choice(["suis", "app"]), help="Species to serotype")
 @click.option("--config", default=None, type=click.Path(exists=True), help="Path to a custom config.yaml file")
-def main(assembly, out_dir, merged_csv, threads, species, config):
+@click.option("--resume", is_flag=True, default=False, help="Reuse cached results of samples typed before with the same references and settings")
+@click.option("--prefetch", default=0, type=click.IntRange(min=0), help="Stage and build DBs for this many upcoming assemblies while earlier ones are searched")
+@click.option("--parquet", "parquet_path", default=None, type=click.Path(), help="Also write this run's results to a Parquet file with typed columns (requires pyarrow)")
+@click.option("--shard", default=None, callback=parse_shard, help="Type only shard i of N (e.g. 3/16) of the assemblies, balanced by file size; merge the shards with swineotype-merge")
+@click.option("--profile", "profile_path", default=None, type=click.Path(), help="Write a JSON-lines timing/resource trace per sample and step to this file")
+def main(assembly, out_dir, merged_csv, threads, jobs, job_threads, species, config, resume, prefetch, parquet_path, shard, profile_path):
     """Swineotype: serotyping from assemblies"""
     config = load_config(config)
+    if resume: config["result_cache"] = 1
+    if profile_path: config["profile"] = 1
 
     if species=="app":
         run_app_analysis(
@@ -69,26 +434,59 @@ def main(assembly, out_dir, merged_csv, threads, species, config):
             out_dir=out_dir,
             threads=threads,
             swineotype_summary=merged_csv,
+            engine=config["app_engine"],
         )
         sys.exit(0)
 
     out_dir = Path(out_dir).resolve(); out_dir.mkdir(parents=True, exist_ok=True)
-    for tool in ("blastn","makeblastdb","samtools"): ensure_tool(tool)
+    for tool in ("blastn","makeblastdb"): ensure_tool(tool)
     assemblies = expand_globs(list(assembly))
-    merged_rows = []
-    with click.progressbar(assemblies, label="Serotyping assemblies") as bar:
-        for asm in bar:
-            row = process_one(asm,out_dir,threads, config); merged_rows.append(row)
-            fname, status, final = Path(asm).name,row["status"],row["final_serotype"]
-            if status in ("STAGE1","STAGE2"): click.echo(f"[OK] {fname} => {final} ({status})")
-            else: click.echo(f"[WARN] {fname} => {status}", err=True)
+    if shard:
+        assemblies = select_shard(assemblies, *shard)
+        click.echo(f"[INFO] Shard {shard[0]}/{shard[1]}: {sum(not is_archive(a) for a in assemblies)} file(s)"
+                   f"{' plus its share of archive members' if any(map(is_archive, assemblies)) else ''}")
+    if any(is_archive(a) for a in assemblies):
+        # members are extracted as the run reaches them, so their number and names are not known up front
+        keep = (lambda member: member_in_shard(member, *shard)) if shard else None
+        assemblies, n_assemblies = unique_samples(expand_archives(assemblies, config["tmp_dir"], keep)), None
+    else:
+        assemblies = list(unique_samples(assemblies))  # fail before anything is typed
+        n_assemblies = len(assemblies)
+    prepare_reference_dbs(config)
+    load_references(config)  # compiled once here; forked workers inherit it
+    job_threads = job_threads or max(1, int(threads) // jobs)
+    trace_records = []
+    trace_fh = open(profile_path, "w") if profile_path else None
+    try:
+        parquet_out = ParquetResultWriter(parquet_path) if parquet_path else None
+        csv_out = CsvResultWriter(merged_csv, SUMMARY_COLUMNS) if merged_csv else None
+    except ImportError as exc:
+        raise click.UsageError(str(exc))
+    results = iter_results(assemblies, out_dir, job_threads, config, jobs=jobs, prefetch=prefetch)
+    try:
+        with click.progressbar(results, length=n_assemblies, label="Serotyping assemblies") as bar:
+            for asm, row in bar:
+                records = row.pop("trace", None)
+                if trace_fh and records:
+                    write_records(trace_fh, records); trace_records.extend(records)
+                if csv_out: csv_out.write(row)
+                if parquet_out: parquet_out.write(row)
+                fname, status, final = Path(asm).name,row["status"],row["final_serotype"]
+                if status in ("STAGE1","STAGE2"): click.echo(f"[OK] {fname} => {final} ({status}{', cached' if row.get('cached') else ''})")
+                elif status == "ERROR": click.echo(f"[WARN] {fname} => ERROR ({row['error']})", err=True)
+                else: click.echo(f"[WARN] {fname} => {status}", err=True)
+                release(asm)
+    finally:
+        release_all()
+        if csv_out: csv_out.close()
+        if parquet_out: parquet_out.close()
+        if trace_fh: trace_fh.close()
+    if trace_fh:
+        click.echo(f"[INFO] Profile written: {profile_path}")
+        if trace_records: click.echo(summary_table(trace_records))
     if merged_csv:
-        mpath = Path(merged_csv); mpath.parent.mkdir(parents=True, exist_ok=True)
-        if not mpath.exists():
-            mpath.write_text("sample,stage1_top,ref_id,contig,contig_pos,strand,base,status,final_serotype\n")
-        with mpath.open("a") as fh:
-            for r in merged_rows:
-                fh.write(",".join(str(r.get(k,"")) for k in ["sample","stage1_top","ref_id","contig","contig_pos","strand","base","status","final_serotype"])+"\n")
-        click.echo(f"[INFO] Merged CSV written: {mpath}")
+        click.echo(f"[INFO] Merged CSV written: {merged_csv}")
+    if parquet_path:
+        click.echo(f"[INFO] Parquet written: {parquet_path}")
 
 if __name__=="__main__": main()
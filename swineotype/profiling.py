@@ -0,0 +1,131 @@
+"""
+Per-sample timing and resource trace (`--profile`).
+
+`trace_sample` opens a trace for one sample in the current context, and
+`step` records one timed step in it: wall time, CPU time of this process and
+of its finished children (makeblastdb, blastn), bytes read and written, and
+the peak RSS seen so far. Steps nest; each record names its parent step.
+Outside a trace `step` does nothing, so the hooks cost nothing unless
+profiling is on.
+
+CPU, I/O and RSS figures come from `getrusage` and `/proc/self/io`, which are
+per process. They are exact for one sample per process (the default and
+`--jobs` modes) and approximate when samples share a process concurrently.
+"""
+
+import contextvars
+import json
+import os
+import resource
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+_TRACE = contextvars.ContextVar("swineotype_trace", default=None)
+
+
+class Trace:
+    def __init__(self, sample: str):
+        self.sample = sample
+        self.records = []
+        self.stack = []
+
+
+def _proc_io() -> tuple[int, int]:
+    try:
+        with open("/proc/self/io", "r") as fh:
+            fields = dict(line.split(":", 1) for line in fh if ":" in line)
+        return int(fields.get("rchar", 0)), int(fields.get("wchar", 0))
+    except (OSError, ValueError):
+        return 0, 0
+
+
+def _snapshot() -> dict:
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    rchar, wchar = _proc_io()
+    return {"time": time.perf_counter(), "cpu": own.ru_utime + own.ru_stime,
+            "child_cpu": children.ru_utime + children.ru_stime,
+            # Children's reads/writes are only known as 512-byte block I/O.
+            "read": rchar + children.ru_inblock * 512, "write": wchar + children.ru_oublock * 512,
+            "rss": max(own.ru_maxrss, children.ru_maxrss)}
+
+
+@contextmanager
+def step(name: str):
+    """Records the enclosed block as step `name` of the current sample's trace, if any."""
+    trace = _TRACE.get()
+    if trace is None:
+        yield
+        return
+    parent = trace.stack[-1] if trace.stack else ""
+    trace.stack.append(name)
+    before = _snapshot()
+    try:
+        yield
+    finally:
+        after = _snapshot()
+        trace.stack.pop()
+        trace.records.append({
+            "sample": trace.sample, "step": name, "parent": parent, "pid": os.getpid(),
+            "wall_s": round(after["time"] - before["time"], 6),
+            "cpu_s": round(after["cpu"] - before["cpu"], 6),
+            "child_cpu_s": round(after["child_cpu"] - before["child_cpu"], 6),
+            "read_bytes": after["read"] - before["read"], "write_bytes": after["write"] - before["write"],
+            "peak_rss_kb": after["rss"],
+        })
+
+
+@contextmanager
+def trace_sample(sample: str, enabled=True):
+    """Collects the steps run in this block into a new `Trace` for `sample` (None when not `enabled`)."""
+    if not enabled:
+        yield None
+        return
+    trace = Trace(sample)
+    token = _TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        _TRACE.reset(token)
+
+
+@contextmanager
+def use_trace(trace: Trace|None):
+    """Makes an existing trace current again, e.g. to continue a sample's trace in another thread."""
+    if trace is None:
+        yield None
+        return
+    token = _TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        _TRACE.reset(token)
+
+
+def write_records(fh, records: list[dict]):
+    for rec in records:
+        fh.write(json.dumps(rec) + "\n")
+    fh.flush()
+
+
+def summary_table(records: list[dict], top: int = 10) -> str:
+    """Text table of the steps with the most total wall time and the slowest samples."""
+    by_step = defaultdict(list)
+    for rec in records:
+        by_step[rec["step"]].append(rec)
+    lines = [f"{'step':<24}{'n':>6}{'total_s':>10}{'mean_s':>9}{'max_s':>9}{'child_cpu_s':>13}{'io_MB':>9}"]
+    steps = sorted(by_step.items(), key=lambda kv: -sum(r["wall_s"] for r in kv[1]))[:top]
+    for name, recs in steps:
+        total = sum(r["wall_s"] for r in recs)
+        io_mb = sum(r["read_bytes"] + r["write_bytes"] for r in recs) / 1e6
+        lines.append(f"{name:<24}{len(recs):>6}{total:>10.2f}{total / len(recs):>9.3f}{max(r['wall_s'] for r in recs):>9.3f}"
+                     f"{sum(r['child_cpu_s'] for r in recs):>13.2f}{io_mb:>9.1f}")
+    per_sample = defaultdict(float)
+    peak = defaultdict(int)
+    for rec in records:
+        if not rec["parent"]: per_sample[rec["sample"]] += rec["wall_s"]
+        peak[rec["sample"]] = max(peak[rec["sample"]], rec["peak_rss_kb"])
+    lines += ["", f"{'sample':<40}{'wall_s':>10}{'peak_rss_MB':>13}"]
+    for sample, wall in sorted(per_sample.items(), key=lambda kv: -kv[1])[:top]:
+        lines.append(f"{sample:<40}{wall:>10.2f}{peak[sample] / 1024:>13.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,87 @@
+"""
+Compiled reference bundle.
+
+Everything the pipeline derives from the reference FASTAs (allele to serotype
+and gene-class maps, resolver IDs) is parsed once, saved as JSON under
+`<tmp_dir>/ref_db`, and loaded once per process. The bundle records the
+SHA-256 of both FASTAs and is rebuilt when either changes. Worker processes
+forked after `load_references` share the parent's copy; others load the JSON,
+which is much cheaper than re-parsing the FASTAs. JSON rather than pickle, as
+the scratch directory may be shared and loading a pickle can run code.
+"""
+
+import json
+import os
+from pathlib import Path
+
+from swineotype.stages import fasta_ids, parse_whitelist_headers
+from swineotype.utils import file_digest, temp_path
+
+# Bump when the bundle's contents or layout change.
+BUNDLE_VERSION = 2
+
+# {(whitelist digest, resolver digest): ReferenceBundle}
+_LOADED = {}
+
+
+class ReferenceBundle:
+    """Read-only view of the parsed reference panels."""
+
+    def __init__(self, whitelist_digest: str, resolver_digest: str, allele_to_type: dict,
+                 allele_to_geneclass: dict, resolver_ids, version: int = BUNDLE_VERSION):
+        self.version = version
+        self.whitelist_digest = whitelist_digest
+        self.resolver_digest = resolver_digest
+        self.allele_to_type, self.allele_to_geneclass = allele_to_type, allele_to_geneclass
+        self.resolver_ids = frozenset(resolver_ids)
+
+    @classmethod
+    def compile(cls, whitelist_fa, resolver_refs_fa) -> "ReferenceBundle":
+        """Parses the reference FASTAs."""
+        allele_to_type, allele_to_geneclass = parse_whitelist_headers(whitelist_fa)
+        return cls(file_digest(whitelist_fa), file_digest(resolver_refs_fa), allele_to_type,
+                   allele_to_geneclass, fasta_ids(resolver_refs_fa))
+
+    def to_json(self) -> dict:
+        return {"version": self.version, "whitelist_digest": self.whitelist_digest,
+                "resolver_digest": self.resolver_digest, "allele_to_type": self.allele_to_type,
+                "allele_to_geneclass": self.allele_to_geneclass, "resolver_ids": sorted(self.resolver_ids)}
+
+    def matches(self, whitelist_digest: str, resolver_digest: str) -> bool:
+        return (self.version == BUNDLE_VERSION and self.whitelist_digest == whitelist_digest
+                and self.resolver_digest == resolver_digest)
+
+
+def bundle_path(config: dict, whitelist_digest: str, resolver_digest: str) -> Path:
+    return Path(config["tmp_dir"]) / "ref_db" / f"bundle-v{BUNDLE_VERSION}-{whitelist_digest[:16]}{resolver_digest[:16]}.json"
+
+
+def _read_bundle(path: Path) -> ReferenceBundle|None:
+    try:
+        with open(path, "r") as fh:
+            return ReferenceBundle(**json.load(fh))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def load_references(config: dict) -> ReferenceBundle:
+    """The bundle for the configured reference FASTAs: from this process, from disk, or freshly compiled."""
+    whitelist_fa, resolver_fa = config["wzxwzy_fasta"], config["resolver_refs_fasta"]
+    key = (file_digest(whitelist_fa), file_digest(resolver_fa))
+    bundle = _LOADED.get(key)
+    if bundle is not None:
+        return bundle
+    path = bundle_path(config, *key)
+    bundle = _read_bundle(path)
+    if bundle is None or not bundle.matches(*key):
+        bundle = ReferenceBundle.compile(whitelist_fa, resolver_fa)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = temp_path(path)
+        try:
+            with open(tmp, "w") as fh:
+                json.dump(bundle.to_json(), fh)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+    _LOADED[key] = bundle
+    return bundle
@@ -0,0 +1,219 @@
+import csv
+import json
+import os
+from pathlib import Path
+
+from swineotype.utils import file_digest, temp_path
+
+# Bump when a change to the typing logic invalidates previously cached results.
+RESULT_CACHE_VERSION = 4
+
+# Settings that only affect where and how fast a sample is typed, not its result.
+_NON_RESULT_KEYS = {
+    "data_dir", "tmp_dir", "scratch_dir", "db_cache_max_bytes", "keep_debug", "gzip_debug",
+    "clean_temp", "result_cache", "result_cache_dir",
+    "scoring_engine", "profile", "wzxwzy_fasta", "resolver_refs_fasta",
+}
+
+
+def _jsonable(value):
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return value
+
+
+def effective_config(config: dict) -> dict:
+    """
+    The subset of `config` that can change a typing result, in JSON-serializable form.
+    `batch_size` is part of it: a batch DB is larger than one assembly's, which
+    shifts e-values. Sizes 0 and 1 both mean per-sample searches and share a key.
+    So is `combined_search`: under `ref_db` its DB also holds the resolver refs,
+    and it always searches with the last `blast_tasks` task only.
+    """
+    effective = {k: _jsonable(v) for k, v in sorted(config.items()) if k not in _NON_RESULT_KEYS}
+    if effective.get("batch_size", 0) <= 1: effective["batch_size"] = 0
+    return effective
+
+
+def result_cache_key(assembly: str, config: dict) -> str:
+    """Key of a sample's result: assembly content, reference FASTA contents and effective config."""
+    import hashlib
+    payload = {
+        "version": RESULT_CACHE_VERSION,
+        "assembly": file_digest(assembly),
+        "wzxwzy_fasta": file_digest(config["wzxwzy_fasta"]),
+        "resolver_refs_fasta": file_digest(config["resolver_refs_fasta"]),
+        "config": effective_config(config),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """One JSON file per typed sample, stored under `<cache_dir>/<key[:2]>/<key>.json`."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> dict|None:
+        try:
+            with open(self._path(key), "r") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, row: dict):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = temp_path(path)
+        try:
+            with open(tmp, "w") as fh:
+                json.dump(row, fh)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+# Statuses of a sample that was typed; an ERROR row never replaces one of these.
+TYPED_STATUSES = ("STAGE1", "STAGE2")
+
+
+def replaces_row(old: dict|None, new: dict) -> bool:
+    """Whether `new` should take the place of `old` as a sample's row: it does unless it is an ERROR and `old` was typed."""
+    return old is None or new.get("status") != "ERROR" or old.get("status") not in TYPED_STATUSES
+
+
+def merge_rows_into_csv(csv_path, rows: list[dict], columns: list[str]):
+    """
+    Merges result rows into a summary CSV, keeping one row per sample.
+
+    Rows for samples already in the file replace the old row in place (see
+    `replaces_row`); new samples are appended in the given order. Columns the
+    file already has but `columns` lacks (e.g. `app_serovar`) are preserved.
+    """
+    csv_path = Path(csv_path)
+    by_sample, fieldnames = {}, list(columns)
+    if csv_path.exists() and csv_path.stat().st_size:
+        with open(csv_path, "r", newline="") as fh:
+            reader = csv.DictReader(fh)
+            fieldnames += [c for c in (reader.fieldnames or []) if c not in fieldnames]
+            for row in reader:
+                if replaces_row(by_sample.get(row.get("sample", "")), row):
+                    by_sample[row.get("sample", "")] = row
+    for row in rows:
+        if replaces_row(by_sample.get(str(row.get("sample", ""))), row):
+            by_sample[str(row.get("sample", ""))] = row
+    tmp = temp_path(csv_path)
+    try:
+        with open(tmp, "w", newline="") as fh:
+            writer = csv.DictWriter(fh, fieldnames=fieldnames, extrasaction="ignore", restval="")
+            writer.writeheader()
+            writer.writerows(by_sample.values())
+        os.replace(tmp, csv_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+class CsvResultWriter:
+    """
+    Appends result rows to a summary CSV as samples finish, flushing after each
+    row, so an interrupted run keeps everything typed so far. `close` compacts
+    the file to one row per sample, as `merge_rows_into_csv` would.
+    """
+
+    def __init__(self, csv_path, columns: list[str]):
+        self.path, self.columns = Path(csv_path), list(columns)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fieldnames, header = list(columns), None
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, "r", newline="") as fh:
+                header = next(csv.reader(fh), [])
+            fieldnames += [c for c in header if c not in fieldnames]
+            if header != fieldnames:  # widen the header before appending rows with the new columns
+                merge_rows_into_csv(self.path, [], self.columns)
+            with open(self.path, "rb") as fh:
+                fh.seek(-1, os.SEEK_END)
+                missing_newline = fh.read(1) not in b"\r\n"
+        self._fh = open(self.path, "a", newline="")
+        self._writer = csv.DictWriter(self._fh, fieldnames=fieldnames, extrasaction="ignore", restval="")
+        if header is None:
+            self._writer.writeheader()
+        elif missing_newline:
+            self._fh.write("\n")
+        self._fh.flush()
+
+    def write(self, row: dict):
+        self._writer.writerow(row)
+        self._fh.flush()
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+            merge_rows_into_csv(self.path, [], self.columns)
+
+
+# Typed columns of the Parquet output; "scores" is a map of serotype to stage-1 bitscore total.
+PARQUET_COLUMNS = [
+    ("sample", "string"), ("status", "string"), ("final_serotype", "string"),
+    ("stage1_top", "string"), ("stage1_second", "string"), ("stage1_fraction", "float64"),
+    ("stage1_delta", "float64"), ("stage1_tier", "string"), ("stage1_scores", "scores"), ("ref_id", "string"), ("contig", "string"),
+    ("contig_pos", "int64"), ("strand", "string"), ("base", "string"), ("stage2_method", "string"), ("blast_task", "string"),
+    ("n_contigs", "int64"), ("total_length", "int64"), ("n50", "int64"), ("cached", "bool"), ("error", "string"),
+]
+
+
+def _typed(value, kind: str):
+    if value is None or value == "":
+        return False if kind == "bool" else None
+    if kind == "int64": return int(value)
+    if kind == "float64": return float(value)
+    if kind == "bool": return bool(value)
+    if kind == "scores":
+        pairs = [item.rsplit("=", 1) for item in str(value).split(";") if "=" in item]
+        return [(st, float(score)) for st, score in pairs]
+    return str(value)
+
+
+class ParquetResultWriter:
+    """
+    Streams result rows into a Parquet file with typed columns (PARQUET_COLUMNS),
+    one row group per `row_group_size` rows. The file is written under a
+    temporary name and moved into place by `close`. Requires pyarrow.
+    """
+
+    def __init__(self, path, row_group_size: int = 1000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow") from exc
+        self._pa = pa
+        types = {"string": pa.string(), "int64": pa.int64(), "float64": pa.float64(), "bool": pa.bool_(),
+                 "scores": pa.map_(pa.string(), pa.float64())}
+        self.schema = pa.schema([(name, types[kind]) for name, kind in PARQUET_COLUMNS])
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = temp_path(self.path)
+        self._writer = pq.ParquetWriter(self._tmp, self.schema)
+        self.row_group_size = row_group_size
+        self._buffer = []
+
+    def write(self, row: dict):
+        self._buffer.append({name: _typed(row.get(name), kind) for name, kind in PARQUET_COLUMNS})
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._writer.write_table(self._pa.Table.from_pylist(self._buffer, schema=self.schema))
+            self._buffer = []
+
+    def close(self):
+        if self._writer is not None:
+            self.flush()
+            self._writer.close(); self._writer = None
+            os.replace(self._tmp, self.path)
@@ -0,0 +1,233 @@
+"""
+Stage-1 scoring.
+
+`score_stage1_hsps` scores one sample's HSPs with plain Python loops. The
+vectorized engine computes the same per-allele coverage (union of HSP
+intervals on the allele), length-weighted identity, filter and per-serotype
+bitscore totals over HSP columns held in NumPy arrays, for many samples at
+once. Sums are accumulated with `np.add.at`, which adds element by element in
+input order. The Python loops add with `+=` in that same order rather than
+with `sum()`, which uses compensated summation for floats from Python 3.12
+on, so scores and decisions are bit-identical.
+"""
+
+from collections import defaultdict
+
+import click
+
+
+def score_stage1_hsps(hsps, allele_to_type: dict, config: dict) -> dict:
+    hits = defaultdict(list)
+    for h in hsps:
+        # Group by allele ONLY (ignore contig to handle genes split across contigs)
+        hits[h.allele].append(h)
+
+    score_by_type = defaultdict(float)
+    
+    best_rejected_info = None
+    partial_hits = False
+
+    for qseqid, hsp_list in hits.items():
+        # 1. Calculate total query coverage by merging intervals
+        intervals = sorted([(h.astart, h.aend) for h in hsp_list])
+        merged = []
+        if intervals:
+            curr_start, curr_end = intervals[0]
+            for next_start, next_end in intervals[1:]:
+                if next_start <= curr_end + 1: # overlapping or adjacent
+                    curr_end = max(curr_end, next_end)
+                else:
+                    merged.append((curr_start, curr_end))
+                    curr_start, curr_end = next_start, next_end
+            merged.append((curr_start, curr_end))
+        
+        covered_len = sum(e - s + 1 for s, e in merged)
+        qlen = hsp_list[0].alen
+        coverage = (covered_len / qlen) if qlen else 0.0
+
+        # 2. Calculate weighted PID (length-weighted); float sums use += to match the NumPy engine
+        total_aligned_len = sum(h.length for h in hsp_list)
+        weighted_pid_sum = 0.0
+        for h in hsp_list:
+            weighted_pid_sum += h.pident * h.length
+        avg_pid = (weighted_pid_sum / total_aligned_len) if total_aligned_len else 0.0
+
+        # 3. Filter; a rejected or partly covered allele may score with a more sensitive BLAST task
+        if avg_pid < config["min_pid"] or coverage < 1.0:
+            partial_hits = True
+        if avg_pid < config["min_pid"] or coverage < config["min_cov"]:
+            # Diagnostic for best rejected
+            info = f"{qseqid}: Cov={coverage:.2f} Pid={avg_pid:.1f}"
+            if best_rejected_info is None or coverage > float(best_rejected_info.split("Cov=")[1].split()[0]):
+                 best_rejected_info = info
+            continue
+
+        # 4. Sum bitscore
+        total_bitscore = 0.0
+        for h in hsp_list:
+            total_bitscore += h.bitscore
+        
+        st = allele_to_type.get(qseqid)
+        if st: 
+            score_by_type[st] += total_bitscore
+    
+    if not score_by_type and best_rejected_info:
+        click.echo(f"[DEBUG] No hits passed filter. Best rejected: {best_rejected_info}", err=True)
+
+    return summarize_stage1(score_by_type, config, partial_hits)
+
+
+def summarize_stage1(score_by_type: dict, config: dict, partial_hits: bool = False) -> dict:
+    """
+    Call and confidence from per-serotype scores. `partial_hits` records that
+    some allele's hits failed `min_pid`/`min_cov` or did not cover it fully.
+    """
+    ordered = sorted(score_by_type.items(), key=lambda kv: kv[1], reverse=True)
+    top, top_score = (ordered[0][0], ordered[0][1]) if ordered else (None, 0.0)
+    second, second_score = (ordered[1][0], ordered[1][1]) if len(ordered) > 1 else (None, 0.0)
+    total = 0.0
+    for score in score_by_type.values():
+        total += score
+    fraction, delta = (top_score/total if total else 0.0), top_score-second_score
+    decisive = (fraction >= config["plurality"]) and (delta >= config["delta"])
+    must_stage2_for_pair = bool(top in config["ambig_set"])
+    return {"scores":score_by_type,"top":top,"second":second,"fraction":fraction,
+            "delta":delta,"decisive":decisive,"must_stage2_for_pair":must_stage2_for_pair,
+            "partial_hits":bool(partial_hits)}
+
+
+_NUMPY = None
+
+
+def _numpy():
+    """NumPy, imported on first use (it is an optional dependency), or None if it is not installed."""
+    global _NUMPY
+    if _NUMPY is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _NUMPY = numpy
+    return _NUMPY or None
+
+
+def resolve_engine(config: dict, n_samples: int = 1) -> str:
+    """
+    Scoring engine to use for `n_samples` samples scored together: "numpy" or
+    "python" (config `scoring_engine`: auto, numpy or python). `auto` uses the
+    loop for a single sample, where importing NumPy and building the columns
+    costs more than vectorizing saves.
+    """
+    engine = config.get("scoring_engine", "auto")
+    if engine == "auto":
+        return "numpy" if n_samples > 1 and _numpy() is not None else "python"
+    if engine == "numpy" and _numpy() is None:
+        raise ImportError("scoring_engine 'numpy' requires NumPy: pip install numpy")
+    return engine
+
+
+def hsp_columns(hsp_lists) -> dict:
+    """Column arrays over the HSPs of several samples, with a `sample` column giving each row's sample index."""
+    np = _numpy()
+    sample, rows = [], []
+    for i, hsps in enumerate(hsp_lists):
+        hsps = list(hsps)
+        sample.extend([i] * len(hsps))
+        rows.extend(hsps)
+    return {
+        "sample": np.asarray(sample, dtype=np.int64),
+        "allele": np.asarray([h.allele for h in rows], dtype=object),
+        "astart": np.fromiter((h.astart for h in rows), dtype=np.int64, count=len(rows)),
+        "aend": np.fromiter((h.aend for h in rows), dtype=np.int64, count=len(rows)),
+        "length": np.fromiter((h.length for h in rows), dtype=np.int64, count=len(rows)),
+        "alen": np.fromiter((h.alen for h in rows), dtype=np.int64, count=len(rows)),
+        "pident": np.fromiter((h.pident for h in rows), dtype=np.float64, count=len(rows)),
+        "bitscore": np.fromiter((h.bitscore for h in rows), dtype=np.float64, count=len(rows)),
+    }
+
+
+def score_stage1_columns(cols: dict, n_samples: int, allele_to_type: dict, config: dict) -> list[dict]:
+    """Stage-1 results for `n_samples` samples from HSP columns (see `hsp_columns`)."""
+    np = _numpy()
+    n = len(cols["sample"])
+    if n == 0:
+        return [summarize_stage1(defaultdict(float), config) for _ in range(n_samples)]
+
+    # Groups are (sample, allele) pairs, numbered in order of first appearance.
+    names, allele_code = np.unique(cols["allele"], return_inverse=True)
+    key = cols["sample"] * len(names) + allele_code
+    _, first_row, inverse = np.unique(key, return_index=True, return_inverse=True)
+    order = np.argsort(first_row, kind="stable")
+    rank = np.empty_like(order); rank[order] = np.arange(len(order))
+    group = rank[inverse]
+    n_groups = len(order)
+    group_first = first_row[order]
+    group_sample = cols["sample"][group_first]
+    group_allele = names[allele_code[group_first]]
+
+    # 1. Coverage: union of [astart, aend] intervals per group.
+    idx = np.lexsort((cols["aend"], cols["astart"], group))
+    g, s, e = group[idx], cols["astart"][idx], cols["aend"][idx]
+    offset = g * (int(cols["aend"].max()) + 2)  # keeps each group's intervals apart in one running max
+    s_off, run_end = s + offset, np.maximum.accumulate(e + offset)
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = (g[1:] != g[:-1]) | (s_off[1:] > run_end[:-1] + 1)
+    seg_first = np.flatnonzero(starts)
+    seg_last = np.append(seg_first[1:] - 1, n - 1)
+    covered = np.zeros(n_groups, dtype=np.int64)
+    np.add.at(covered, g[seg_first], run_end[seg_last] - s_off[seg_first] + 1)
+    qlen = cols["alen"][group_first]
+    coverage = np.zeros(n_groups, dtype=np.float64)
+    np.divide(covered, qlen, out=coverage, where=qlen != 0)
+
+    # 2. Length-weighted identity.
+    aligned = np.zeros(n_groups, dtype=np.int64)
+    np.add.at(aligned, group, cols["length"])
+    weighted = np.zeros(n_groups, dtype=np.float64)
+    np.add.at(weighted, group, cols["pident"] * cols["length"])
+    avg_pid = np.zeros(n_groups, dtype=np.float64)
+    np.divide(weighted, aligned, out=avg_pid, where=aligned != 0)
+
+    # 3. Filter, 4. bitscore sums.
+    passed = ~((avg_pid < config["min_pid"]) | (coverage < config["min_cov"]))
+    bitscore = np.zeros(n_groups, dtype=np.float64)
+    np.add.at(bitscore, group, cols["bitscore"])
+
+    # Per-serotype totals, accumulated over passing groups in first-appearance order.
+    partial = np.bincount(group_sample[~passed | (coverage < 1.0)], minlength=n_samples) > 0
+    types = np.array([allele_to_type.get(a) or "" for a in group_allele], dtype=object)
+    scored = np.flatnonzero(passed & (types != ""))
+    type_names, type_code = np.unique(types[scored], return_inverse=True)
+    totals = np.zeros(n_samples * len(type_names), dtype=np.float64)
+    np.add.at(totals, group_sample[scored] * len(type_names) + type_code, bitscore[scored])
+
+    results = []
+    for i in range(n_samples):
+        score_by_type = defaultdict(float)
+        for j in scored[group_sample[scored] == i]:
+            st = types[j]
+            if st not in score_by_type:
+                score_by_type[st] = float(totals[i * len(type_names) + np.searchsorted(type_names, st)])
+        if not score_by_type:
+            _report_best_rejected(i, group_sample, group_allele, coverage, avg_pid, passed)
+        results.append(summarize_stage1(score_by_type, config, partial[i]))
+    return results
+
+
+def _report_best_rejected(sample: int, group_sample, group_allele, coverage, avg_pid, passed):
+    best_rejected_info = None
+    for j in range(len(group_sample)):
+        if group_sample[j] != sample or passed[j]: continue
+        info = f"{group_allele[j]}: Cov={float(coverage[j]):.2f} Pid={float(avg_pid[j]):.1f}"
+        if best_rejected_info is None or coverage[j] > float(best_rejected_info.split("Cov=")[1].split()[0]):
+            best_rejected_info = info
+    if best_rejected_info:
+        click.echo(f"[DEBUG] No hits passed filter. Best rejected: {best_rejected_info}", err=True)
+
+
+def score_stage1_many(hsp_lists, allele_to_type: dict, config: dict) -> list[dict]:
+    """Stage-1 results for several samples' HSP lists, with the configured engine."""
+    hsp_lists = [list(hsps) for hsps in hsp_lists]
+    if resolve_engine(config, len(hsp_lists)) == "python":
+        return [score_stage1_hsps(hsps, allele_to_type, config) for hsps in hsp_lists]
+    return score_stage1_columns(hsp_columns(hsp_lists), len(hsp_lists), allele_to_type, config)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+swineotype-serve — long-running S. suis typing service.
+
+Loads the config, checks the tools and compiles the references once, then
+types assemblies sent over HTTP on localhost or a Unix socket:
+
+    POST /type        {"assembly": "/path/a.fasta"}   -> result row (waits)
+    POST /jobs        {"assembly": "/path/a.fasta"}   -> {"id": ...} (202)
+    GET  /jobs/<id>                                    -> {"state": ..., "row": ...}
+    GET  /health                                       -> queue and worker status
+
+Rows are the records `process_one` returns. Jobs wait in a bounded queue
+(503 when full) and are run by a fixed pool of worker threads; jobs for
+the same sample name run one at a time, as they share scratch files.
+"""
+
+import itertools
+import json
+import os
+import queue
+import socketserver
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import click
+
+from swineotype.config import load_config
+from swineotype.main import safe_process_one
+from swineotype.references import load_references
+from swineotype.stages import prepare_reference_dbs
+from swineotype.utils import ensure_tool
+
+
+class Job:
+    def __init__(self, job_id: str, assembly: str):
+        self.id, self.assembly = job_id, assembly
+        self.state, self.row = "queued", None
+        self.done = threading.Event()
+
+    def as_dict(self) -> dict:
+        return {"id": self.id, "assembly": self.assembly, "state": self.state, "row": self.row}
+
+
+class TypingService:
+    """A bounded job queue in front of `workers` threads that type assemblies with a shared, warm config."""
+
+    def __init__(self, config: dict, out_dir: Path, threads: int = 1, workers: int = 1, queue_size: int = 16,
+                 keep_jobs: int = 1000):
+        self.config, self.out_dir, self.threads = config, Path(out_dir), threads
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.jobs, self.keep_jobs = OrderedDict(), keep_jobs
+        self._ids, self._lock = itertools.count(1), threading.Lock()
+        self.workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for w in self.workers: w.start()
+
+    def submit(self, assembly: str) -> Job:
+        """Queues an assembly; raises queue.Full when the queue is at capacity."""
+        with self._lock:
+            job = Job(str(next(self._ids)), assembly)
+            self.queue.put_nowait(job)
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.keep_jobs:
+                self.jobs.popitem(last=False)
+        return job
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None: return
+            job.state = "running"
+            row = safe_process_one(job.assembly, self.out_dir, self.threads, self.config)
+            row.pop("trace", None)
+            job.row, job.state = row, "done"
+            job.done.set()
+
+    def status(self) -> dict:
+        return {"status": "ok", "queued": self.queue.qsize(), "capacity": self.queue.maxsize,
+                "workers": len(self.workers)}
+
+    def close(self):
+        for _ in self.workers: self.queue.put(None)
+        for w in self.workers: w.join()
+
+
+class Handler(BaseHTTPRequestHandler):
+    service: TypingService = None
+
+    def _send(self, code: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _assembly(self) -> str|None:
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            assembly = json.loads(self.rfile.read(length) or b"{}").get("assembly")
+        except (ValueError, AttributeError):
+            assembly = None
+        if not assembly or not os.path.isfile(assembly):
+            self._send(400, {"error": f"assembly not found: {assembly!r}"})
+            return None
+        return os.path.abspath(assembly)
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self._send(200, self.service.status())
+        if self.path.startswith("/jobs/"):
+            job = self.service.jobs.get(self.path[len("/jobs/"):])
+            return self._send(200, job.as_dict()) if job else self._send(404, {"error": "unknown job"})
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/type", "/jobs"):
+            return self._send(404, {"error": "not found"})
+        assembly = self._assembly()
+        if assembly is None: return
+        try:
+            job = self.service.submit(assembly)
+        except queue.Full:
+            return self._send(503, {"error": "queue full, retry later"})
+        if self.path == "/jobs":
+            return self._send(202, job.as_dict())
+        job.done.wait()
+        self._send(200, job.row)
+
+    def address_string(self) -> str:
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, fmt, *args):
+        click.echo(f"[INFO] {self.address_string()} {fmt % args}", err=True)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: TypingService, host: str = "127.0.0.1", port: int = 8765, socket_path: str|None = None):
+    handler = type("BoundHandler", (Handler,), {"service": service})
+    if socket_path:
+        Path(socket_path).unlink(missing_ok=True)
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+@click.command()
+@click.option("--out_dir", required=True, type=click.Path(), help="Output directory for per-sample files")
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address to listen on (localhost only by default)")
+@click.option("--port", default=8765, show_default=True, type=int, help="TCP port")
+@click.option("--socket", "socket_path", default=None, type=click.Path(), help="Listen on this Unix socket instead of TCP")
+@click.option("--workers", default=2, show_default=True, type=click.IntRange(min=1), help="Assemblies typed concurrently")
+@click.option("--threads", default=2, show_default=True, type=click.IntRange(min=1), help="BLAST threads per worker")
+@click.option("--queue_size", default=16, show_default=True, type=click.IntRange(min=1), help="Jobs that may wait before requests get 503")
+@click.option("--config", default=None, type=click.Path(exists=True), help="Path to a custom config.yaml file")
+def main(out_dir, host, port, socket_path, workers, threads, queue_size, config):
+    """Serve S. suis typing requests with warm config, references and caches."""
+    config = load_config(config)
+    for tool in ("blastn", "makeblastdb"): ensure_tool(tool)
+    prepare_reference_dbs(config)
+    load_references(config)
+    service = TypingService(config, Path(out_dir).resolve(), threads, workers, queue_size)
+    server = make_server(service, host, port, socket_path)
+    click.echo(f"[INFO] swineotype-serve listening on {socket_path or f'http://{host}:{server.server_address[1]}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path: Path(socket_path).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Splitting a run over cluster nodes, and merging the shards' results.
+
+`--shard i/N` (i from 1 to N) keeps a deterministic subset of the expanded
+`--assembly` list. Files are dealt out by size, largest first, each to the
+shard with the least data so far (LPT), so the shards finish at about the
+same time. Archive members cannot be sized without reading the archive, so
+they are assigned by a hash of their path inside it. Every node reads each
+archive but extracts only its own members.
+
+`swineotype-merge` combines the shards' summary CSVs into one, with one row
+per sample in `--assembly` order, and reports samples missing from all
+shards.
+"""
+
+import csv
+import hashlib
+import heapq
+import os
+from collections import Counter
+from pathlib import Path
+
+import click
+
+from swineotype.archives import STDIN, is_archive, list_members, member_sample_name
+from swineotype.utils import sample_name, temp_path
+
+
+def parse_shard(ctx, param, value) -> tuple[int, int]|None:
+    """Click callback turning "i/N" into (i, N)."""
+    if value is None: return None
+    try:
+        index, count = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise click.BadParameter("expected i/N, e.g. 3/16")
+    if not 1 <= index <= count:
+        raise click.BadParameter(f"shard index must be between 1 and {count}")
+    return index, count
+
+
+def lpt_shards(paths: list[str], count: int) -> list[int]:
+    """Shard (0-based) of each path: largest files first, each to the currently lightest shard."""
+    sizes = [os.path.getsize(p) if os.path.exists(p) else 0 for p in paths]
+    loads, shard_of = [(0, s) for s in range(count)], [0] * len(paths)
+    for i in sorted(range(len(paths)), key=lambda i: (-sizes[i], paths[i])):
+        load, s = heapq.heappop(loads)
+        shard_of[i] = s
+        heapq.heappush(loads, (load + sizes[i], s))
+    return shard_of
+
+
+def member_in_shard(member: str, index: int, count: int) -> bool:
+    return int(hashlib.sha1(member.encode()).hexdigest()[:16], 16) % count == index - 1
+
+
+def select_shard(paths: list[str], index: int, count: int) -> list[str]:
+    """The files of shard `index`, in input order. Archives are kept; their members are filtered on extraction."""
+    files = [p for p in paths if not is_archive(p)]
+    mine = {p for p, s in zip(files, lpt_shards(files, count)) if s == index - 1}
+    return [p for p in paths if is_archive(p) or p in mine]
+
+
+def expected_samples(paths: list[str]) -> list[str]:
+    """
+    Sample names of the expanded `--assembly` list, in run order, with archive
+    members listed in place. Repeats of the same input are listed once; two
+    inputs with the same sample name raise a UsageError, as the run rejects them.
+    """
+    seen = {}
+    for p in paths:
+        if p == STDIN:
+            raise click.UsageError("stdin inputs cannot be listed again; pass the archive path to --assembly")
+        source = os.path.realpath(p)
+        inputs = ([(member_sample_name(m), f"{source}:{m}") for m in list_members(p)] if is_archive(p)
+                  else [(sample_name(p), source)])
+        for name, src in inputs:
+            if name in seen and seen[name] != src:
+                raise click.UsageError(f"{seen[name]} and {src} have the same sample name {name!r}")
+            seen.setdefault(name, src)
+    return list(seen)
+
+
+def merge_shard_csvs(csv_paths: list[str], out_csv, expected: list[str]|None = None) -> tuple[list[str], list[str]]:
+    """
+    Writes one row per sample from the shard CSVs to `out_csv`, in `expected`
+    order when given (other samples follow in the order they were read). A
+    successful row wins over an ERROR row for the same sample; otherwise the
+    last one read wins. Returns the expected samples that are missing and the
+    samples that were not expected. Sample names are the keys, so `expected`
+    must not name a sample twice (ValueError).
+    """
+    duplicates = sorted(s for s, n in Counter(expected or []).items() if n > 1)
+    if duplicates:
+        raise ValueError(f"expected samples listed more than once: {', '.join(duplicates[:10])}")
+    rows, fieldnames = {}, []
+    for path in csv_paths:
+        with open(path, "r", newline="") as fh:
+            reader = csv.DictReader(fh)
+            fieldnames += [c for c in (reader.fieldnames or []) if c not in fieldnames]
+            for row in reader:
+                old = rows.get(row.get("sample", ""))
+                if old is None or old.get("status") == "ERROR" or row.get("status") != "ERROR":
+                    rows[row.get("sample", "")] = row
+    order = list(expected or [])
+    missing = [s for s in order if s not in rows]
+    wanted = set(order)
+    unexpected = [s for s in rows if s not in wanted] if expected is not None else []
+    out_csv = Path(out_csv); out_csv.parent.mkdir(parents=True, exist_ok=True)
+    tmp = temp_path(out_csv)
+    try:
+        with open(tmp, "w", newline="") as fh:
+            writer = csv.DictWriter(fh, fieldnames=fieldnames, extrasaction="ignore", restval="")
+            writer.writeheader()
+            writer.writerows(rows[s] for s in (order + unexpected if expected is not None else rows) if s in rows)
+        os.replace(tmp, out_csv)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return missing, unexpected
+
+
+@click.command()
+@click.argument("shard_csvs", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--out", "out_csv", required=True, type=click.Path(), help="Merged summary CSV to write")
+@click.option("--assembly", multiple=True, help="The --assembly values of the sharded run, to order rows and check completeness")
+@click.option("--allow_missing", is_flag=True, default=False, help="Exit with status 0 even if samples are missing")
+def merge(shard_csvs, out_csv, assembly, allow_missing):
+    """Merge the summary CSVs of a sharded swineotype run."""
+    from swineotype.main import expand_globs
+    expected = expected_samples(expand_globs(list(assembly))) if assembly else None
+    missing, unexpected = merge_shard_csvs(list(shard_csvs), out_csv, expected)
+    click.echo(f"[INFO] Merged {len(shard_csvs)} shard file(s) into {out_csv}")
+    if unexpected:
+        click.echo(f"[WARN] {len(unexpected)} sample(s) not in --assembly: {', '.join(unexpected[:10])}", err=True)
+    if missing:
+        click.echo(f"[WARN] {len(missing)} of {len(expected)} sample(s) missing: {', '.join(missing[:10])}", err=True)
+        if not allow_missing:
+            raise click.ClickException("merged results are incomplete")
+
+
+if __name__ == "__main__":
+    merge()
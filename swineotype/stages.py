@@ -1,11 +1,17 @@
 from __future__ import annotations
 
-from collections import defaultdict
+import os
+from functools import lru_cache
 from pathlib import Path
+from typing import NamedTuple
 
-from swineotype.blast import run_blast, make_db_if_needed, run
+import click
 
-from swineotype.utils import ensure_tool, gzip_file
+from swineotype.blast import stream_blast, make_db_if_needed, make_ref_db, Hsp, iter_hsps, parse_blast_tasks
+from swineotype.fasta import FastaIndex
+from swineotype.scoring import score_stage1_many, summarize_stage1
+
+from swineotype.utils import ensure_tool, gzip_file, file_digest, temp_path
 
 
 def reverse_complement(base: str) -> str:
@@ -31,111 +37,198 @@ def parse_whitelist_headers(fasta_path: str):
             allele_to_geneclass[allele_id] = geneclass
     return allele_to_type, allele_to_geneclass
 
-def stage1_score(assembly_fa: str, whitelist_fa: str, threads: int, run_dir: Path, config: dict):
+OUTFMT_ASM_DB = "6 qseqid sseqid pident length qlen evalue bitscore qstart qend sstart send"
+OUTFMT_REF_DB = "6 qseqid sseqid pident length slen evalue bitscore qstart qend sstart send"
+
+def blast_tasks(config: dict) -> list[str]:
+    """The `blast_tasks` cascade, fastest first; searches that do not cascade use the last (most sensitive) task."""
+    return parse_blast_tasks(config.get("blast_tasks", "blastn"))
+
+def uses_ref_db(config: dict) -> bool:
+    """True when references are indexed once and the assembly is the BLAST query."""
+    return config.get("search_mode", "asm_db") == "ref_db"
+
+def parse_hsps(lines, ref_as_db: bool = False) -> list[Hsp]:
+    """Parses BLAST tabular lines into allele-centric `Hsp` records (see `blast.parse_hsp_line`)."""
+    return list(iter_hsps(lines, ref_as_db))
+
+def debug_tsv_path(run_dir: Path, name: str, config: dict) -> Path|None:
+    """Where the raw BLAST output of a search is teed to, or None if `keep_debug` is off."""
+    if not config["keep_debug"]: return None
+    return Path(run_dir) / (f"{name}.gz" if config["gzip_debug"] else name)
+
+def prepare_reference_dbs(config: dict):
+    """Builds the reference DBs up front so concurrent jobs only ever read them."""
+    if config.get("combined_search"):
+        combined_reference_fasta(config)
+    if uses_ref_db(config):
+        ensure_tool("makeblastdb")
+        if config.get("combined_search"):
+            make_ref_db(combined_reference_fasta(config), config["tmp_dir"])
+        else:
+            for refs_fa in (config["wzxwzy_fasta"], config["resolver_refs_fasta"]):
+                make_ref_db(refs_fa, config["tmp_dir"])
+
+def count_fasta_records(fasta_path) -> int:
+    with open(fasta_path, "r") as fh:
+        return sum(1 for line in fh if line.startswith(">"))
+
+def search_references(assembly_fa: str, refs_fa, threads: int, config: dict,
+                      db_prefix: str|None = None, n_samples: int = 1, tee: Path|None = None):
+    """
+    Runs the BLAST search of a reference panel against one assembly.
+
+    In the default `asm_db` mode a DB is built over the assembly and the
+    references are the query. In `ref_db` mode the reference panel is indexed
+    once (see `blast.make_ref_db`) and the assembly is streamed as the query,
+    which avoids a `makeblastdb` run per sample.
+    `db_prefix`/`n_samples` are used by batch mode, where `assembly_fa` holds the
+    contigs of several samples and the DB over it is built by the caller.
+    Returns an iterator over the tabular lines as BLAST produces them (also
+    written to `tee` if given) and whether they are in `ref_db` orientation.
+    The BLAST task is `config["blast_task"]` when a cascade sets it.
+    """
+    gz = bool(tee) and str(tee).endswith(".gz")
+    task = config.get("blast_task") or blast_tasks(config)[-1]
+    if uses_ref_db(config):
+        db_prefix = make_ref_db(refs_fa, config["tmp_dir"])
+        max_targets = max(50, count_fasta_records(refs_fa))
+        return stream_blast(assembly_fa, db_prefix, threads, OUTFMT_REF_DB, max_target_seqs=max_targets, tee=tee, gzip_tee=gz,
+                            task=task), True
+    if db_prefix is None:
+        db_prefix = make_db_if_needed(assembly_fa, config["tmp_dir"], config.get("db_cache_max_bytes", 0))
+    # max_target_seqs is per query: in batch mode keep up to 50 contigs per allele for every sample.
+    return stream_blast(str(refs_fa), db_prefix, threads, OUTFMT_ASM_DB, max_target_seqs=50 * n_samples, tee=tee, gzip_tee=gz,
+                        task=task), False
+
+def fasta_ids(fasta_path) -> set[str]:
+    with open(fasta_path, "r") as fh:
+        return {line[1:].split()[0] for line in fh if line.startswith(">") and line[1:].strip()}
+
+def combined_reference_fasta(config: dict) -> Path:
+    """
+    Whitelist and resolver refs concatenated into one FASTA, so both panels can
+    be searched in a single BLAST run. Written once per reference content.
+    """
+    parts = [Path(config["wzxwzy_fasta"]), Path(config["resolver_refs_fasta"])]
+    key = file_digest(parts[0])[:16] + file_digest(parts[1])[:16]
+    dest = Path(config["tmp_dir"]) / "ref_db" / f"combined-{key}.fasta"
+    if not dest.exists():
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = temp_path(dest)
+        try:
+            with open(tmp, "wb") as out:
+                for part in parts:
+                    data = part.read_bytes()
+                    out.write(data if data.endswith(b"\n") else data + b"\n")
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+    return dest
+
+def search_combined(assembly_fa: str, threads: int, run_dir: Path, config: dict, refs=None) -> dict:
+    """
+    Searches the whitelist and the resolver refs against an assembly in one
+    BLAST run and routes the HSPs to the stage that needs them.
+    Returns {"stage1": [...], "stage2": [...]} for the `hsps=` argument of
+    `stage1_score` and `stage2_resolver_call`.
+    """
     ensure_tool("blastn"); ensure_tool("makeblastdb")
-    allele_to_type, allele_to_geneclass = parse_whitelist_headers(whitelist_fa)
-    db_prefix = make_db_if_needed(assembly_fa, config["tmp_dir"])
-    outfmt = "6 qseqid sseqid pident length qlen evalue bitscore qstart qend sstart send"
-    tsv_text = run_blast(whitelist_fa, db_prefix, threads, outfmt)
-    stage1_tsv = run_dir / "wzxwzy_vs_asm.tsv"
-    if config["keep_debug"]:
-        stage1_tsv.write_text(tsv_text + ("\n" if tsv_text else ""))
+    lines, ref_as_db = search_references(assembly_fa, combined_reference_fasta(config), threads, config,
+                                         tee=debug_tsv_path(run_dir, "combined_vs_asm.tsv", config))
+    return route_hsps(iter_hsps(lines, ref_as_db), config, refs)
 
-        if config["gzip_debug"]:
-            gzip_file(stage1_tsv)
-
-    hits = defaultdict(list)
-    for line in filter(None, tsv_text.splitlines()):
-        parts = line.split("\t")
-        if len(parts) < 11: continue
-        qseqid, sseqid, pident, length, qlen, evalue, bitscore, qstart, qend, sstart, send = parts
-        # Group by qseqid ONLY (ignore sseqid/contig to handle genes split across contigs)
-        hits[qseqid].append({
-            "pident": float(pident),
-            "length": int(length),
-            "qlen": int(qlen),
-            "bitscore": float(bitscore),
-            "qstart": int(qstart),
-            "qend": int(qend)
-        })
-
-    score_by_type = defaultdict(float)
-    
-    best_rejected_info = None
-
-    for qseqid, hsp_list in hits.items():
-        # 1. Calculate total query coverage by merging intervals
-        intervals = sorted([(h["qstart"], h["qend"]) for h in hsp_list])
-        merged = []
-        if intervals:
-            curr_start, curr_end = intervals[0]
-            for next_start, next_end in intervals[1:]:
-                if next_start <= curr_end + 1: # overlapping or adjacent
-                    curr_end = max(curr_end, next_end)
-                else:
-                    merged.append((curr_start, curr_end))
-                    curr_start, curr_end = next_start, next_end
-            merged.append((curr_start, curr_end))
-        
-        covered_len = sum(e - s + 1 for s, e in merged)
-        qlen = hsp_list[0]["qlen"]
-        coverage = (covered_len / qlen) if qlen else 0.0
-
-        # 2. Calculate weighted PID (length-weighted)
-        total_aligned_len = sum(h["length"] for h in hsp_list)
-        weighted_pid_sum = sum(h["pident"] * h["length"] for h in hsp_list)
-        avg_pid = (weighted_pid_sum / total_aligned_len) if total_aligned_len else 0.0
-
-        # 3. Filter
-        if avg_pid < config["min_pid"] or coverage < config["min_cov"]:
-            # Diagnostic for best rejected
-            info = f"{qseqid}: Cov={coverage:.2f} Pid={avg_pid:.1f}"
-            if best_rejected_info is None or coverage > float(best_rejected_info.split("Cov=")[1].split()[0]):
-                 best_rejected_info = info
-            continue
-
-        # 4. Sum bitscore
-        total_bitscore = sum(h["bitscore"] for h in hsp_list)
-        
-        st = allele_to_type.get(qseqid)
-        if st: 
-            score_by_type[st] += total_bitscore
-    
-    if not score_by_type and best_rejected_info:
-        print(f"[DEBUG] No hits passed filter. Best rejected: {best_rejected_info}")
-
-
-    ordered = sorted(score_by_type.items(), key=lambda kv: kv[1], reverse=True)
-    top, top_score = (ordered[0][0], ordered[0][1]) if ordered else (None, 0.0)
-    second, second_score = (ordered[1][0], ordered[1][1]) if len(ordered) > 1 else (None, 0.0)
-    total = sum(score_by_type.values())
-    fraction, delta = (top_score/total if total else 0.0), top_score-second_score
-    decisive = (fraction >= config["plurality"]) and (delta >= config["delta"])
-    must_stage2_for_pair = bool(top in config["ambig_set"])
-    return {"scores":score_by_type,"top":top,"second":second,"fraction":fraction,
-            "delta":delta,"decisive":decisive,"must_stage2_for_pair":must_stage2_for_pair}
-
-
-def stage2_resolver_call(assembly_fa: str, resolver_refs_fa: str, threads: int, run_dir: Path, config: dict, allowed_pair: str|None=None):
-    ensure_tool("blastn"); ensure_tool("makeblastdb"); ensure_tool("samtools")
-    db_prefix = make_db_if_needed(assembly_fa, config["tmp_dir"])
-    outfmt = "6 qseqid sseqid pident length qlen evalue bitscore qstart qend sstart send"
-    tsv_text = run_blast(resolver_refs_fa, db_prefix, threads, outfmt)
+def route_hsps(hsps, config: dict, refs=None) -> dict:
+    """Splits HSPs of a combined search into {"stage1": whitelist hits, "stage2": resolver hits}."""
+    resolver_ids = refs.resolver_ids if refs is not None else fasta_ids(config["resolver_refs_fasta"])
+    routed = {"stage1": [], "stage2": []}
+    for h in hsps:
+        routed["stage2" if h.allele in resolver_ids else "stage1"].append(h)
+    return routed
 
+def write_debug_tsv(tsv_text: str, path: Path, config: dict):
     if config["keep_debug"]:
-        stage2_tsv = run_dir / "resolver_vs_asm.tsv"
-        stage2_tsv.write_text(tsv_text + ("\n" if tsv_text else ""))
+        path.write_text(tsv_text + ("\n" if tsv_text else ""))
         if config["gzip_debug"]:
-            gzip_file(stage2_tsv)
+            gzip_file(path)
+
+def stage1_score(assembly_fa: str, whitelist_fa: str, threads: int, run_dir: Path, config: dict, hsps: list[Hsp]|None=None,
+                 refs=None):
+    """Stage-1 result for an assembly; `refs` is a `references.ReferenceBundle` for `whitelist_fa`, if loaded."""
+    if refs is not None:
+        allele_to_type, allele_to_geneclass = refs.allele_to_type, refs.allele_to_geneclass
+    else:
+        allele_to_type, allele_to_geneclass = parse_whitelist_headers(whitelist_fa)
+    if hsps is None:
+        ensure_tool("blastn"); ensure_tool("makeblastdb")
+        # Escalate to the next task until the call is decisive and every allele hit
+        # passes the filters in full: a fast task that misses diverged alleles of a
+        # competing serotype can look decisive when the sensitive one is not.
+        for task in blast_tasks(config):
+            res = dict(_stage1_search(assembly_fa, whitelist_fa, threads, run_dir, dict(config, blast_task=task),
+                                      allele_to_type, allele_to_geneclass), blast_task=task)
+            if res["decisive"] and not res["partial_hits"]: break
+        return res
+    return score_stage1_many([hsps], allele_to_type, config)[0]
 
+def _stage1_search(assembly_fa: str, whitelist_fa: str, threads: int, run_dir: Path, config: dict,
+                   allele_to_type: dict, allele_to_geneclass: dict) -> dict:
+    query_fa = whitelist_fa
+    if config.get("kmer_prefilter") and not uses_ref_db(config):
+        from swineotype.kmer import prefilter_whitelist
+        query_fa, n_alleles = prefilter_whitelist(assembly_fa, whitelist_fa, config)
+    elif config.get("tiered_stage1") and not uses_ref_db(config):
+        return tiered_stage1(assembly_fa, whitelist_fa, threads, run_dir, config, allele_to_type, allele_to_geneclass)
+    lines, ref_as_db = search_references(assembly_fa, query_fa, threads, config,
+                                         tee=debug_tsv_path(run_dir, "wzxwzy_vs_asm.tsv", config))
+    hsps = iter_hsps(lines, ref_as_db)
+    if query_fa != whitelist_fa and config.get("kmer_validate"):
+        return validate_prefilter(assembly_fa, whitelist_fa, threads, config, list(hsps), allele_to_type, n_alleles)
+    return score_stage1_many([hsps], allele_to_type, config)[0]
 
+def tiered_stage1(assembly_fa: str, whitelist_fa: str, threads: int, run_dir: Path, config: dict,
+                  allele_to_type: dict, allele_to_geneclass: dict) -> dict:
+    """
+    Searches the `stage1_tier1` gene class first and keeps that call when it is
+    decisive and outside `ambig_set`. Otherwise the remaining alleles are
+    searched and both tiers are scored together, as in a single full search.
+    """
+    from swineotype.kmer import subset_fasta
+    tier1 = config.get("stage1_tier1", "wzy")
+    first = [a for a, gc in allele_to_geneclass.items() if gc == tier1]
+    rest = [a for a, gc in allele_to_geneclass.items() if gc != tier1]
+    hsps, res = [], summarize_stage1({}, config)
+    for name, ids in ((tier1, first), ("all", rest)):
+        if not ids: continue
+        lines, ref_as_db = search_references(assembly_fa, subset_fasta(whitelist_fa, ids, config["tmp_dir"], "tiers"),
+                                             threads, config, tee=debug_tsv_path(run_dir, f"wzxwzy_vs_asm.{name}.tsv", config))
+        hsps.extend(iter_hsps(lines, ref_as_db))
+        res = score_stage1_many([hsps], allele_to_type, config)[0]
+        if name == tier1 and res["decisive"] and not res["must_stage2_for_pair"]:
+            return dict(res, tier=name)
+    return dict(res, tier="all")
+
+def validate_prefilter(assembly_fa: str, whitelist_fa: str, threads: int, config: dict, hsps: list[Hsp],
+                       allele_to_type: dict, n_alleles: int) -> dict:
+    """Scores prefiltered HSPs and a full-whitelist search side by side; returns the full result."""
+    lines, ref_as_db = search_references(assembly_fa, whitelist_fa, threads, config)
+    filtered, full = score_stage1_many([hsps, iter_hsps(lines, ref_as_db)], allele_to_type, config)
+    same = all(filtered[k] == full[k] for k in ("top", "second", "decisive", "must_stage2_for_pair"))
+    click.echo(f"[{'INFO' if same else 'WARN'}] k-mer prefilter {'agrees' if same else 'DISAGREES'} with full search "
+               f"for {Path(assembly_fa).name} ({n_alleles} alleles searched): "
+               f"{filtered['top']}/{filtered['decisive']} vs {full['top']}/{full['decisive']}", err=True)
+    return full
+
+
+def select_resolver_hsp(hsps, config: dict, allowed_pair: str|None=None) -> dict|None:
+    """Best-scoring resolver HSP spanning the diagnostic site, mapped to contig coordinates."""
     best = None
-    for line in filter(None, tsv_text.splitlines()):
-        qseqid, sseqid, pident, length, qlen, evalue, bitscore, qstart, qend, sstart, send = line.split("\t")
-        pident, length, qstart, qend, sstart, send, bitscore = float(pident), int(length), int(qstart), int(qend), int(sstart), int(send), float(bitscore)
+    for h in hsps:
+        qseqid, pident, length, bitscore = h.allele, h.pident, h.length, h.bitscore
+        qstart, qend, sstart, send = h.astart, h.aend, h.cstart, h.cend
         meta = parse_resolver_meta(qseqid)
-        if allowed_pair and meta["pair"] != allowed_pair: continue
-        pos = meta["pos"]
+        if allowed_pair and meta.pair != allowed_pair: continue
+        pos = meta.pos
         spans = (qstart <= pos <= qend) or (qend <= pos <= qstart)
         if not spans: continue
         if pident < config["min_res_pid"] or length < config["min_res_alen"]: continue
@@ -144,36 +237,91 @@ def stage2_resolver_call(assembly_fa: str, resolver_refs_fa: str, threads: int,
             strand = "+"; tpos = sstart + qoff
         else:
             strand = "-"; tpos = sstart - qoff
-        ev = {"ref_id":qseqid,"contig":sseqid,"contig_pos":tpos,"strand":strand,
-              "pident":pident,"length":length,"bitscore":bitscore,"pair":meta["pair"],"base":None}
+        ev = {"ref_id":qseqid,"contig":h.contig,"contig_pos":tpos,"strand":strand,
+              "pident":pident,"length":length,"bitscore":bitscore,"pair":meta.pair,"base":None,"method":"blast"}
         if best is None or bitscore > best[0]: best = (bitscore, ev)
-    if not best: return None
-    ev = best[1]
-    region = f"{ev['contig']}:{ev['contig_pos']}-{ev['contig_pos']}"
-    fa = run(["samtools","faidx",assembly_fa,region])
-    lines = [ln.strip() for ln in fa.splitlines()]
-    base = lines[1].strip().upper() if len(lines)>1 else "N"
+    return best[1] if best else None
+
+def stage2_resolver_call(assembly_fa: str, resolver_refs_fa: str, threads: int, run_dir: Path, config: dict, allowed_pair: str|None=None,
+                         hsps: list[Hsp]|None=None, reader: FastaIndex|None=None):
+    if reader is None:
+        with FastaIndex(assembly_fa) as own_reader:
+            return stage2_resolver_call(assembly_fa, resolver_refs_fa, threads, run_dir, config, allowed_pair, hsps, own_reader)
+    if hsps is None and config.get("resolver_engine", "blast") == "anchor":
+        from swineotype.anchors import anchor_resolver_call
+        ev = anchor_resolver_call(reader, resolver_refs_fa, config, allowed_pair)
+        if ev is not None: return ev
+    if hsps is None:
+        ensure_tool("blastn"); ensure_tool("makeblastdb")
+        for task in blast_tasks(config):  # escalate until an HSP passes the filters and spans the site
+            lines, ref_as_db = search_references(assembly_fa, resolver_refs_fa, threads, dict(config, blast_task=task),
+                                                 tee=debug_tsv_path(run_dir, "resolver_vs_asm.tsv", config))
+            ev = select_resolver_hsp(iter_hsps(lines, ref_as_db), config, allowed_pair)
+            if ev is not None:
+                ev["blast_task"] = task; break
+    else:
+        ev = select_resolver_hsp(hsps, config, allowed_pair)
+    if ev is None: return None
+    base = reader.base(ev["contig"], ev["contig_pos"])
     if ev["strand"] == "-":
         base = reverse_complement(base)
     ev["base"] = base
     return ev
 
 
+def plan_stage2(s1: dict, config: dict) -> tuple[str|None, bool]:
+    """Resolver pair relevant to a stage-1 result, and whether stage 2 must run to make a call."""
+    s1_top, s1_second = s1.get("top"), s1.get("second")
+    allowed_pair = None
+    if (s1_top in config["pair_1_14"]) or (s1_second in config["pair_1_14"]): allowed_pair = "1_vs_14"
+    elif (s1_top in config["pair_2_1_2"]) or (s1_second in config["pair_2_1_2"]): allowed_pair = "2_vs_1_2"
+    must_stage2 = (not s1.get("decisive", False)) or s1.get("must_stage2_for_pair", False)
+    return allowed_pair, must_stage2
+
+def final_call(s1: dict, s2_ev: dict|None, config: dict) -> dict:
+    """Summary row fields for a sample from its stage-1 result and stage-2 evidence."""
+    _, must_stage2 = plan_stage2(s1, config)
+    final_sero, final_status = None, None
+    if s2_ev:
+        final_sero = interpret_resolver(s2_ev, config); final_status = "STAGE2" if final_sero else "NO_CALL_STAGE2"
+    elif s1.get("decisive", False) and not must_stage2:
+        final_sero = s1.get("top"); final_status = "STAGE1"
+    else:
+        final_status = "NO_CALL_STAGE2"
+    scores = sorted((s1.get("scores") or {}).items(), key=lambda kv: kv[1], reverse=True)
+    tasks = blast_tasks(config)
+    used = [t for t in (s1.get("blast_task"), (s2_ev or {}).get("blast_task")) if t in tasks]
+    return {"stage1_top":s1.get("top") or "","stage1_second":s1.get("second") or "",
+            "stage1_fraction":s1.get("fraction",0.0),"stage1_delta":s1.get("delta",0.0),
+            "stage1_tier":s1.get("tier","all"),"stage1_scores":";".join(f"{st}={score}" for st, score in scores),"ref_id":(s2_ev or {}).get("ref_id",""),
+            "contig":(s2_ev or {}).get("contig",""),"contig_pos":(s2_ev or {}).get("contig_pos",""),
+            "strand":(s2_ev or {}).get("strand",""),"base":(s2_ev or {}).get("base",""),
+            "status":final_status,"final_serotype":final_sero or "","stage2_method":(s2_ev or {}).get("method",""),
+            "blast_task":max(used, key=tasks.index) if used else ""}
+
 def interpret_resolver(ev: dict|None, config: dict) -> str|None:
     if ev is None: return None
     meta = parse_resolver_meta(ev["ref_id"])
     base = ev["base"]
     if base == "G":
-        return meta.get("G_serotype")
+        return meta.G_serotype
     elif base in ("C", "T"):
-        return meta.get("CT_serotype")
+        return meta.CT_serotype
     return None
 
-def parse_resolver_meta(qid: str):
+class ResolverMeta(NamedTuple):
+    """The fields of a resolver FASTA ID (None where absent)."""
+    pair: str|None
+    pos: int|None
+    G_serotype: str|None
+    CT_serotype: str|None
+
+@lru_cache(maxsize=1024)
+def parse_resolver_meta(qid: str) -> ResolverMeta:
     """
     Parse resolver FASTA IDs of the form:
       >id|pair=1_vs_14|pos=481|G_serotype=14|CT_serotype=1
-    Returns dict with keys: pair, pos, G_serotype, CT_serotype
+    Returns a ResolverMeta with fields pair, pos, G_serotype, CT_serotype.
     """
     meta = {"pair": None, "pos": None, "G_serotype": None, "CT_serotype": None}
     for tok in qid.split("|")[1:]:
@@ -185,4 +333,4 @@ def parse_resolver_meta(qid: str):
             meta["G_serotype"] = tok.split("=", 1)[1]
         elif tok.startswith("CT_serotype="):
             meta["CT_serotype"] = tok.split("=", 1)[1]
-    return meta
+    return ResolverMeta(**meta)
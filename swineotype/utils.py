@@ -1,12 +1,71 @@
-import sys
 import click
 import gzip
+import threading
+from contextlib import contextmanager
+
+class ToolNotFoundError(click.ClickException):
+    """A required external tool is not on PATH. The CLI reports it and exits with status 1."""
 
 def ensure_tool(name: str):
     from shutil import which
     if which(name) is None:
-        click.echo(f"[ERROR] Required tool not found in PATH: {name}", err=True)
-        sys.exit(1)
+        raise ToolNotFoundError(f"Required tool not found in PATH: {name}")
+
+_DIGESTS = {}
+
+def file_digest(file_path, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-256 of a file's content, streamed in chunks.
+    Memoized on (path, size, mtime) so repeated lookups within a run are free.
+    """
+    import hashlib
+    import os
+    st = os.stat(file_path)
+    key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+    if key not in _DIGESTS:
+        h = hashlib.sha256()
+        with open(file_path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(chunk_size), b""):
+                h.update(chunk)
+        _DIGESTS[key] = h.hexdigest()
+    return _DIGESTS[key]
+
+class KeyedLocks:
+    """
+    One lock per key, e.g. per sample name, for threads that must not work on
+    the same files at once. A key's lock is dropped once no thread holds or
+    waits for it.
+    """
+
+    def __init__(self):
+        self._lock, self._locks = threading.Lock(), {}
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]: del self._locks[key]
+
+def temp_path(dest):
+    """
+    A new, uniquely named empty file next to `dest`, to be written and then
+    `os.replace`d onto it. Unlike a pid suffix, the name is unique per call,
+    so threads of one process writing the same `dest` never share it.
+    """
+    import os
+    import tempfile
+    from pathlib import Path
+    dest = Path(dest)
+    fd, tmp = tempfile.mkstemp(prefix=f".{dest.name}.", dir=dest.parent)
+    os.close(fd)
+    return Path(tmp)
 
 def gzip_file(file_path: str):
     with open(file_path, 'rb') as f_in:
@@ -15,28 +74,156 @@ def gzip_file(file_path: str):
     import os
     os.remove(file_path)
 
-def ensure_unix_line_endings(file_path: str, tmp_dir: str) -> str:
+STAGE_CHUNK_SIZE = 1 << 20
+FICLONE = 0x40049409  # Linux ioctl to reflink a file on CoW filesystems (btrfs, XFS)
+
+def sample_name(file_path) -> str:
+    """Sample ID of an assembly path: the file name without `.gz` and FASTA extension."""
+    from pathlib import Path
+    name = Path(file_path).name
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return Path(name).stem
+
+class FastaStats:
+    """Contig count, total length and N50, accumulated over LF-only chunks of a FASTA."""
+
+    def __init__(self):
+        self.lengths = []
+        self._current = None
+        self._in_header = False
+        self._at_line_start = True
+
+    def feed(self, data: bytes):
+        i, n = 0, len(data)
+        while i < n:
+            if self._in_header:
+                nl = data.find(b"\n", i)
+                if nl == -1:
+                    self._at_line_start = False
+                    return
+                self._in_header, self._at_line_start, i = False, True, nl + 1
+                continue
+            if self._at_line_start and data[i] == 0x3E:  # ">"
+                if self._current is not None:
+                    self.lengths.append(self._current)
+                self._current, self._in_header = 0, True
+                continue
+            nxt = data.find(b"\n>", i)
+            end = n if nxt == -1 else nxt + 1
+            if self._current is not None:
+                self._current += (end - i) - data.count(b"\n", i, end)
+            self._at_line_start = data[end - 1] == 0x0A
+            i = end
+
+    def summary(self) -> dict:
+        lengths = self.lengths + ([self._current] if self._current is not None else [])
+        total, n50, acc = sum(lengths), 0, 0
+        for length in sorted(lengths, reverse=True):
+            acc += length
+            if 2 * acc >= total:
+                n50 = length; break
+        return {"n_contigs": len(lengths), "total_length": total, "n50": n50}
+
+def _clone_or_copy(src, dst):
+    import fcntl
+    import shutil
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        return
+    except OSError:
+        pass
+    shutil.copyfile(src, dst)
+
+def _link_or_copy(src, dst):
+    import os
+    try:
+        os.link(src, dst)
+    except OSError:
+        _clone_or_copy(src, dst)
+
+def stage_assembly(file_path: str, tmp_dir: str, chunk_size: int = STAGE_CHUNK_SIZE) -> tuple[str, dict]:
+    """
+    Stages an assembly into `tmp_dir` with LF line endings, in a single streaming pass.
+
+    The input is read in fixed-size chunks; `.gz` inputs are decompressed on
+    the fly. Files that are already LF-clean are hard-linked (or reflinked, or
+    copied across filesystems) instead of rewritten, and are used in place if
+    they already live in `tmp_dir`. Staging into `tmp_dir` ensures we have write
+    permission for the .fai index even when the input is on a read-only mount
+    (e.g. WSL).
+
+    Returns the staged path and assembly stats (contig count, total length, N50).
+    """
+    import gzip
+    import hashlib
+    import os
+    import shutil
     from pathlib import Path
     path = Path(file_path)
-    dest = Path(tmp_dir) / path.name
-
-    # Even if line endings are fine, we copy to tmp_dir 
-    # to ensure we have write permission for the .fai index file.
-    # This addresses issues where input is in a read-only mount (e.g. WSL).
-    
-    # If source and dest resolve to the same file (e.g. user provided file inside tmp_dir),
-    # we might overwrite it. To be safe, use a prefixed name if they are the same.
-    if dest.resolve() == path.resolve():
-         dest = Path(tmp_dir) / f"staged_{path.name}"
-    
-    # click.echo(f"[INFO] Staging assembly to {dest}...")
-    
-    with open(path, 'rb') as f_in:
-        content = f_in.read()
-        
-    with open(dest, 'wb') as f_out:
-        # Normalize CRLF to LF, and also bare CR to LF just in case
-        content = content.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
-        f_out.write(content)
-        
-    return str(dest)
+    is_gz = path.name.endswith(".gz")
+    name = path.name[:-3] if is_gz else path.name
+    # Prefix with a hash of the source path so same-named inputs from different
+    # folders never overwrite each other's staged copy.
+    tag = hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:12]
+    dest = Path(tmp_dir) / "staged" / f"{tag}-{name}"
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = temp_path(dest)
+
+    stats, out, clean_bytes, carry = FastaStats(), None, 0, b""
+    try:
+        with (gzip.open if is_gz else open)(path, "rb") as f_in:
+            if is_gz:
+                out = open(tmp, "wb")
+            while True:
+                chunk = f_in.read(chunk_size)
+                data, carry = carry + chunk, b""
+                if chunk and data.endswith(b"\r"):
+                    # A CRLF may straddle the chunk boundary; decide with the next chunk.
+                    data, carry = data[:-1], b"\r"
+                if not data:
+                    if not chunk: break
+                    continue
+                if b"\r" in data:
+                    # Normalize CRLF to LF, and also bare CR to LF just in case
+                    data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+                    if out is None:
+                        out = open(tmp, "wb")
+                        with open(path, "rb") as f_prefix:
+                            shutil.copyfileobj(_LimitedReader(f_prefix, clean_bytes), out)
+                stats.feed(data)
+                if out is not None:
+                    out.write(data)
+                else:
+                    clean_bytes += len(data)
+        if out is not None:
+            out.close()
+        elif path.resolve().parent == Path(tmp_dir).resolve():
+            return str(path), stats.summary()
+        else:
+            tmp.unlink()  # os.link will not replace an existing file
+            _link_or_copy(path, tmp)
+        os.replace(tmp, dest)
+    finally:
+        if out is not None and not out.closed:
+            out.close()
+        tmp.unlink(missing_ok=True)
+    return str(dest), stats.summary()
+
+class _LimitedReader:
+    """File wrapper returning at most `limit` bytes, for copying a clean prefix."""
+
+    def __init__(self, fh, limit: int):
+        self.fh, self.remaining = fh, limit
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+def ensure_unix_line_endings(file_path: str, tmp_dir: str) -> str:
+    return stage_assembly(file_path, tmp_dir)[0]
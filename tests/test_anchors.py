@@ -0,0 +1,91 @@
+import random
+from pathlib import Path
+from unittest.mock import patch
+
+from swineotype.anchors import anchor_resolver_call, revcomp
+from swineotype.fasta import FastaIndex
+from swineotype.stages import interpret_resolver, stage2_resolver_call
+
+CONFIG = {"anchor_flank": 31, "anchor_max_mismatches": 2, "resolver_engine": "anchor",
+          "min_res_pid": 90, "min_res_alen": 300, "keep_debug": False, "tmp_dir": "tmp"}
+
+
+def random_seq(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice("ACGT") for _ in range(n))
+
+
+def write_refs(tmp_path: Path, rng: random.Random) -> dict:
+    refs = {"cps1L|pair=1_vs_14|pos=492|G_serotype=14|CT_serotype=1": random_seq(rng, 1000),
+            "cps2K|pair=2_vs_1_2|pos=483|G_serotype=2|CT_serotype=1/2": random_seq(rng, 1000)}
+    (tmp_path / "refs.fasta").write_text("".join(f">{rid}\n{seq}\n" for rid, seq in refs.items()))
+    return refs
+
+
+def with_base(seq: str, pos: int, base: str) -> str:
+    return seq[:pos - 1] + base + seq[pos:]
+
+
+def test_reads_site_on_minus_strand(tmp_path):
+    rng = random.Random(1)
+    refs = write_refs(tmp_path, rng)
+    ref_id, seq = next(iter(refs.items()))
+    gene = with_base(seq, 492, "G")
+    gene = gene[:470] + ("A" if gene[470] != "A" else "C") + gene[471:]  # one mismatch in the left flank
+    (tmp_path / "asm.fa").write_text(f">c1\n{random_seq(rng, 3000)}\n>c2\n{random_seq(rng, 200)}{revcomp(gene)}\n")
+
+    with FastaIndex(tmp_path / "asm.fa") as reader:
+        ev = anchor_resolver_call(reader, tmp_path / "refs.fasta", CONFIG, "1_vs_14")
+
+    assert ev["ref_id"] == ref_id and ev["contig"] == "c2" and ev["strand"] == "-" and ev["method"] == "anchor"
+    assert ev["contig_pos"] == 200 + 1000 - 492 + 1
+    assert ev["base"] == "G" and interpret_resolver(ev, CONFIG) == "14"
+    assert ev["length"] == 1000 and ev["pident"] == 99.9  # the flank mismatch
+
+
+def test_missing_or_repeated_anchors_give_no_call(tmp_path):
+    rng = random.Random(2)
+    refs = write_refs(tmp_path, rng)
+    seq = with_base(next(iter(refs.values())), 492, "T")
+    (tmp_path / "none.fa").write_text(f">c1\n{random_seq(rng, 3000)}\n")
+    (tmp_path / "twice.fa").write_text(f">c1\n{seq}\n>c2\n{with_base(seq, 492, 'G')}\n")
+
+    for name in ("none.fa", "twice.fa"):
+        with FastaIndex(tmp_path / name) as reader:
+            assert anchor_resolver_call(reader, tmp_path / "refs.fasta", CONFIG, "1_vs_14") is None
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_stage2_falls_back_to_blast_without_anchor(mock_make_db, mock_stream_blast, mock_ensure_tool, tmp_path):
+    rng = random.Random(3)
+    refs = write_refs(tmp_path, rng)
+    ref_id = next(iter(refs))
+    contig = random_seq(rng, 1000)
+    (tmp_path / "asm.fa").write_text(f">c1\n{contig}\n")
+    mock_make_db.return_value = "db_prefix"
+    mock_stream_blast.return_value = [f"{ref_id}\tc1\t95\t1000\t1000\t0\t1500\t1\t1000\t1\t1000"]
+
+    ev = stage2_resolver_call(str(tmp_path / "asm.fa"), str(tmp_path / "refs.fasta"), 1, tmp_path, CONFIG, "1_vs_14")
+
+    assert mock_stream_blast.called
+    assert ev["method"] == "blast" and ev["base"] == contig[491]
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_diverged_locus_with_intact_flanks_goes_to_blast(mock_make_db, mock_stream_blast, mock_ensure_tool, tmp_path):
+    rng = random.Random(4)
+    refs = write_refs(tmp_path, rng)
+    ref_id, seq = next(iter(refs.items()))
+    gene = "".join(b if 460 <= i < 525 or rng.random() > 0.2 else random_seq(rng, 1) for i, b in enumerate(seq))
+    (tmp_path / "asm.fa").write_text(f">c1\n{gene}\n")
+    mock_make_db.return_value = "db_prefix"
+    mock_stream_blast.return_value = [f"{ref_id}\tc1\t85\t1000\t1000\t0\t900\t1\t1000\t1\t1000"]
+
+    with FastaIndex(tmp_path / "asm.fa") as reader:
+        assert anchor_resolver_call(reader, tmp_path / "refs.fasta", CONFIG, "1_vs_14") is None
+    ev = stage2_resolver_call(str(tmp_path / "asm.fa"), str(tmp_path / "refs.fasta"), 1, tmp_path, CONFIG, "1_vs_14")
+
+    assert mock_stream_blast.called and ev is None  # BLAST rejects it too (85% < min_res_pid)
@@ -0,0 +1,84 @@
+import threading
+import time
+from unittest.mock import patch
+
+import click
+import pytest
+
+from swineotype.api import SerotypeRunner, ToolNotFoundError
+from swineotype.utils import ensure_tool
+
+
+@pytest.fixture
+def runner(tmp_path):
+    with patch("swineotype.api.ensure_tool"), patch("swineotype.api.prepare_reference_dbs"), \
+            patch("swineotype.api.load_references"):
+        yield SerotypeRunner({"batch_size": 0}, out_dir=tmp_path / "out", threads=2)
+
+
+def test_ensure_tool_raises_instead_of_exiting():
+    with pytest.raises(ToolNotFoundError, match="no-such-tool") as exc:
+        ensure_tool("no-such-tool")
+    assert isinstance(exc.value, click.ClickException) and exc.value.exit_code == 1
+
+
+@patch("swineotype.api.process_one")
+def test_type_one_and_sequential_type_many(mock_process, runner, tmp_path):
+    mock_process.side_effect = lambda asm, out_dir, threads, config: {"sample": asm, "threads": threads}
+    assert runner.type_one(tmp_path / "a.fasta") == {"sample": str(tmp_path / "a.fasta"), "threads": 2}
+    mock_process.assert_called_with(str(tmp_path / "a.fasta"), tmp_path / "out", 2, {"batch_size": 0})
+    assert [r["sample"] for r in runner.type_many(["x", "y"])] == ["x", "y"]
+
+
+@patch("swineotype.api.process_one")
+def test_parallel_type_many_is_lazy_and_yields_as_completed(mock_process, runner):
+    release, consumed = threading.Event(), []
+
+    def process(asm, *args):
+        if asm == "slow": release.wait(5)
+        return {"sample": asm}
+
+    def assemblies():
+        for asm in ["slow", "a", "b", "c", "d", "e"]:
+            consumed.append(asm)
+            yield asm
+
+    mock_process.side_effect = process
+    rows = runner.type_many(assemblies(), jobs=2)
+    assert consumed == []
+    first = next(rows)["sample"]
+    assert first != "slow" and len(consumed) == 4
+    release.set()
+    assert sorted([first] + [r["sample"] for r in rows]) == ["a", "b", "c", "d", "e", "slow"]
+
+
+@patch("swineotype.api.process_one")
+def test_type_many_raises_sample_errors(mock_process, runner):
+    mock_process.side_effect = OSError("unreadable")
+    with pytest.raises(OSError, match="unreadable"):
+        list(runner.type_many(["a", "b"], jobs=2))
+
+
+@patch("swineotype.main.type_prepared")
+def test_parallel_type_many_types_same_named_samples_one_at_a_time(mock_type, tmp_path):
+    from swineotype.config import load_config
+    active, overlaps = [], []
+
+    def type_prepared(prep, threads, config):
+        active.append(prep["source"]); overlaps.append(len(active))
+        time.sleep(0.05)
+        active.remove(prep["source"])
+        return {"sample": prep["name"], "source": prep["source"]}
+
+    mock_type.side_effect = type_prepared
+    paths = []
+    for folder in ("run1", "run2"):
+        (tmp_path / folder).mkdir()
+        paths.append(tmp_path / folder / "s1.fasta"); paths[-1].write_text(f">c\n{folder}\n")
+    with patch("swineotype.api.ensure_tool"), patch("swineotype.api.prepare_reference_dbs"), \
+            patch("swineotype.api.load_references"):
+        runner = SerotypeRunner(dict(load_config(), tmp_dir=tmp_path / "scratch"), out_dir=tmp_path / "out")
+
+    rows = list(runner.type_many(paths, jobs=2))
+    assert sorted(r["source"] for r in rows) == sorted(map(str, paths))
+    assert max(overlaps) == 1
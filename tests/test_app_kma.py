@@ -0,0 +1,66 @@
+import csv
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from swineotype.adapters.app_kma import call_serovar, load_profiles, run_kma_engine, type_assembly
+
+RES_HEADER = "#Template\tScore\tExpected\tTemplate_length\tTemplate_Identity\tTemplate_Coverage\tQuery_Identity\tQuery_Coverage\tDepth\tq_value\tp_value\n"
+
+# KMA hits per sample: (template, identity, coverage)
+HITS = {
+    "app1": [("cps1A_ref", 100.0, 100.0), ("cps1B_ref", 99.5, 100.0), ("apxIVA", 100.0, 100.0)],
+    "app2": [("cps2A_ref", 100.0, 100.0), ("cps2B_ref", 100.0, 91.0)],  # cps2B too short
+    "app9": [("cps9A", 100.0, 100.0), ("cps1A_ref", 99.0, 100.0), ("cps1B_ref", 99.0, 100.0)],
+}
+
+
+def fake_kma(cmd, **kwargs):
+    sample = Path(cmd[cmd.index("-i") + 1]).stem
+    rows = "".join(f"{t}\t1\t0\t900\t{i}\t{c}\t{i}\t{c}\t1\t0\t1e-10\n" for t, i, c in HITS[sample])
+    Path(cmd[cmd.index("-o") + 1] + ".res").write_text(RES_HEADER + rows)
+
+
+def test_profile_schema(tmp_path):
+    (tmp_path / "a.yaml").write_text("'1': [cps1A, cps1B]\n'9': {genes: [cps9A], absent: [cps1A]}\n")
+    (tmp_path / "b.yaml").write_text("serovars:\n  - {serovar: '1', genes: [cps1A, cps1B]}\n")
+    (tmp_path / "c.yaml").write_text("'1': {required: [cps1A]}\n")
+    (tmp_path / "d.yaml").write_text("'1': []\n")
+    assert load_profiles(tmp_path / "a.yaml") == {"1": {"genes": {"cps1A", "cps1B"}, "absent": set()},
+                                                  "9": {"genes": {"cps9A"}, "absent": {"cps1A"}}}
+    for name, error in [("b.yaml", "list of gene names"), ("c.yaml", "unknown keys"), ("d.yaml", "no serovar profiles")]:
+        with pytest.raises(ValueError, match=error):
+            load_profiles(tmp_path / name)
+
+
+def test_contained_profiles_are_dropped_and_ambiguous_matches_joined():
+    profiles = {"1": {"genes": {"a"}, "absent": set()}, "9": {"genes": {"a", "b"}, "absent": set()},
+                "12": {"genes": {"c", "d"}, "absent": set()}}
+    assert call_serovar({"a", "b"}, profiles) == "9"
+    assert call_serovar({"a", "b", "c", "d"}, profiles) == "12/9"
+    assert call_serovar({"c"}, profiles) == "NT"
+
+
+@patch("swineotype.adapters.app_kma.subprocess.run", side_effect=fake_kma)
+def test_engine_writes_serovar_tsv_in_input_order(mock_run, tmp_path):
+    (tmp_path / "profiles.yaml").write_text("'1': [cps1A, cps1B]\n'2': [cps2A, cps2B]\n'9': [cps9A]\n")
+    assemblies = [tmp_path / f"{s}.fasta" for s in HITS]
+
+    out = run_kma_engine(assemblies, tmp_path, tmp_path / "tmp", "db/APP", tmp_path / "profiles.yaml", threads=3)
+
+    rows = list(csv.DictReader(open(out), delimiter="\t"))
+    assert [(r["Sample"], r["Suggested_serovar"]) for r in rows] == [("app1", "1"), ("app2", "NT"), ("app9", "1/9")]
+    assert rows[0]["Genes"] == "cps1A;cps1B"
+    assert mock_run.call_args[0][0][:1] == ["kma"] and "-t_db" in mock_run.call_args[0][0]
+
+
+@patch("swineotype.adapters.app_kma.subprocess.run", side_effect=fake_kma)
+def test_same_named_assemblies_get_their_own_kma_output(mock_run, tmp_path):
+    profiles = {"1": {"genes": {"cps1A", "cps1B"}, "absent": set()}}
+    (tmp_path / "kma").mkdir()
+    for folder in ("run1", "run2"):
+        (tmp_path / folder).mkdir()
+        type_assembly(tmp_path / folder / "app1.fasta", tmp_path / "kma", "db/APP", profiles, 98.0)
+    prefixes = [call[0][0][call[0][0].index("-o") + 1] for call in mock_run.call_args_list]
+    assert len(set(prefixes)) == 2 and all(p.endswith("-app1") for p in prefixes)
@@ -0,0 +1,93 @@
+import io
+import tarfile
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+from swineotype.archives import expand_archives, release
+from swineotype.main import SUMMARY_COLUMNS, main
+from swineotype.shards import expected_samples
+from swineotype.utils import sample_name
+
+FASTAS = {"bundle/iso1.fasta": b">c1\nACGT\n", "bundle/sub/iso2.fa": b">c2\nTTTT\n", "bundle/README": b"notes\n",
+          "bundle/._iso1.fasta": b"\0\0"}
+
+
+def write_tar(path: Path):
+    with tarfile.open(path, "w:gz") as tf:
+        for name, data in FASTAS.items():
+            info = tarfile.TarInfo(name); info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+
+def test_members_are_extracted_lazily_and_released(tmp_path):
+    write_tar(tmp_path / "bundle.tar.gz")
+    with zipfile.ZipFile(tmp_path / "more.zip", "w") as zf:
+        zf.writestr("iso3.fna", ">c3\nGGGG\n")
+    (tmp_path / "iso4.fasta").write_text(">c4\nCCCC\n")
+
+    paths = expand_archives([str(tmp_path / "bundle.tar.gz"), str(tmp_path / "iso4.fasta"), str(tmp_path / "more.zip")],
+                            tmp_path / "tmp")
+    seen = []
+    for path in paths:
+        extracted = list((tmp_path / "tmp").rglob("*.f*"))
+        assert len(extracted) <= 1  # only the member being worked on is in scratch
+        seen.append((Path(path).name, Path(path).read_bytes()))
+        release(path)
+
+    assert seen == [("bundle__iso1.fasta", b">c1\nACGT\n"), ("bundle__sub__iso2.fa", b">c2\nTTTT\n"), ("iso4.fasta", b">c4\nCCCC\n"),
+                    ("iso3.fna", b">c3\nGGGG\n")]
+    assert (tmp_path / "iso4.fasta").exists() and not list((tmp_path / "tmp" / "archive").iterdir())
+
+
+@patch("swineotype.main.process_one")
+@patch("swineotype.main.ensure_tool")
+def test_cli_reads_a_tar_stream_from_stdin(mock_ensure_tool, mock_process_one, tmp_path):
+    mock_process_one.side_effect = lambda asm, *a: {"sample": Path(asm).stem, "status": "STAGE1", "final_serotype": "2"}
+    write_tar(tmp_path / "bundle.tar.gz")
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        result = runner.invoke(main, ["--out_dir", "out", "--assembly", "-", "--merged_csv", "out/summary.csv"],
+                               input=(tmp_path / "bundle.tar.gz").read_bytes(),
+                               env={"SWINEO_SCRATCH_DIR": str(tmp_path / "scratch")})
+        assert result.exit_code == 0, result.output
+        assert "[OK] bundle__iso1.fasta => 2 (STAGE1)" in result.output and "[OK] bundle__sub__iso2.fa => 2" in result.output
+        assert [l.split(",")[0] for l in open("out/summary.csv").read().splitlines()[1:]] == ["bundle__iso1", "bundle__sub__iso2"]
+    assert not list((tmp_path / "scratch" / "archive").iterdir())
+
+
+@patch("swineotype.main.process_one")
+@patch("swineotype.main.ensure_tool")
+def test_same_named_members_in_different_folders_are_separate_samples(mock_ensure_tool, mock_process_one, tmp_path):
+    mock_process_one.side_effect = lambda asm, *a: {"sample": sample_name(asm), "status": "STAGE1", "final_serotype": Path(asm).read_text().split()[-1]}
+    with zipfile.ZipFile(tmp_path / "runs.zip", "w") as zf:
+        zf.writestr("S1/contigs.fasta", ">c\n2\n")
+        zf.writestr("S2/contigs.fasta", ">c\n14\n")
+    assert expected_samples([str(tmp_path / "runs.zip")]) == ["S1__contigs", "S2__contigs"]
+
+    result = CliRunner().invoke(main, ["--out_dir", str(tmp_path / "out"), "--assembly", str(tmp_path / "runs.zip"),
+                                       "--merged_csv", str(tmp_path / "summary.csv")],
+                                env={"SWINEO_SCRATCH_DIR": str(tmp_path / "scratch")})
+    assert result.exit_code == 0, result.output
+    rows = [l.split(",") for l in (tmp_path / "summary.csv").read_text().splitlines()[1:]]
+    assert [(r[0], r[SUMMARY_COLUMNS.index("final_serotype")]) for r in rows] == [("S1__contigs", "2"), ("S2__contigs", "14")]
+
+
+@patch("swineotype.main.type_staged")
+@patch("swineotype.main.ensure_tool")
+def test_archive_members_leave_no_staged_copies(mock_ensure_tool, mock_type_staged, tmp_path):
+    mock_type_staged.return_value = {"status": "STAGE1", "final_serotype": "2"}
+    write_tar(tmp_path / "bundle.tar.gz")
+    (tmp_path / "iso4.fasta").write_text(">c4\nCCCC\n")
+    scratch = tmp_path / "scratch"
+
+    result = CliRunner().invoke(main, ["--out_dir", str(tmp_path / "out"), "--assembly", str(tmp_path / "bundle.tar.gz"),
+                                       "--assembly", str(tmp_path / "iso4.fasta")],
+                                env={"SWINEO_SCRATCH_DIR": str(scratch)})
+    assert result.exit_code == 0, result.output
+    assert mock_type_staged.call_count == 3
+    staged = [p.name for p in (scratch / "staged").iterdir()]
+    assert len(staged) == 1 and staged[0].endswith("iso4.fasta")  # clean_temp is off, so plain files stay staged
+    assert len(list((scratch / "db_cache").iterdir())) == 1  # the plain file's DB lock; members' were dropped
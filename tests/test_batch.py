@@ -0,0 +1,53 @@
+from pathlib import Path
+from unittest.mock import patch
+
+from swineotype.blast import write_batch_fasta, demux_batch_tsv
+from swineotype.config import load_config
+from swineotype.main import process_batch
+
+
+def test_write_batch_fasta_and_demux(tmp_path):
+    a, b = tmp_path / "a.fasta", tmp_path / "b.fasta"
+    a.write_text(">ctg1 len=4\nACGT")
+    b.write_text(">ctg1\nTTTT\n>ctg__2\nGG\n")
+    write_batch_fasta([str(a), str(b)], tmp_path / "batch.fasta")
+    assert (tmp_path / "batch.fasta").read_text() == ">s0__ctg1 len=4\nACGT\n>s1__ctg1\nTTTT\n>s1__ctg__2\nGG\n"
+
+    tsv = ("q1\ts1__ctg__2\t99\t2\t2\t0\t4\t1\t2\t1\t2\n"
+           "q1\ts0__ctg1\t99\t4\t4\t0\t8\t1\t4\t1\t4\n")
+    assert demux_batch_tsv(tsv.splitlines(), 2, ref_as_db=False) == [
+        ["q1\tctg1\t99\t4\t4\t0\t8\t1\t4\t1\t4"],
+        ["q1\tctg__2\t99\t2\t2\t0\t4\t1\t2\t1\t2"],
+    ]
+
+
+def _fake_blast(whitelist_tsv, resolver_tsv):
+    def fake(query_fa, db_prefix, threads, outfmt, max_target_seqs=50, tee=None, gzip_tee=False, task="blastn"):
+        assert max_target_seqs == 100
+        return (resolver_tsv if "resolver" in Path(query_fa).name else whitelist_tsv).splitlines()
+    return fake
+
+
+@patch("swineotype.main.run")
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+def test_process_batch_demultiplexes_both_stages(mock_run_blast, mock_ensure_tool, mock_run, tmp_path):
+    config = dict(load_config(), tmp_dir=tmp_path / "scratch", keep_debug=0, batch_size=2)
+    config["tmp_dir"].mkdir()
+    s20, s14 = tmp_path / "iso20.fasta", tmp_path / "iso14.fasta"
+    s20.write_text(">c1\nACGT\n")
+    s14.write_text(">ctgA\n" + "A" * 491 + "G" + "A" * 10 + "\n")
+    mock_run_blast.side_effect = _fake_blast(
+        "wzy_AB737826\ts0__c1\t99\t1000\t1000\t0\t1800\t1\t1000\t1\t1000\n"
+        "wzx_AB737826\ts0__c1\t99\t1000\t1000\t0\t1700\t1\t1000\t1\t1000\n"
+        "wzy_AB737822\ts1__ctgA\t99\t1000\t1000\t0\t1800\t1\t1000\t1\t1000\n",
+        "cps14K|pair=1_vs_14|pos=492|G_serotype=14|CT_serotype=1\ts1__ctgA\t99\t1000\t1000\t0\t1800\t1\t1000\t1\t1000\n",
+    )
+
+    rows = process_batch([str(s20), str(s14)], tmp_path / "out", 2, config)
+
+    assert mock_run.call_args[0][0][0] == "makeblastdb"
+    assert mock_run_blast.call_count == 2
+    assert [(r["sample"], r["status"], r["final_serotype"]) for r in rows] == [
+        ("iso20", "STAGE1", "20"), ("iso14", "STAGE2", "14")]
+    assert (rows[1]["contig"], rows[1]["contig_pos"], rows[1]["base"]) == ("ctgA", 492, "G")
@@ -1,5 +1,7 @@
+import os
+from pathlib import Path
 from unittest.mock import patch
-from swineotype.blast import run_blast
+from swineotype.blast import run_blast, make_db_if_needed, evict_lru, drop_db, hold_db
 
 @patch("subprocess.run")
 def test_run_blast(mock_run):
@@ -25,3 +27,90 @@ def test_run_blast(mock_run):
         cwd=None,
         text=True,
     )
+
+
+def _fake_makeblastdb(cmd, *args, **kwargs):
+    out = cmd[cmd.index("-out") + 1]
+    with open(out + ".nsq", "wb") as fh:
+        fh.write(b"x" * 100)
+
+
+@patch("swineotype.blast.run", side_effect=_fake_makeblastdb)
+def test_make_db_if_needed_is_content_addressed(mock_run, tmp_path):
+    a, b, c = tmp_path / "a", tmp_path / "b", tmp_path / "c"
+    for d in (a, b, c):
+        d.mkdir()
+    (a / "sample1.fasta").write_text(">s\nACGT\n")
+    (b / "sample1.fasta").write_text(">s\nTTTT\n")
+    (c / "renamed.fasta").write_text(">s\nACGT\n")
+    cache = tmp_path / "cache"
+
+    db_a = make_db_if_needed(str(a / "sample1.fasta"), cache)
+    db_b = make_db_if_needed(str(b / "sample1.fasta"), cache)
+    db_c = make_db_if_needed(str(c / "renamed.fasta"), cache)
+
+    assert db_a != db_b
+    assert db_a == db_c
+    assert mock_run.call_count == 2
+    assert not [p for p in (cache / "db_cache").iterdir() if p.name.startswith(".build-")]
+
+
+@patch("swineotype.blast.run", side_effect=_fake_makeblastdb)
+def test_evict_lru_keeps_cache_within_budget(mock_run, tmp_path):
+    cache = tmp_path / "cache"
+    prefixes = []
+    for i, seq in enumerate(("AAAA", "CCCC", "GGGG")):
+        fa = tmp_path / f"s{i}.fasta"
+        fa.write_text(f">s\n{seq}\n")
+        prefixes.append(make_db_if_needed(str(fa), cache))
+        entry = Path(prefixes[-1]).parent
+        os.utime(entry, (1000 + i, 1000 + i))
+
+    evict_lru(cache / "db_cache", max_bytes=200, grace=0)
+
+    remaining = sorted(p.name for p in (cache / "db_cache").iterdir())
+    assert remaining == sorted(Path(p).parent.name for p in prefixes[1:])
+
+
+@patch("swineotype.blast.run", side_effect=_fake_makeblastdb)
+def test_held_db_survives_drop_and_eviction(mock_run, tmp_path):
+    cache = tmp_path / "cache"
+    fa = tmp_path / "s.fasta"
+    fa.write_text(">s\nACGT\n")
+    entry = Path(make_db_if_needed(str(fa), cache)).parent
+    os.utime(entry, (1000, 1000))
+
+    with hold_db(entry):  # another worker typing identical content
+        drop_db(str(fa), cache)
+        evict_lru(cache / "db_cache", max_bytes=0, grace=0)
+        assert entry.is_dir()
+    evict_lru(cache / "db_cache", max_bytes=0, grace=0, pinned={entry})  # prefetched for a queued sample
+    assert entry.is_dir()
+    drop_db(str(fa), cache)
+
+    assert list((cache / "db_cache").iterdir()) == []
+
+
+def test_stream_lines_tees_output_and_reports_failures(tmp_path):
+    import gzip
+    import subprocess
+    import sys
+    import pytest
+    from swineotype.blast import stream_lines, iter_hsps
+
+    script = "print('q1\\tc1\\t99.5\\t100\\t120\\t0\\t180\\t1\\t100\\t500\\t401'); print('truncated')"
+    tee = tmp_path / "out.tsv.gz"
+    hsps = list(iter_hsps(stream_lines([sys.executable, "-c", script], tee=tee, gzip_tee=True)))
+    assert [(h.allele, h.contig, h.astart, h.cstart, h.cend) for h in hsps] == [("q1", "c1", 1, 500, 401)]
+    assert gzip.open(tee, "rt").read().splitlines()[1] == "truncated"
+
+    failing = [sys.executable, "-c", "import sys; print('partial'); sys.exit('BLAST Database error')"]
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        list(stream_lines(failing))
+    assert "BLAST Database error" in excinfo.value.stderr
+
+
+def test_blast_cmd_task():
+    from swineotype.blast import blast_cmd
+    cmd = blast_cmd("query.fasta", "db_prefix", 4, "outfmt", task="megablast")
+    assert cmd[cmd.index("-task") + 1] == "megablast"
@@ -1,3 +1,4 @@
+import os
 from unittest.mock import patch
 from click.testing import CliRunner
 from swineotype.main import main
@@ -54,3 +55,43 @@ def test_main_cli_app(mock_run_app_analysis):
         # The first argument of the first call to the mock
         called_args, called_kwargs = mock_run_app_analysis.call_args
         assert called_kwargs['assembly'] == ['*.fasta']
+
+
+@patch("swineotype.main.process_one")
+@patch("swineotype.main.ensure_tool")
+def test_main_cli_failed_sample_does_not_abort_batch(mock_ensure_tool, mock_process_one):
+    def fake_process_one(asm, out_dir, threads, config):
+        if asm == "a.fasta":
+            raise RuntimeError("makeblastdb failed")
+        return {"sample": asm, "status": "STAGE1", "final_serotype": "2"}
+    mock_process_one.side_effect = fake_process_one
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        for name in ("a.fasta", "b.fasta"):
+            with open(name, "w") as f:
+                f.write(">x\nACGT")
+        result = runner.invoke(main, ["--out_dir", "out", "--assembly", "a.fasta", "--assembly", "b.fasta",
+                                      "--merged_csv", "out/summary.csv"])
+        assert result.exit_code == 0
+        assert "[OK] b.fasta => 2 (STAGE1)" in result.output
+        lines = open("out/summary.csv").read().splitlines()
+        assert lines[1].startswith("a,") and ",ERROR," in lines[1]
+        assert lines[2].startswith("b.fasta,")
+
+
+@patch("swineotype.main.process_one")
+@patch("swineotype.main.ensure_tool")
+def test_main_cli_rejects_same_sample_name_from_two_folders(mock_ensure_tool, mock_process_one, tmp_path):
+    mock_process_one.return_value = {"sample": "x", "status": "STAGE1", "final_serotype": "2"}
+    runner = CliRunner(env={"SWINEO_SCRATCH_DIR": str(tmp_path / "scratch")})
+    with runner.isolated_filesystem():
+        for folder in ("run1", "run2"):
+            os.makedirs(folder)
+            with open(f"{folder}/x.fasta", "w") as f:
+                f.write(">x\nACGT")
+        result = runner.invoke(main, ["--out_dir", "out", "--assembly", "run*/x.fasta"])
+        assert result.exit_code == 1 and "same sample name 'x'" in result.output
+        mock_process_one.assert_not_called()
+
+        result = runner.invoke(main, ["--out_dir", "out", "--assembly", "run1/x.fasta", "--assembly", "run1/x.fasta"])
+        assert result.exit_code == 0 and mock_process_one.call_count == 1
@@ -1,3 +1,4 @@
+import pytest
 from swineotype.config import load_config
 
 from unittest.mock import patch
@@ -15,3 +16,21 @@ def test_load_config_env_vars():
         assert config["plurality"] == 0.75
         assert config["delta"] == 200
 
+
+def test_blast_tasks_accepts_a_yaml_list_or_a_string(tmp_path):
+    from swineotype.stages import blast_tasks
+    (tmp_path / "list.yaml").write_text("blast_tasks: [megablast, blastn]\n")
+    (tmp_path / "str.yaml").write_text("blast_tasks: 'megablast, blastn'\n")
+    (tmp_path / "bad.yaml").write_text("blast_tasks: [megablast, tblastx]\n")
+    for name in ("list.yaml", "str.yaml"):
+        config = load_config(str(tmp_path / name))
+        assert config["blast_tasks"] == "megablast,blastn"
+        assert blast_tasks(config) == blast_tasks({"blast_tasks": ["megablast", "blastn"]}) == ["megablast", "blastn"]
+    with pytest.raises(ValueError, match="blast_tasks"):
+        load_config(str(tmp_path / "bad.yaml"))
+
+
+def test_kmer_prefilter_and_tiered_stage1_are_exclusive():
+    with patch.dict("os.environ", {"SWINEO_KMER_PREFILTER": "1", "SWINEO_TIERED_STAGE1": "1"}):
+        with pytest.raises(ValueError, match="kmer_prefilter and tiered_stage1"):
+            load_config()
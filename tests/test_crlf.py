@@ -4,7 +4,7 @@ import shutil
 import tempfile
 import pytest
 from pathlib import Path
-from swineotype.utils import ensure_unix_line_endings
+from swineotype.utils import ensure_unix_line_endings, stage_assembly, sample_name
 
 def test_ensure_unix_line_endings():
     with tempfile.TemporaryDirectory() as tmp_dir:
@@ -32,3 +32,35 @@ def test_ensure_unix_line_endings():
 if __name__ == "__main__":
     test_ensure_unix_line_endings()
     print("Test passed!")
+
+
+def test_stage_assembly_streams_gzip_and_split_crlf(tmp_path):
+    import gzip
+    src = tmp_path / "in" / "sample.fasta.gz"
+    src.parent.mkdir()
+    with gzip.open(src, "wb") as fh:
+        fh.write(b">c1 desc\r\nACGT\r\nAC\r\n>c2\r\nACGTACGTAC\r\n>c3\r\nA")
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+
+    # A 3-byte chunk size splits CRLF pairs and header lines across chunks.
+    staged, stats = stage_assembly(str(src), str(scratch), chunk_size=3)
+
+    assert Path(staged).name.endswith("-sample.fasta")
+    assert Path(staged).read_bytes() == b">c1 desc\nACGT\nAC\n>c2\nACGTACGTAC\n>c3\nA"
+    assert stats == {"n_contigs": 3, "total_length": 17, "n50": 10}
+    assert sample_name(str(src)) == "sample"
+
+
+def test_stage_assembly_links_lf_clean_input(tmp_path):
+    src = tmp_path / "in" / "sample.fasta"
+    src.parent.mkdir()
+    src.write_bytes(b">c1\nACGT\n>c2\nAC\n")
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+
+    staged, stats = stage_assembly(str(src), str(scratch))
+
+    assert Path(staged).read_bytes() == src.read_bytes()
+    assert os.stat(staged).st_ino == os.stat(src).st_ino
+    assert stats == {"n_contigs": 2, "total_length": 6, "n50": 4}
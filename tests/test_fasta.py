@@ -0,0 +1,40 @@
+import pytest
+from swineotype.fasta import FastaIndex, build_fai
+
+
+def test_build_fai_matches_samtools_layout(tmp_path):
+    unix = tmp_path / "unix.fasta"
+    unix.write_bytes(b">seq1 desc\nACGTACGT\nAC\n>seq2\nGGGG\n")
+    dos = tmp_path / "dos.fasta"
+    dos.write_bytes(b">seq1\r\nACGTACGT\r\nAC\r\n")
+
+    assert build_fai(unix) == {"seq1": (10, 11, 8, 9), "seq2": (4, 29, 4, 5)}
+    assert build_fai(dos) == {"seq1": (10, 7, 8, 10)}
+
+
+def test_build_fai_rejects_ragged_lines(tmp_path):
+    fa = tmp_path / "ragged.fasta"
+    fa.write_bytes(b">seq1\nACGT\nAC\nACGT\n")
+    with pytest.raises(ValueError):
+        build_fai(fa)
+
+
+def test_fasta_index_fetch(tmp_path):
+    fa = tmp_path / "asm.fasta"
+    fa.write_bytes(b">ctg1\nACGTACGT\nacTT\n>ctg2\nGGGCCC\n")
+    with FastaIndex(fa) as reader:
+        assert reader.names() == ["ctg1", "ctg2"]
+        assert reader.fetch("ctg1", 7, 10) == "GTac"
+        assert reader.base("ctg1", 9) == "A"
+        assert reader.base("ctg1", 13) == "N"
+        assert reader.base("missing", 1) == "N"
+        assert reader.sequence("ctg2") == "GGGCCC"
+
+
+def test_fasta_index_reuses_fresh_fai(tmp_path):
+    fa = tmp_path / "asm.fasta"
+    fa.write_bytes(b">ctg1\nACGT\n")
+    (tmp_path / "asm.fasta.fai").write_text("ctg1\t4\t6\t4\t5\n")
+    with FastaIndex(fa) as reader:
+        assert reader.index == {"ctg1": (4, 6, 4, 5)}
+        assert reader.base("ctg1", 4) == "T"
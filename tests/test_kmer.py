@@ -0,0 +1,101 @@
+import random
+from pathlib import Path
+from unittest.mock import patch
+
+from swineotype.fasta import read_fasta
+from swineotype.kmer import candidate_alleles, prefilter_whitelist, subset_fasta
+from swineotype.stages import stage1_score
+
+CONFIG = {"kmer_size": 15, "kmer_stride": 4, "kmer_min_hits": 3, "pair_1_14": {"1", "14"},
+          "pair_2_1_2": {"2", "1/2"}, "min_pid": 85.0, "min_cov": 0.8, "plurality": 0.6, "delta": 100,
+          "ambig_set": {"1", "14", "2", "1/2"}, "keep_debug": False}
+
+
+def random_seq(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice("ACGT") for _ in range(n))
+
+
+def write_whitelist(path: Path, rng: random.Random) -> dict:
+    seqs = {}
+    for st in ("1", "14", "7", "9"):
+        for cls in ("wzx", "wzy"):
+            seqs[(f"{cls}_{st}", st)] = random_seq(rng, 900)
+    path.write_text("".join(f">{aid} [type_id={st}]\n{seq}\n" for (aid, st), seq in seqs.items()))
+    return {aid: seq for (aid, _), seq in seqs.items()}
+
+
+def test_candidates_keep_serotype_and_pair_partner(tmp_path):
+    rng = random.Random(3)
+    alleles = write_whitelist(tmp_path / "wl.fasta", rng)
+    # wzy of serotype 14, reverse-complemented, with ~4% mismatches.
+    allele = "".join(b if rng.random() > 0.04 else rng.choice("ACGT") for b in alleles["wzy_14"])
+    rc = allele.translate(str.maketrans("ACGT", "TGCA"))[::-1]
+    (tmp_path / "asm.fa").write_text(f">c1\n{random_seq(rng, 5000)}{rc}{random_seq(rng, 5000)}\n")
+
+    ids = candidate_alleles(tmp_path / "asm.fa", tmp_path / "wl.fasta", CONFIG)
+
+    assert ids == ["wzx_1", "wzy_1", "wzx_14", "wzy_14"]
+
+
+def test_no_hit_searches_full_whitelist(tmp_path):
+    rng = random.Random(4)
+    write_whitelist(tmp_path / "wl.fasta", rng)
+    (tmp_path / "asm.fa").write_text(f">c1\n{random_seq(rng, 5000)}\n")
+    config = dict(CONFIG, tmp_dir=tmp_path / "tmp")
+
+    query, n = prefilter_whitelist(tmp_path / "asm.fa", tmp_path / "wl.fasta", config)
+
+    assert query == tmp_path / "wl.fasta" and n == 8
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_stage1_blasts_only_candidates(mock_make_db, mock_stream_blast, mock_ensure_tool, tmp_path):
+    rng = random.Random(5)
+    alleles = write_whitelist(tmp_path / "wl.fasta", rng)
+    (tmp_path / "asm.fa").write_text(f">c1\n{alleles['wzx_7']}{random_seq(rng, 500)}{alleles['wzy_7']}\n")
+    mock_make_db.return_value = "db_prefix"
+    mock_stream_blast.return_value = ["wzy_7\tc1\t100\t900\t900\t0\t1600\t1\t900\t1401\t2300"]
+    config = dict(CONFIG, kmer_prefilter=1, tmp_dir=tmp_path / "tmp")
+
+    result = stage1_score(str(tmp_path / "asm.fa"), str(tmp_path / "wl.fasta"), 1, tmp_path, config)
+
+    query = mock_stream_blast.call_args[0][0]
+    assert list(read_fasta(query)) == ["wzx_7", "wzy_7"]
+    assert result["top"] == "7"
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_validation_reports_disagreement_and_keeps_full_result(mock_make_db, mock_stream_blast, mock_ensure_tool,
+                                                               tmp_path, capsys):
+    rng = random.Random(6)
+    alleles = write_whitelist(tmp_path / "wl.fasta", rng)
+    (tmp_path / "asm.fa").write_text(f">c1\n{alleles['wzy_7']}\n")
+    mock_make_db.return_value = "db_prefix"
+    mock_stream_blast.side_effect = [
+        ["wzy_7\tc1\t100\t900\t900\t0\t1600\t1\t900\t1\t900"],
+        ["wzy_7\tc1\t100\t900\t900\t0\t1600\t1\t900\t1\t900", "wzy_9\tc1\t90\t900\t900\t0\t1500\t1\t900\t1\t900"],
+    ]
+    config = dict(CONFIG, kmer_prefilter=1, kmer_validate=1, tmp_dir=tmp_path / "tmp")
+
+    result = stage1_score(str(tmp_path / "asm.fa"), str(tmp_path / "wl.fasta"), 1, tmp_path, config)
+
+    assert result["decisive"] is False and set(result["scores"]) == {"7", "9"}
+    out = capsys.readouterr()
+    assert "DISAGREES" in out.err and out.out == ""
+
+
+def test_subset_fasta_is_safe_across_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    fa = tmp_path / "refs.fasta"
+    fa.write_text("".join(f">a{i}\n{'ACGT' * 50}\n" for i in range(20000)))
+    ids = [f"a{i}" for i in range(0, 20000, 2)]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        paths = list(pool.map(lambda _: subset_fasta(fa, ids, tmp_path / "tmp"), range(80)))
+
+    assert len(set(paths)) == 1 and list(read_fasta(paths[0])) == ids
+    assert [p.name for p in paths[0].parent.iterdir()] == [paths[0].name]
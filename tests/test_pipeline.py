@@ -0,0 +1,40 @@
+import os
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from swineotype.main import iter_results
+
+CONFIG = {"batch_size": 0, "result_cache": 0, "clean_temp": 0, "tmp_dir": "tmp", "search_mode": "asm_db"}
+
+
+@patch("swineotype.main.type_staged")
+@patch("swineotype.main.make_db_if_needed")
+@patch("swineotype.main.stage_assembly")
+def test_pipeline_yields_in_order_with_bounded_prefetch(mock_stage, mock_make_db, mock_type_staged, tmp_path):
+    def stage(asm, tmp_dir):
+        if asm == "bad.fasta": raise OSError("unreadable")
+        staged = tmp_path / f"staged-{asm}"
+        staged.write_text(f">c\n{asm}\n")
+        return str(staged), {"n_contigs": 1, "total_length": 4, "n50": 4}
+
+    def type_staged(staged, run_dir, threads, config):  # runs in a worker process
+        time.sleep(0.05 if staged.endswith("0.fasta") else 0)
+        assert config["db_cache_max_bytes"] == 0  # only the prefetch threads evict
+        return {"status": "STAGE1", "final_serotype": "2", "pid": os.getpid()}
+
+    mock_stage.side_effect, mock_type_staged.side_effect = stage, type_staged
+    assemblies = [f"s{i}.fasta" for i in range(8)] + ["bad.fasta"]
+    config = dict(CONFIG, tmp_dir=tmp_path / "scratch", db_cache_max_bytes=1 << 30)
+
+    rows = []
+    for asm, row in iter_results(assemblies, tmp_path, 1, config, jobs=2, prefetch=2):
+        rows.append((asm, row))
+        assert mock_stage.call_count - len(rows) <= 2 + 2  # samples staged but not yet yielded
+
+    assert [asm for asm, _ in rows] == assemblies
+    assert [row["sample"] for _, row in rows[:8]] == [f"s{i}" for i in range(8)]
+    assert rows[-1][1]["status"] == "ERROR" and "unreadable" in rows[-1][1]["error"]
+    assert mock_make_db.call_count == 8
+    assert mock_make_db.call_args.kwargs["pinned"] == set()  # emptied as rows are collected
+    assert os.getpid() not in {row["pid"] for _, row in rows[:8]}
@@ -0,0 +1,48 @@
+import json
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+from swineotype.blast import run
+from swineotype.main import main
+from swineotype.profiling import step, summary_table, trace_sample
+
+
+def test_steps_nest_and_are_ignored_outside_a_trace():
+    with step("untraced"):
+        pass
+    with trace_sample("s1") as trace:
+        with step("stage1"):
+            with step("blastn"):
+                pass
+    assert [(r["step"], r["parent"], r["sample"]) for r in trace.records] == [("blastn", "stage1", "s1"),
+                                                                             ("stage1", "", "s1")]
+    assert all(r["wall_s"] >= 0 and r["peak_rss_kb"] > 0 for r in trace.records)
+
+
+@patch("swineotype.blast.subprocess.run")
+def test_run_is_traced_by_command_name(mock_run):
+    with trace_sample("s1") as trace:
+        run(["/usr/bin/makeblastdb", "-in", "x.fasta"])
+    assert [r["step"] for r in trace.records] == ["makeblastdb"]
+    assert "makeblastdb" in summary_table(trace.records)
+
+
+@patch("swineotype.main._process_one")
+@patch("swineotype.main.ensure_tool")
+def test_cli_profile_writes_trace(mock_ensure_tool, mock_process_one):
+    def fake_process_one(asm, out_dir, threads, config):
+        with step("stage1"):
+            return {"sample": asm, "status": "STAGE1", "final_serotype": "2"}
+    mock_process_one.side_effect = fake_process_one
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("a.fasta", "w") as f:
+            f.write(">x\nACGT")
+        result = runner.invoke(main, ["--out_dir", "out", "--assembly", "a.fasta", "--profile", "trace.jsonl",
+                                      "--merged_csv", "out/summary.csv"])
+        assert result.exit_code == 0
+        records = [json.loads(line) for line in open("trace.jsonl")]
+        assert [(r["sample"], r["step"], r["parent"]) for r in records] == [("a", "stage1", "total"), ("a", "total", "")]
+        assert "trace" not in open("out/summary.csv").read()
+        assert "peak_rss_MB" in result.output
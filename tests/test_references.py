@@ -0,0 +1,46 @@
+import json
+from unittest.mock import patch
+
+from swineotype import references
+from swineotype.references import bundle_path, load_references
+from swineotype.utils import file_digest
+
+
+def write_refs(tmp_path, serotype="7"):
+    (tmp_path / "wl.fasta").write_text(f">wzy_{serotype} [type_id={serotype}]\nACGT\n>wzx_9 [type_id=9]\nACGT\n")
+    (tmp_path / "refs.fasta").write_text(">cps1L|pair=1_vs_14|pos=2|G_serotype=14|CT_serotype=1\nACGT\n")
+    return {"wzxwzy_fasta": tmp_path / "wl.fasta", "resolver_refs_fasta": tmp_path / "refs.fasta",
+            "tmp_dir": tmp_path / "tmp"}
+
+
+def test_bundle_is_compiled_once_and_reloaded_from_disk(tmp_path):
+    config = write_refs(tmp_path)
+    bundle = load_references(config)
+    assert bundle.allele_to_type == {"wzy_7": "7", "wzx_9": "9"}
+    assert bundle.resolver_ids == {"cps1L|pair=1_vs_14|pos=2|G_serotype=14|CT_serotype=1"}
+    assert load_references(config) is bundle
+
+    references._LOADED.clear()  # as in a fresh worker process
+    with patch("swineotype.references.parse_whitelist_headers") as mock_parse:
+        reloaded = load_references(config)
+    mock_parse.assert_not_called()
+    assert reloaded.allele_to_type == bundle.allele_to_type
+
+
+def test_bundle_is_rebuilt_when_a_fasta_changes(tmp_path):
+    config = write_refs(tmp_path)
+    old = load_references(config)
+    config = write_refs(tmp_path, serotype="5")
+    new = load_references(config)
+    assert new is not old and new.allele_to_type["wzy_5"] == "5"
+    path = bundle_path(config, file_digest(config["wzxwzy_fasta"]), file_digest(config["resolver_refs_fasta"]))
+    assert json.loads(path.read_text())["allele_to_type"]["wzy_5"] == "5"
+
+
+def test_corrupt_bundle_is_replaced(tmp_path):
+    config = write_refs(tmp_path)
+    path = bundle_path(config, file_digest(config["wzxwzy_fasta"]), file_digest(config["resolver_refs_fasta"]))
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"not json")
+    references._LOADED.clear()
+    assert load_references(config).allele_to_type["wzy_7"] == "7"
@@ -0,0 +1,107 @@
+import csv
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from swineotype.config import load_config
+from swineotype.main import process_one
+from swineotype.results import (ResultCache, result_cache_key, merge_rows_into_csv, CsvResultWriter,
+                                ParquetResultWriter)
+
+
+def test_result_cache_key_tracks_content_and_settings(tmp_path):
+    config = load_config()
+    asm = tmp_path / "a.fasta"
+    asm.write_text(">c\nACGT\n")
+    key = result_cache_key(str(asm), config)
+
+    assert result_cache_key(str(asm), dict(config, tmp_dir=tmp_path / "elsewhere")) == key
+    assert result_cache_key(str(asm), dict(config, min_pid=90.0)) != key
+    assert result_cache_key(str(asm), dict(config, search_mode="ref_db")) != key
+    assert result_cache_key(str(asm), dict(config, search_mode="ref_db", combined_search=1)) != \
+        result_cache_key(str(asm), dict(config, search_mode="ref_db"))
+    assert result_cache_key(str(asm), dict(config, batch_size=8)) != key
+    assert result_cache_key(str(asm), dict(config, batch_size=1)) == key
+    asm.write_text(">c\nACGG\n")
+    assert result_cache_key(str(asm), config) != key
+
+
+@patch("swineotype.main.type_staged")
+def test_process_one_reuses_cached_result(mock_type_staged, tmp_path):
+    mock_type_staged.return_value = {"sample": "ignored", "status": "STAGE1", "final_serotype": "7"}
+    config = dict(load_config(), tmp_dir=tmp_path / "scratch", result_cache=1)
+    asm = tmp_path / "iso1.fasta"
+    asm.write_text(">c\nACGT\n")
+
+    first = process_one(str(asm), tmp_path / "out", 1, config)
+    second = process_one(str(asm), tmp_path / "out", 1, config)
+
+    assert mock_type_staged.call_count == 1
+    assert first["sample"] == second["sample"] == "iso1"
+    assert second["final_serotype"] == "7" and second["cached"] is True
+    assert ResultCache(tmp_path / "out" / ".result_cache").get(result_cache_key(str(asm), config)) is not None
+
+
+def test_merge_rows_into_csv_deduplicates_per_sample(tmp_path):
+    path = tmp_path / "summary.csv"
+    path.write_text("sample,status,final_serotype,app_serovar\na,STAGE1,2,\nb,NO_CALL_STAGE2,,\n")
+
+    merge_rows_into_csv(path, [{"sample": "b", "status": "STAGE2", "final_serotype": "14"},
+                               {"sample": "c", "status": "STAGE1", "final_serotype": "9, variant"}],
+                        ["sample", "status", "final_serotype"])
+
+    with open(path, newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    assert [r["sample"] for r in rows] == ["a", "b", "c"]
+    assert rows[1]["final_serotype"] == "14"
+    assert rows[2]["final_serotype"] == "9, variant"
+    assert "app_serovar" in rows[0]
+
+
+def test_merge_rows_into_csv_keeps_typed_row_over_later_error(tmp_path):
+    path = tmp_path / "summary.csv"
+    path.write_text("sample,status,final_serotype\na,STAGE1,2\nb,ERROR,\nb,STAGE2,14\nb,ERROR,\n")
+
+    merge_rows_into_csv(path, [{"sample": "a", "status": "ERROR", "final_serotype": ""},
+                               {"sample": "c", "status": "ERROR", "final_serotype": ""}],
+                        ["sample", "status", "final_serotype"])
+
+    with open(path, newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    assert [(r["sample"], r["status"], r["final_serotype"]) for r in rows] == [
+        ("a", "STAGE1", "2"), ("b", "STAGE2", "14"), ("c", "ERROR", "")]
+
+
+def test_csv_writer_flushes_each_row_and_compacts_on_close(tmp_path):
+    path = tmp_path / "summary.csv"
+    path.write_text("sample,status,app_serovar\na,STAGE1,\nb,NO_CALL_STAGE2,")
+
+    writer = CsvResultWriter(path, ["sample", "status", "final_serotype"])
+    writer.write({"sample": "b", "status": "STAGE2", "final_serotype": "14"})
+    writer.write({"sample": "c", "status": "STAGE1", "final_serotype": "9, variant"})
+    with open(path, newline="") as fh:  # readable mid-run, before close
+        assert [r["sample"] for r in csv.DictReader(fh)] == ["a", "b", "b", "c"]
+    writer.close()
+
+    with open(path, newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    assert [(r["sample"], r["status"], r["final_serotype"]) for r in rows] == [
+        ("a", "STAGE1", ""), ("b", "STAGE2", "14"), ("c", "STAGE1", "9, variant")]
+    assert "app_serovar" in rows[0]
+
+
+def test_parquet_writer_types_columns(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    writer = ParquetResultWriter(tmp_path / "summary.parquet", row_group_size=1)
+    writer.write({"sample": "a", "status": "STAGE2", "final_serotype": "14", "stage1_top": "14",
+                  "stage1_fraction": 0.5, "stage1_delta": 0.0, "stage1_scores": "14=2000.0;1=2000.0",
+                  "contig_pos": 1234, "n_contigs": 40, "total_length": 2100000, "n50": 90000})
+    writer.write({"sample": "b", "status": "ERROR", "error": "RuntimeError: boom", "contig_pos": ""})
+    writer.close()
+
+    table = pq.read_table(tmp_path / "summary.parquet", columns=["sample", "stage1_fraction", "stage1_scores", "contig_pos"])
+    assert str(table.schema.field("contig_pos").type) == "int64"
+    rows = table.to_pylist()
+    assert rows[0]["stage1_scores"] == [("14", 2000.0), ("1", 2000.0)] and rows[0]["contig_pos"] == 1234
+    assert rows[1]["stage1_fraction"] is None and rows[1]["contig_pos"] is None
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from swineotype.blast import Hsp
+from swineotype.scoring import resolve_engine, score_stage1_hsps, score_stage1_many
+
+pytest.importorskip("numpy")
+
+CONFIG = {"min_pid": 85.0, "min_cov": 0.80, "plurality": 0.60, "delta": 100,
+          "ambig_set": {"1", "14"}, "scoring_engine": "numpy"}
+ALLELE_TO_TYPE = {f"wzy_{t}_{k}": t for t in ("1", "2", "7", "14") for k in range(3)}
+
+
+def random_hsps(rng: random.Random, n: int) -> list[Hsp]:
+    hsps = []
+    for _ in range(n):
+        allele = rng.choice(list(ALLELE_TO_TYPE) + ["unlisted_allele"])
+        alen = 1000 + 100 * int(allele[-1]) if allele[-1].isdigit() else 900
+        start = rng.randint(1, alen - 50)
+        end = min(alen, start + rng.randint(20, 900))
+        hsps.append(Hsp(allele, f"contig{rng.randint(1, 3)}", round(rng.uniform(80, 100), 3), end - start + 1,
+                        alen, round(rng.uniform(50, 1800), 1), start, end, 1, end - start + 1))
+    return hsps
+
+
+def test_numpy_engine_matches_python_engine():
+    rng = random.Random(7)
+    samples = [random_hsps(rng, rng.randint(0, 60)) for _ in range(40)]
+    vectorized = score_stage1_many(samples, ALLELE_TO_TYPE, CONFIG)
+    for hsps, got in zip(samples, vectorized):
+        expected = score_stage1_hsps(hsps, ALLELE_TO_TYPE, CONFIG)
+        assert list(got["scores"].items()) == list(expected["scores"].items())
+        assert got == expected
+
+
+def test_engines_add_floats_in_the_same_order():
+    # sum() of these is 1.0 with compensated summation (Python 3.12+), 0.9999999999999999 added in order
+    hsps = [Hsp("wzy_1_0", "c1", 99.1, 10, 100, 0.1, 10 * k + 1, 10 * k + 10, 1, 10) for k in range(10)]
+    hsps += [Hsp("wzy_2_0", "c2", 99.0, 100, 100, 0.7, 1, 100, 1, 100)]
+    (vectorized,) = score_stage1_many([hsps], ALLELE_TO_TYPE, CONFIG)
+    assert vectorized["scores"]["1"] == 0.9999999999999999
+    assert vectorized == score_stage1_hsps(hsps, ALLELE_TO_TYPE, CONFIG)
+
+
+def test_numpy_engine_merges_adjacent_intervals():
+    hsps = [Hsp("wzy_1_0", "c1", 99.0, 400, 1000, 700.0, 1, 400, 1, 400),
+            Hsp("wzy_1_0", "c2", 98.0, 400, 1000, 600.0, 401, 800, 1, 400),
+            Hsp("wzy_1_0", "c2", 97.0, 100, 1000, 100.0, 750, 849, 1, 100)]
+    (s1,) = score_stage1_many([hsps], ALLELE_TO_TYPE, CONFIG)
+    assert s1["top"] == "1" and s1["scores"]["1"] == 1400.0
+    assert score_stage1_many([hsps[:1]], ALLELE_TO_TYPE, CONFIG)[0]["top"] is None
+
+
+def test_auto_engine_vectorizes_only_several_samples():
+    assert resolve_engine(dict(CONFIG, scoring_engine="auto")) == "python"
+    assert resolve_engine(dict(CONFIG, scoring_engine="auto"), n_samples=8) == "numpy"
+    assert resolve_engine(CONFIG) == "numpy"
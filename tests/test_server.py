@@ -0,0 +1,95 @@
+import http.client
+import json
+import socket
+import threading
+import time
+from unittest.mock import patch
+
+from swineotype.server import TypingService, make_server
+
+ROW = {"sample": "s1", "status": "STAGE1", "final_serotype": "2"}
+
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def serve(service, **kwargs):
+    server = make_server(service, port=0, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def request(conn, method, path, body=None):
+    conn.request(method, path, body=json.dumps(body) if body is not None else None)
+    resp = conn.getresponse()
+    return resp.status, json.loads(resp.read())
+
+
+@patch("swineotype.server.safe_process_one")
+def test_type_returns_the_process_one_row(mock_process, tmp_path):
+    mock_process.return_value = dict(ROW, trace=[{"step": "total"}])
+    (tmp_path / "s1.fasta").write_text(">c\nACGT\n")
+    service = TypingService({}, tmp_path / "out", workers=2)
+    server = serve(service)
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+
+    assert request(conn, "POST", "/type", {"assembly": str(tmp_path / "s1.fasta")}) == (200, ROW)
+    status, job = request(conn, "POST", "/jobs", {"assembly": str(tmp_path / "s1.fasta")})
+    assert status == 202
+    service.jobs[job["id"]].done.wait(5)
+    assert request(conn, "GET", f"/jobs/{job['id']}")[1]["row"] == ROW
+    assert request(conn, "POST", "/type", {"assembly": str(tmp_path / "missing.fasta")})[0] == 400
+    assert request(conn, "GET", "/jobs/999")[0] == 404
+    mock_process.assert_called_with(str(tmp_path / "s1.fasta"), tmp_path / "out", 1, {})
+
+    server.shutdown(); server.server_close(); service.close()
+
+
+@patch("swineotype.server.safe_process_one")
+def test_full_queue_rejects_and_unix_socket_serves(mock_process, tmp_path):
+    release = threading.Event()
+    mock_process.side_effect = lambda *a: release.wait(5) and dict(ROW)
+    (tmp_path / "s1.fasta").write_text(">c\nACGT\n")
+    service = TypingService({}, tmp_path / "out", workers=1, queue_size=1)
+    server = serve(service, socket_path=str(tmp_path / "sock"))
+    conn = UnixConnection(str(tmp_path / "sock"))
+
+    body = {"assembly": str(tmp_path / "s1.fasta")}
+    first = request(conn, "POST", "/jobs", body)[1]
+    while service.jobs[first["id"]].state != "running": time.sleep(0.01)
+    assert request(conn, "POST", "/jobs", body)[0] == 202
+    assert request(conn, "POST", "/jobs", body)[0] == 503
+    assert request(conn, "GET", "/health")[1] == {"status": "ok", "queued": 1, "capacity": 1, "workers": 1}
+    release.set()
+    assert request(conn, "POST", "/type", body) == (200, ROW)
+
+    server.shutdown(); server.server_close(); service.close()
+
+
+@patch("swineotype.main.type_prepared")
+def test_jobs_for_the_same_sample_do_not_overlap(mock_type, tmp_path):
+    from swineotype.config import load_config
+    active, overlaps = [], []
+
+    def type_prepared(prep, threads, config):
+        active.append(prep["name"]); overlaps.append(len(active))
+        time.sleep(0.05)
+        active.remove(prep["name"])
+        return dict(ROW, sample=prep["name"])
+
+    mock_type.side_effect = type_prepared
+    (tmp_path / "s1.fasta").write_text(">c\nACGT\n")
+    service = TypingService(dict(load_config(), tmp_dir=tmp_path / "scratch"), tmp_path / "out", workers=4)
+    jobs = [service.submit(str(tmp_path / "s1.fasta")) for _ in range(4)]
+    for job in jobs: job.done.wait(5)
+    service.close()
+
+    assert [job.row["status"] for job in jobs] == ["STAGE1"] * 4
+    assert max(overlaps) == 1
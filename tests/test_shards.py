@@ -0,0 +1,88 @@
+import csv
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from click.testing import CliRunner
+
+from swineotype.main import main
+from swineotype.shards import expected_samples, lpt_shards, member_in_shard, merge, merge_shard_csvs, select_shard
+
+
+def test_shards_partition_files_and_balance_sizes(tmp_path):
+    paths = []
+    for i, size in enumerate([900, 100, 500, 400, 300, 300, 200, 100]):
+        (tmp_path / f"s{i}.fasta").write_bytes(b"A" * size)
+        paths.append(str(tmp_path / f"s{i}.fasta"))
+
+    shards = [select_shard(paths, i, 3) for i in (1, 2, 3)]
+
+    assert sorted(sum(shards, [])) == sorted(paths)
+    loads = sorted(sum(Path(p).stat().st_size for p in shard) for shard in shards)
+    assert loads == [900, 900, 1000]
+    assert lpt_shards(paths, 3) == lpt_shards(list(paths), 3)
+    assert all(shard == [p for p in paths if p in shard] for shard in shards)  # input order kept
+
+
+def test_archive_members_hash_to_exactly_one_shard():
+    members = [f"bundle/iso{i}.fasta" for i in range(50)]
+    owners = [[i for i in (1, 2, 3, 4) if member_in_shard(m, i, 4)] for m in members]
+    assert all(len(o) == 1 for o in owners) and len({o[0] for o in owners}) == 4
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=["sample", "status", "final_serotype"])
+        writer.writeheader(); writer.writerows(rows)
+
+
+def test_merge_orders_dedups_and_reports_missing(tmp_path):
+    for name in ("a", "b", "c", "d"):
+        (tmp_path / f"{name}.fasta").write_text(">c\nACGT\n")
+    write_csv(tmp_path / "shard1.csv", [{"sample": "c", "status": "STAGE1", "final_serotype": "7"},
+                                        {"sample": "a", "status": "ERROR", "final_serotype": ""}])
+    write_csv(tmp_path / "shard2.csv", [{"sample": "a", "status": "STAGE2", "final_serotype": "14"},
+                                        {"sample": "c", "status": "ERROR", "final_serotype": ""}])
+    runner = CliRunner()
+    args = [str(tmp_path / "shard1.csv"), str(tmp_path / "shard2.csv"), "--out", str(tmp_path / "all.csv"),
+            "--assembly", str(tmp_path / "*.fasta")]
+
+    result = runner.invoke(merge, args)
+
+    assert result.exit_code == 1 and "2 of 4 sample(s) missing: b, d" in result.output
+    rows = list(csv.DictReader(open(tmp_path / "all.csv")))
+    assert [(r["sample"], r["final_serotype"]) for r in rows] == [("a", "14"), ("c", "7")]
+    assert runner.invoke(merge, args + ["--allow_missing"]).exit_code == 0
+
+
+@patch("swineotype.main.process_one")
+@patch("swineotype.main.ensure_tool")
+def test_cli_types_only_its_shard(mock_ensure_tool, mock_process_one, tmp_path):
+    mock_process_one.side_effect = lambda asm, *a: {"sample": Path(asm).stem, "status": "STAGE1", "final_serotype": "2"}
+    runner = CliRunner(env={"SWINEO_SCRATCH_DIR": str(tmp_path / "scratch")})
+    with runner.isolated_filesystem():
+        for i, size in enumerate([400, 300, 200, 100]):
+            Path(f"s{i}.fasta").write_text(">c\n" + "A" * size + "\n")
+        typed = []
+        for i in (1, 2):
+            result = runner.invoke(main, ["--out_dir", "out", "--assembly", "*.fasta", "--shard", f"{i}/2"])
+            assert result.exit_code == 0, result.output
+            typed.append(sorted(Path(c.args[0]).stem for c in mock_process_one.call_args_list))
+            mock_process_one.reset_mock()
+        assert typed == [["s0", "s3"], ["s1", "s2"]]
+        assert runner.invoke(main, ["--out_dir", "out", "--assembly", "*.fasta", "--shard", "3/2"]).exit_code == 2
+
+
+def test_merge_rejects_duplicate_sample_names(tmp_path):
+    for folder in ("run1", "run2"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "a.fasta").write_text(">c\nACGT\n")
+    write_csv(tmp_path / "shard1.csv", [{"sample": "a", "status": "STAGE1", "final_serotype": "7"}])
+
+    result = CliRunner().invoke(merge, [str(tmp_path / "shard1.csv"), "--out", str(tmp_path / "all.csv"),
+                                        "--assembly", str(tmp_path / "run*" / "a.fasta")])
+    assert result.exit_code == 2 and "same sample name 'a'" in result.output
+    assert expected_samples([str(tmp_path / "run1" / "a.fasta")] * 2) == ["a"]
+    with pytest.raises(ValueError, match="more than once: a"):
+        merge_shard_csvs([str(tmp_path / "shard1.csv")], tmp_path / "all.csv", ["a", "b", "a"])
+    assert not (tmp_path / "all.csv").exists()
@@ -3,10 +3,10 @@ from unittest.mock import patch
 from pathlib import Path
 from swineotype.stages import stage1_score
 
-from swineotype.stages import stage2_resolver_call, interpret_resolver
+from swineotype.stages import final_call, stage2_resolver_call, interpret_resolver, parse_hsps, select_resolver_hsp, search_combined
 
 @patch("swineotype.stages.ensure_tool")
-@patch("swineotype.stages.run_blast")
+@patch("swineotype.stages.stream_blast")
 @patch("swineotype.stages.make_db_if_needed")
 @patch("swineotype.stages.parse_whitelist_headers")
 def test_stage1_score(mock_parse_whitelist_headers, mock_make_db_if_needed, mock_run_blast, mock_ensure_tool):
@@ -19,7 +19,7 @@ def test_stage1_score(mock_parse_whitelist_headers, mock_make_db_if_needed, mock
         "q1\ts1\t90\t100\t100\t0\t1000\t1\t100\t1\t100\n"
         "q2\ts2\t95\t100\t100\t0\t2000\t1\t100\t1\t100\n"
         "q3\ts3\t80\t100\t100\t0\t200\t1\t100\t1\t100\n"
-    )
+    ).splitlines()
 
     result = stage1_score("assembly.fasta", "whitelist.fasta", 4, Path("run_dir"), {"min_pid": 85.0, "min_cov": 0.8, "plurality": 0.6, "delta": 100, "ambig_set": {"1", "14", "2", "1/2"}, "keep_debug": False, "tmp_dir": "tmp"})
 
@@ -29,16 +29,36 @@ def test_stage1_score(mock_parse_whitelist_headers, mock_make_db_if_needed, mock
     assert result["must_stage2_for_pair"] is True
 
 @patch("swineotype.stages.ensure_tool")
-@patch("swineotype.stages.run")
-@patch("swineotype.stages.run_blast")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_blast_cascade_escalates_a_decisive_call_with_partial_hits(mock_make_db, mock_run_blast, mock_ensure_tool, tmp_path):
+    write_tier_whitelist(tmp_path / "wl.fasta")
+    mock_make_db.return_value = "db_prefix"
+    # megablast only finds a fragment of the diverged wzy_9, which fails min_cov, so 7 looks decisive
+    mock_run_blast.side_effect = [["wzy_7\tc1\t99\t100\t100\t0\t1000\t1\t100\t1\t100",
+                                   "wzy_9\tc2\t90\t40\t100\t0\t300\t1\t40\t1\t40"],
+                                  ["wzy_7\tc1\t99\t100\t100\t0\t1000\t1\t100\t1\t100",
+                                   "wzy_9\tc2\t88\t100\t100\t0\t900\t1\t100\t1\t100"]]
+    config = dict(TIER_CONFIG, tiered_stage1=0, blast_tasks="megablast,blastn", tmp_dir=tmp_path)
+
+    result = stage1_score("asm.fasta", str(tmp_path / "wl.fasta"), 1, tmp_path, config)
+
+    assert [c.kwargs["task"] for c in mock_run_blast.call_args_list] == ["megablast", "blastn"]
+    assert result["scores"] == {"7": 1000.0, "9": 900.0} and result["decisive"] is False
+    assert result["blast_task"] == "blastn"
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.FastaIndex")
+@patch("swineotype.stages.stream_blast")
 @patch("swineotype.stages.make_db_if_needed")
-def test_stage2_resolver_call_1_vs_14(mock_make_db, mock_run_blast, mock_run, mock_ensure_tool):
+def test_stage2_resolver_call_1_vs_14(mock_make_db, mock_run_blast, mock_index, mock_ensure_tool):
     mock_make_db.return_value = "db_prefix"
 
     qseqid = "cps14K|pair=1_vs_14|pos=481|G_serotype=1|CT_serotype=14"
     blast_out = f"{qseqid}\ts1\t100\t1000\t1000\t0\t2000\t1\t1000\t1\t1000"
-    mock_run_blast.return_value = blast_out
-    mock_run.return_value = ">s1:1-1000\nG"
+    mock_run_blast.return_value = blast_out.splitlines()
+    mock_index.return_value.__enter__.return_value.base.return_value = "G"
 
     config = {"min_res_pid": 90, "min_res_alen": 100, "keep_debug": False, "tmp_dir": "tmp"}
     result = stage2_resolver_call("assembly.fa", "resolver.fa", 4, Path("run_dir"), config, "1_vs_14")
@@ -50,15 +70,15 @@ def test_stage2_resolver_call_1_vs_14(mock_make_db, mock_run_blast, mock_run, mo
     assert final_sero == "14"
 
 @patch("swineotype.stages.ensure_tool")
-@patch("swineotype.stages.run")
-@patch("swineotype.stages.run_blast")
+@patch("swineotype.stages.FastaIndex")
+@patch("swineotype.stages.stream_blast")
 @patch("swineotype.stages.make_db_if_needed")
-def test_stage2_resolver_call_2_vs_1_2(mock_make_db, mock_run_blast, mock_run, mock_ensure_tool):
+def test_stage2_resolver_call_2_vs_1_2(mock_make_db, mock_run_blast, mock_index, mock_ensure_tool):
     mock_make_db.return_value = "db_prefix"
     qseqid = "cps2K|pair=2_vs_1_2|pos=481|G_serotype=1/2|CT_serotype=2"
     blast_out = f"{qseqid}\ts1\t100\t1000\t1000\t0\t2000\t1\t1000\t1\t1000"
-    mock_run_blast.return_value = blast_out
-    mock_run.return_value = ">s1:1-1000\nC"
+    mock_run_blast.return_value = blast_out.splitlines()
+    mock_index.return_value.__enter__.return_value.base.return_value = "C"
 
     config = {"min_res_pid": 90, "min_res_alen": 100, "keep_debug": False, "tmp_dir": "tmp"}
     result = stage2_resolver_call("assembly.fa", "resolver.fa", 4, Path("run_dir"), config, "2_vs_1_2")
@@ -89,3 +109,145 @@ def test_interpret_resolver_logic(ref_id, base, expected_serotype):
     event = {"ref_id": ref_id, "base": base}
     config = {}  # config is not used by the new interpret_resolver
     assert interpret_resolver(event, config) == expected_serotype
+
+
+def test_parse_hsps_ref_db_orientation_matches_asm_db():
+    # Same two alignments reported with alleles as query (asm_db) and with the
+    # assembly as query (ref_db); the minus-strand hit has descending subject coords.
+    asm_db = [
+        "cps2K|pair=2_vs_1_2|pos=483\tctg1\t99.5\t1000\t1200\t0\t1800\t101\t1100\t5001\t6000",
+        "cps2K|pair=2_vs_1_2|pos=483\tctg7\t98.0\t600\t1200\t0\t1000\t1\t600\t900\t301",
+    ]
+    ref_db = [
+        "ctg1\tcps2K|pair=2_vs_1_2|pos=483\t99.5\t1000\t1200\t0\t1800\t5001\t6000\t101\t1100",
+        "ctg7\tcps2K|pair=2_vs_1_2|pos=483\t98.0\t600\t1200\t0\t1000\t301\t900\t600\t1",
+    ]
+    assert parse_hsps(asm_db) == parse_hsps(ref_db, ref_as_db=True)
+
+    config = {"min_res_pid": 90, "min_res_alen": 100}
+    ev_asm = select_resolver_hsp(parse_hsps(asm_db[1:]), config)
+    ev_ref = select_resolver_hsp(parse_hsps(ref_db[1:], ref_as_db=True), config)
+    assert ev_asm == ev_ref
+    assert (ev_ref["contig"], ev_ref["contig_pos"], ev_ref["strand"]) == ("ctg7", 418, "-")
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_ref_db")
+@patch("swineotype.stages.parse_whitelist_headers")
+def test_stage1_score_ref_db_mode(mock_parse_whitelist_headers, mock_make_ref_db, mock_run_blast, mock_ensure_tool, tmp_path):
+    mock_parse_whitelist_headers.return_value = ({"q1": "1", "q2": "14"}, {"q1": "wzx", "q2": "wzy"})
+    mock_make_ref_db.return_value = "refdb_prefix"
+    mock_run_blast.return_value = (
+        "ctg1\tq1\t90\t100\t100\t0\t1000\t1\t100\t100\t1\n"
+        "ctg2\tq2\t95\t100\t100\t0\t2000\t1\t100\t1\t100\n"
+    ).splitlines()
+    whitelist = tmp_path / "whitelist.fasta"
+    whitelist.write_text(">q1\nACGT\n>q2\nACGT\n")
+    config = {"min_pid": 85.0, "min_cov": 0.8, "plurality": 0.6, "delta": 100, "ambig_set": set(),
+              "keep_debug": False, "tmp_dir": tmp_path, "search_mode": "ref_db"}
+
+    result = stage1_score("assembly.fasta", str(whitelist), 4, tmp_path, config)
+
+    query, db = mock_run_blast.call_args[0][:2]
+    assert (query, db) == ("assembly.fasta", "refdb_prefix")
+    assert result["top"] == "14"
+    assert result["scores"] == {"1": 1000.0, "14": 2000.0}
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_search_combined_routes_hsps_to_both_stages(mock_make_db, mock_run_blast, mock_ensure_tool, tmp_path):
+    whitelist = tmp_path / "whitelist.fasta"
+    whitelist.write_text(">wzy_1 [type_id=1]\nACGT\n>wzx_1 [type_id=1]\nACGT")
+    resolver = tmp_path / "resolver.fasta"
+    resolver.write_text(">cps1L|pair=1_vs_14|pos=2|G_serotype=14|CT_serotype=1\nACGT\n")
+    mock_make_db.return_value = "db_prefix"
+    mock_run_blast.return_value = (
+        "wzy_1\tctg1\t99\t4\t4\t0\t8\t1\t4\t1\t4\n"
+        "cps1L|pair=1_vs_14|pos=2|G_serotype=14|CT_serotype=1\tctg2\t99\t4\t4\t0\t8\t1\t4\t10\t13\n"
+    ).splitlines()
+    config = {"wzxwzy_fasta": whitelist, "resolver_refs_fasta": resolver, "tmp_dir": tmp_path,
+              "keep_debug": False}
+
+    routed = search_combined("assembly.fasta", 4, tmp_path, config)
+
+    assert mock_run_blast.call_count == 1
+    combined = Path(mock_run_blast.call_args[0][0]).read_text()
+    assert combined.count(">") == 3 and "ACGT\n>cps1L" in combined
+    assert [h.allele for h in routed["stage1"]] == ["wzy_1"]
+    assert [h.contig for h in routed["stage2"]] == ["ctg2"]
+
+
+TIER_CONFIG = {"min_pid": 85.0, "min_cov": 0.8, "plurality": 0.6, "delta": 100, "ambig_set": {"1", "14", "2", "1/2"},
+               "keep_debug": False, "tiered_stage1": 1, "stage1_tier1": "wzy"}
+
+
+def write_tier_whitelist(path):
+    path.write_text("".join(f">{cls}_{st} [type_id={st}]\nACGT\n" for st in ("7", "9", "14") for cls in ("wzx", "wzy")))
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_tiered_stage1_stops_after_decisive_wzy_tier(mock_make_db, mock_run_blast, mock_ensure_tool, tmp_path):
+    write_tier_whitelist(tmp_path / "wl.fasta")
+    mock_make_db.return_value = "db_prefix"
+    mock_run_blast.return_value = ["wzy_7\tc1\t99\t100\t100\t0\t1000\t1\t100\t1\t100"]
+
+    result = stage1_score("asm.fasta", str(tmp_path / "wl.fasta"), 1, tmp_path, dict(TIER_CONFIG, tmp_dir=tmp_path))
+
+    assert mock_run_blast.call_count == 1
+    assert (tmp_path / "tiers").is_dir() and ">wzx" not in Path(mock_run_blast.call_args[0][0]).read_text()
+    assert result["top"] == "7" and result["tier"] == "wzy"
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_tiered_stage1_escalates_for_ambiguous_serotype(mock_make_db, mock_run_blast, mock_ensure_tool, tmp_path):
+    write_tier_whitelist(tmp_path / "wl.fasta")
+    mock_make_db.return_value = "db_prefix"
+    mock_run_blast.side_effect = [["wzy_14\tc1\t99\t100\t100\t0\t1000\t1\t100\t1\t100"],
+                                  ["wzx_14\tc1\t99\t100\t100\t0\t900\t1\t100\t1\t100",
+                                   "wzx_9\tc1\t99\t100\t100\t0\t300\t1\t100\t1\t100"]]
+
+    result = stage1_score("asm.fasta", str(tmp_path / "wl.fasta"), 1, tmp_path, dict(TIER_CONFIG, tmp_dir=tmp_path))
+
+    assert mock_run_blast.call_count == 2
+    assert result["scores"] == {"14": 1900.0, "9": 300.0} and result["tier"] == "all"
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_blast_cascade_escalates_stage1_until_decisive(mock_make_db, mock_run_blast, mock_ensure_tool, tmp_path):
+    write_tier_whitelist(tmp_path / "wl.fasta")
+    mock_make_db.return_value = "db_prefix"
+    mock_run_blast.side_effect = [["wzy_7\tc1\t99\t100\t100\t0\t1000\t1\t60\t1\t60"],
+                                  ["wzy_7\tc1\t99\t100\t100\t0\t1000\t1\t100\t1\t100"]]
+    config = dict(TIER_CONFIG, tiered_stage1=0, blast_tasks="megablast,blastn", tmp_dir=tmp_path,
+                  pair_1_14={"1", "14"}, pair_2_1_2={"2", "1/2"})
+
+    result = stage1_score("asm.fasta", str(tmp_path / "wl.fasta"), 1, tmp_path, config)
+
+    assert [c.kwargs["task"] for c in mock_run_blast.call_args_list] == ["megablast", "blastn"]
+    assert result["top"] == "7" and result["blast_task"] == "blastn"
+    assert final_call(result, None, config)["blast_task"] == "blastn"
+
+
+@patch("swineotype.stages.ensure_tool")
+@patch("swineotype.stages.FastaIndex")
+@patch("swineotype.stages.stream_blast")
+@patch("swineotype.stages.make_db_if_needed")
+def test_blast_cascade_stops_once_stage2_site_is_covered(mock_make_db, mock_run_blast, mock_index, mock_ensure_tool):
+    qseqid = "cps14K|pair=1_vs_14|pos=481|G_serotype=1|CT_serotype=14"
+    mock_run_blast.return_value = [f"{qseqid}\ts1\t100\t1000\t1000\t0\t2000\t1\t1000\t1\t1000"]
+    mock_index.return_value.__enter__.return_value.base.return_value = "G"
+    config = {"min_res_pid": 90, "min_res_alen": 100, "keep_debug": False, "tmp_dir": "tmp",
+              "blast_tasks": "megablast,dc-megablast,blastn"}
+
+    result = stage2_resolver_call("assembly.fa", "resolver.fa", 4, Path("run_dir"), config, "1_vs_14")
+
+    assert mock_run_blast.call_count == 1 and result["blast_task"] == "megablast"
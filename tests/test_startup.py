@@ -0,0 +1,13 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "yaml")
+
+
+def python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True)
+
+
+def test_cli_import_does_not_load_heavy_dependencies():
+    out = python("-c", "import sys, swineotype.main; print(' '.join(sorted(sys.modules)))").stdout.split()
+    assert [m for m in HEAVY_MODULES if m in out] == []